@@ -116,9 +116,68 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # hilos de segundo plano (webhooks, comprobantes) escriben a la par de las requests:
+            # BEGIN IMMEDIATE espera el lock en vez de fallar con "database is locked"
+            "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
         }
     }
 
+# =========================
+# CACHE
+# =========================
+# Compartido entre workers de gunicorn (fragmentos de productos, versiones).
+# Con REDIS_URL se usa Redis; si no, cache en disco (sin servicios externos).
+REDIS_URL = os.environ.get("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        },
+        # Redis no recorta mientras tenga memoria; con maxmemory usar una política
+        # LRU (allkeys-lru): expulsa primero lo que nadie usa, no carritos activos.
+        "sessions": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "sess",
+        },
+    }
+else:
+    CACHE_DIR = os.environ.get("CACHE_DIR", str(BASE_DIR / ".cache"))
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.path.join(CACHE_DIR, "default"),
+            "OPTIONS": {"MAX_ENTRIES": 20000},
+        },
+        # aparte del default: limpiar fragmentos no borra carritos.
+        # Al pasar MAX_ENTRIES el FileBasedCache borra al azar 1/CULL_FREQUENCY de
+        # las sesiones, y a una sesión borrada le faltan los cambios del carrito
+        # que aún no llegaron a la DB (a lo sumo SESSION_DB_SYNC_SECONDS). Por eso
+        # el límite va holgado: una sesión ocupa una entrada durante
+        # SESSION_COOKIE_AGE (2 semanas), o sea ~7.000 visitantes nuevos por día
+        # antes del primer recorte, y cada recorte quita solo el 5 %.
+        "sessions": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.path.join(CACHE_DIR, "sessions"),
+            "OPTIONS": {
+                "MAX_ENTRIES": int(os.environ.get("SESSION_CACHE_MAX_ENTRIES", "100000")),
+                "CULL_FREQUENCY": 20,
+            },
+        },
+    }
+
+# =========================
+# SESIONES
+# =========================
+# ✅ carrito en sesión: lecturas desde la cache, la DB solo como respaldo
+# (los cambios del carrito se escriben en la DB cada SESSION_DB_SYNC_SECONDS;
+# es también lo máximo que se pierde si la cache recorta o expulsa la sesión)
+SESSION_ENGINE = "shop.sessions"
+SESSION_CACHE_ALIAS = "sessions"
+SESSION_DB_SYNC_SECONDS = int(os.environ.get("SESSION_DB_SYNC_SECONDS", "60"))
+
 # =========================
 # PASSWORD VALIDATION
 # =========================
@@ -211,3 +270,34 @@ CULQI_PUBLIC_KEY = os.environ.get("CULQI_PUBLIC_KEY", "")
 CULQI_SECRET_KEY = os.environ.get("CULQI_SECRET_KEY", "")
 CULQI_RSA_ID = os.environ.get("CULQI_RSA_ID", "")
 CULQI_RSA_PUBLIC_KEY = os.environ.get("CULQI_RSA_PUBLIC_KEY", "")
+
+# Cliente HTTP de Culqi (shop/culqi.py). CULQI_API_BASE apunta al servidor falso
+# en local: python manage.py fake_culqi --port 8765 -> http://127.0.0.1:8765/v2
+CULQI_API_BASE = os.environ.get("CULQI_API_BASE", "https://api.culqi.com/v2")
+CULQI_TIMEOUT = (
+    float(os.environ.get("CULQI_CONNECT_TIMEOUT", "3.05")),
+    float(os.environ.get("CULQI_READ_TIMEOUT", "10")),
+)
+CULQI_POOL_SIZE = int(os.environ.get("CULQI_POOL_SIZE", "10"))
+CULQI_RETRIES = int(os.environ.get("CULQI_RETRIES", "2"))
+CULQI_BREAKER_FAILURES = int(os.environ.get("CULQI_BREAKER_FAILURES", "5"))
+CULQI_BREAKER_RESET = float(os.environ.get("CULQI_BREAKER_RESET", "30"))
+# Reabrir el modal de pago reutiliza la orden Culqi si le quedan más de N segundos
+CULQI_ORDER_REUSE_MARGIN = int(os.environ.get("CULQI_ORDER_REUSE_MARGIN", "300"))
+
+# =========================
+# TAREAS EN SEGUNDO PLANO (shop/tasks.py)
+# =========================
+SHOP_BACKGROUND_WORKERS = int(os.environ.get("SHOP_BACKGROUND_WORKERS", "2"))
+# Webhooks de Culqi: eventos por lote al drenar la bandeja (shop/payments.py)
+SHOP_WEBHOOK_BATCH = int(os.environ.get("SHOP_WEBHOOK_BATCH", "200"))
+
+# =========================
+# RESERVAS DE STOCK (shop/inventory.py)
+# =========================
+# Minutos que se aparta el stock de un pedido sin pagar (= vencimiento de la orden Culqi)
+STOCK_HOLD_MINUTES = int(os.environ.get("STOCK_HOLD_MINUTES", "60"))
+# Horas extra mientras se revisa un comprobante subido
+STOCK_HOLD_REVIEW_HOURS = int(os.environ.get("STOCK_HOLD_REVIEW_HOURS", "48"))
+# Cada cuántos segundos (como máximo, por proceso) las páginas del catálogo liberan reservas vencidas
+STOCK_HOLD_SWEEP_SECONDS = int(os.environ.get("STOCK_HOLD_SWEEP_SECONDS", "60"))
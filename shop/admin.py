@@ -1,13 +1,96 @@
-from django.contrib import admin
-from .models import Product, Order, OrderItem, Address
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db.models import IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.html import format_html
+from .inventory import adjust_stock, consume_holds, release_holds
+from .orders import refresh_order_summaries
+from .events import notify_order_changed
+from .transitions import bulk_transition, log_transitions
+from .exports import csv_response, xlsx_response
+from .forms import OrderAdminForm, ProductAdminForm, ProductImportForm
+from .imports import ProductImportError, import_products
+from .models import Product, Order, OrderItem, Address, StockHold, WebhookEvent, OrderStatusHistory
 
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ("name", "price", "stock", "is_active", "created_at")
+    list_display = ("name", "sku", "price", "stock", "reserved", "is_active", "created_at")
     list_filter = ("is_active",)
-    search_fields = ("name", "description")
+    search_fields = ("name", "sku", "description")
     list_editable = ("price", "stock", "is_active")
+    form = ProductAdminForm
+
+    def get_queryset(self, request):
+        active = (
+            StockHold.objects.filter(product=OuterRef("pk"), state="active")
+            .values("product")
+            .annotate(total=Sum("qty"))
+            .values("total")
+        )
+        return super().get_queryset(request).annotate(
+            reserved_qty=Coalesce(Subquery(active, output_field=IntegerField()), 0)
+        )
+
+    # ✅ "stock" ya es lo disponible; esto es lo apartado por pedidos sin pagar
+    @admin.display(description="Reservado", ordering="reserved_qty")
+    def reserved(self, obj):
+        return obj.reserved_qty
+
+    def get_changelist_form(self, request, **kwargs):
+        # list_editable también guarda el stock como diferencia
+        return super().get_changelist_form(request, form=ProductAdminForm, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # ✅ el stock nunca se pisa con un valor absoluto: entre que se abrió la página y se
+        # guardó pudo haber compras (y las reservas devuelven lo suyo al vencer)
+        fields = [f.name for f in obj._meta.concrete_fields if not f.primary_key and f.name != "stock"]
+        obj.save(update_fields=fields)
+        delta = form.stock_delta()
+        if delta:
+            adjust_stock(obj.pk, delta)
+        obj.refresh_from_db(fields=["stock"])
+
+    # ✅ importación masiva por SKU (shop/imports.py)
+    def get_urls(self):
+        urls = [
+            path(
+                "importar/",
+                self.admin_site.admin_view(self.import_view),
+                name="shop_product_import",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+
+        report = None
+        form = ProductImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            upload = form.cleaned_data["file"]
+            try:
+                report = import_products(upload.file, upload.name, dry_run=form.cleaned_data["dry_run"])
+            except ProductImportError as exc:
+                form.add_error("file", str(exc))
+            else:
+                if not report.dry_run:
+                    self.message_user(request, f"✅ {report.summary()}", messages.SUCCESS)
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Importar productos",
+            "form": form,
+            "report": report,
+        }
+        return TemplateResponse(request, "admin/shop/product/import.html", context)
 
 
 class OrderItemInline(admin.TabularInline):
@@ -16,43 +99,131 @@ class OrderItemInline(admin.TabularInline):
     readonly_fields = ("product", "qty", "unit_price", "subtotal")
 
 
+class OrderStatusHistoryInline(admin.TabularInline):
+    model = OrderStatusHistory
+    extra = 0
+    can_delete = False
+    fields = ("created_at", "field", "from_state", "to_state", "source", "changed_by", "note")
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ("code", "full_name", "whatsapp", "total", "status", "payment_status", "created_at", "has_receipt")
     list_filter = ("status", "payment_status", "created_at")
     search_fields = ("code", "full_name", "whatsapp")
-    readonly_fields = ("code", "total", "created_at", "receipt_uploaded_at")
-    inlines = [OrderItemInline]
+    readonly_fields = ("code", "total", "created_at", "receipt_uploaded_at", "receipt_preview")
+    inlines = [OrderItemInline, OrderStatusHistoryInline]
+    form = OrderAdminForm  # valida los cambios de estado (shop/transitions.py)
 
-    actions = ["mark_paid", "mark_pending_review", "mark_confirmed", "mark_on_the_way", "mark_delivered", "mark_cancelled"]
+    actions = [
+        "mark_paid", "mark_pending_review", "mark_confirmed", "mark_on_the_way", "mark_delivered", "mark_cancelled",
+        "export_xlsx", "export_orders_csv", "export_items_csv",
+    ]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # ✅ si se quitó algún item, el resumen de "Mis pedidos" se recalcula
+        refresh_order_summaries([form.instance.pk])
+        notify_order_changed()
 
     def has_receipt(self, obj):
         return "✅" if obj.receipt_image else "—"
     has_receipt.short_description = "Comprobante"
 
+    # ✅ miniatura liviana (la imagen completa solo al hacer clic)
+    def receipt_preview(self, obj):
+        if not obj.receipt_image:
+            return "—"
+        if not obj.receipt_thumb:
+            note = "no se pudo procesar: se guardó el original" if obj.receipt_processed_at else "procesando…"
+            return format_html('<a href="{}" target="_blank">Ver comprobante</a> ({})', obj.receipt_image.url, note)
+        return format_html(
+            '<a href="{}" target="_blank"><img src="{}" style="max-width:240px;border-radius:8px;" loading="lazy"></a>',
+            obj.receipt_image.url,
+            obj.receipt_thumb.url,
+        )
+    receipt_preview.short_description = "Vista previa"
+
+    def save_model(self, request, obj, form, change):
+        # ✅ cambios hechos a mano en el formulario también quedan en el historial
+        previous = {}
+        if change:
+            previous = {f: form.initial.get(f) for f in ("status", "payment_status") if f in form.changed_data}
+            if "payment_status" in previous and obj.payment_status == "paid" and not obj.paid_at:
+                obj.paid_at = timezone.now()
+        super().save_model(request, obj, form, change)
+        for field, before in previous.items():
+            log_transitions([(obj.pk, before or "")], field, getattr(obj, field), user=request.user, source="admin")
+        # mismas reglas de stock que las acciones
+        if obj.status == "cancelled" and "status" in previous:
+            release_holds(order_ids=[obj.pk], consumed=True)
+        elif obj.payment_status == "paid" or obj.status in ("confirmed", "on_the_way", "delivered"):
+            consume_holds([obj.pk])
+
+    def _transition(self, request, queryset, field, target):
+        changed = bulk_transition(queryset, field, target, user=request.user, source="admin")
+        skipped = queryset.count() - len(changed)
+        if changed:
+            self.message_user(request, f"✅ {len(changed)} pedidos actualizados.", messages.SUCCESS)
+        if skipped:
+            self.message_user(
+                request, f"{skipped} pedidos omitidos: ese cambio de estado no está permitido.", messages.WARNING
+            )
+        return changed
+
     @admin.action(description="Marcar como PAGADO")
     def mark_paid(self, request, queryset):
-        queryset.update(payment_status="paid")
+        changed = self._transition(request, queryset, "payment_status", "paid")
+        consume_holds(changed)
+        notify_order_changed()
 
     @admin.action(description="Marcar como COMPROBANTE EN REVISIÓN")
     def mark_pending_review(self, request, queryset):
-        queryset.update(payment_status="pending_review")
+        self._transition(request, queryset, "payment_status", "pending_review")
+        notify_order_changed()
 
     @admin.action(description="Estado: Confirmado")
     def mark_confirmed(self, request, queryset):
-        queryset.update(status="confirmed")
+        changed = self._transition(request, queryset, "status", "confirmed")
+        consume_holds(changed)
+        notify_order_changed()
 
     @admin.action(description="Estado: En camino")
     def mark_on_the_way(self, request, queryset):
-        queryset.update(status="on_the_way")
+        changed = self._transition(request, queryset, "status", "on_the_way")
+        consume_holds(changed)
+        notify_order_changed()
 
     @admin.action(description="Estado: Entregado")
     def mark_delivered(self, request, queryset):
-        queryset.update(status="delivered")
+        changed = self._transition(request, queryset, "status", "delivered")
+        consume_holds(changed)
+        notify_order_changed()
 
     @admin.action(description="Estado: Cancelado")
     def mark_cancelled(self, request, queryset):
-        queryset.update(status="cancelled")
+        changed = self._transition(request, queryset, "status", "cancelled")
+        # ✅ también vuelve lo de pedidos ya pagados/confirmados
+        release_holds(order_ids=changed, consumed=True)
+        notify_order_changed()
+
+
+    # ✅ exportar lo seleccionado (o todo lo filtrado con "seleccionar todos")
+    @admin.action(description="Exportar a Excel (pedidos + items)")
+    def export_xlsx(self, request, queryset):
+        return xlsx_response(queryset)
+
+    @admin.action(description="Exportar pedidos (CSV)")
+    def export_orders_csv(self, request, queryset):
+        return csv_response(queryset, "orders")
+
+    @admin.action(description="Exportar items (CSV)")
+    def export_items_csv(self, request, queryset):
+        return csv_response(queryset, "items")
 
 
 @admin.register(Address)
@@ -60,3 +231,23 @@ class AddressAdmin(admin.ModelAdmin):
     list_display = ("user", "label", "full_name", "whatsapp", "is_default", "created_at")
     list_filter = ("is_default", "created_at")
     search_fields = ("label", "full_name", "whatsapp", "address", "reference")
+
+
+@admin.register(StockHold)
+class StockHoldAdmin(admin.ModelAdmin):
+    list_display = ("order", "product", "qty", "state", "expires_at", "created_at")
+    list_filter = ("state",)
+    search_fields = ("order__code", "product__name")
+    list_select_related = ("order", "product")
+    readonly_fields = ("order", "product", "qty", "state", "expires_at", "created_at")
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "provider", "event_type", "event_id", "result", "attempts", "received_at", "processed_at")
+    list_filter = ("provider", "result")
+    search_fields = ("event_id", "dedup_key")
+    readonly_fields = [f.name for f in WebhookEvent._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _ensure_search_index(sender, using="default", **kwargs):
+    from django.db import connections
+    from . import search
+    search.ensure_installed(connections[using])
 
 
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(_ensure_search_index, sender=self)
@@ -0,0 +1,178 @@
+"""
+Códigos de pedido cortos, únicos y sin reintentos.
+
+Cada código sale de un contador (no de azar), así que no hay choques:
+
+1. El contador se reserva por bloques (``block_size`` números por viaje a la DB):
+   - Postgres: secuencia ``shop_order_code_seq`` con INCREMENT BY = bloque.
+     ``nextval`` no es transaccional, así que un rollback nunca recicla números.
+   - Otros motores: fila en ``CodeCounter`` actualizada con UPDATE atómico.
+     El bloque se reserva en autocommit, nunca dentro de la transacción de
+     quien pide el código: si esa transacción se deshace, el contador ya no
+     retrocede y nadie más recibe esos números. Si se pide un código en medio
+     de una transacción, se toma un solo número dentro de ella (se confirma o
+     se deshace junto con el pedido que lo usa).
+2. El número se mezcla con una permutación biyectiva de 30 bits (no se ven
+   correlativos, pero dos números distintos nunca dan el mismo código).
+3. Se codifica en base32 Crockford (sin I, L, O, U) + 1 carácter de control
+   Luhn mod 32 que detecta errores de tipeo: ``DANI-7K2M9QX``.
+"""
+import os
+import threading
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_INDEX = {ch: i for i, ch in enumerate(ALPHABET)}
+_BASE = len(ALPHABET)
+
+CODE_PREFIX = "DANI-"
+CODE_CHARS = 6
+CODE_BITS = 5 * CODE_CHARS  # 30 bits -> ~1.07 mil millones de códigos
+_MASK = (1 << CODE_BITS) - 1
+
+ORDER_SEQUENCE = "shop_order_code_seq"
+ORDER_BLOCK_SIZE = 100  # debe coincidir con INCREMENT BY de la secuencia (migración 0015)
+
+
+# -------------------
+# Codificación
+# -------------------
+def permute(n: int) -> int:
+    """Biyección en [0, 2**30): xor, multiplicar por impar y xorshift son invertibles."""
+    n ^= 0x15A3C9E7 & _MASK  # el pedido 0 no sale como DANI-0000000
+    n = (n * 0x2545F491) & _MASK
+    n ^= n >> 15
+    n = (n * 0x1B873593) & _MASK
+    n ^= n >> 13
+    return n
+
+
+def check_char(body: str) -> str:
+    """Luhn mod 32: detecta cualquier carácter cambiado y casi todas las transposiciones."""
+    factor, total = 2, 0
+    for ch in reversed(body):
+        addend = factor * _INDEX[ch]
+        factor = 3 - factor
+        total += addend // _BASE + addend % _BASE
+    return ALPHABET[(-total) % _BASE]
+
+
+def encode(n: int) -> str:
+    if not 0 <= n <= _MASK:
+        raise OverflowError("Se agotaron los códigos de pedido disponibles.")
+    x = permute(n)
+    chars = []
+    for _ in range(CODE_CHARS):
+        chars.append(ALPHABET[x & 31])
+        x >>= 5
+    body = "".join(reversed(chars))
+    return CODE_PREFIX + body + check_char(body)
+
+
+def is_valid_code(code: str) -> bool:
+    code = (code or "").upper().strip()
+    if not code.startswith(CODE_PREFIX):
+        return False
+    body = code[len(CODE_PREFIX):]
+    if len(body) != CODE_CHARS + 1 or any(ch not in _INDEX for ch in body):
+        return False
+    return check_char(body[:-1]) == body[-1]
+
+
+# -------------------
+# Esquema Postgres
+# -------------------
+def install_sequence(conn=None):
+    conn = conn or connection
+    if conn.vendor != "postgresql":
+        return
+    with conn.cursor() as cur:
+        cur.execute(
+            f"CREATE SEQUENCE IF NOT EXISTS {ORDER_SEQUENCE} "
+            f"INCREMENT BY {ORDER_BLOCK_SIZE} MINVALUE 0 START WITH 0"
+        )
+
+
+def uninstall_sequence(conn=None):
+    conn = conn or connection
+    if conn.vendor != "postgresql":
+        return
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SEQUENCE IF EXISTS {ORDER_SEQUENCE}")
+
+
+# -------------------
+# Reserva de bloques
+# -------------------
+class CodeAllocator:
+    """
+    Reparte números de un bloque reservado en memoria (thread-safe).
+    El bloque se asocia al pid: tras un fork (gunicorn --preload) cada worker
+    reserva el suyo en vez de repetir el del proceso padre.
+    """
+
+    def __init__(self, name: str, block_size: int, sequence: str = ""):
+        self.name = name
+        self.block_size = block_size
+        self.sequence = sequence
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = 0
+        self._end = 0
+        self.reservations = 0
+
+    def next_value(self) -> int:
+        if self._in_foreign_transaction():
+            return self._reserve_from_counter(1)
+        with self._lock:
+            if self._pid != os.getpid() or self._next >= self._end:
+                start = self._reserve_block()
+                self._pid = os.getpid()
+                self._next, self._end = start, start + self.block_size
+                self.reservations += 1
+            value = self._next
+            self._next += 1
+            return value
+
+    def next_code(self) -> str:
+        return encode(self.next_value())
+
+    def _uses_sequence(self) -> bool:
+        return bool(self.sequence) and connection.vendor == "postgresql"
+
+    def _in_foreign_transaction(self) -> bool:
+        # nextval no se deshace con la transacción: con secuencia siempre se usa el bloque
+        return connection.in_atomic_block and not self._uses_sequence()
+
+    def _reserve_block(self) -> int:
+        if self._uses_sequence():
+            with connection.cursor() as cur:
+                cur.execute("SELECT nextval(%s)", [self.sequence])
+                return cur.fetchone()[0]
+        return self._reserve_from_counter(self.block_size)
+
+    def _reserve_from_counter(self, size: int) -> int:
+        from .models import CodeCounter
+
+        for _ in range(2):
+            with transaction.atomic():
+                updated = CodeCounter.objects.filter(name=self.name).update(value=F("value") + size)
+                if updated:
+                    end = CodeCounter.objects.values_list("value", flat=True).get(name=self.name)
+                    return end - size
+                try:
+                    with transaction.atomic():
+                        CodeCounter.objects.create(name=self.name, value=size)
+                    return 0
+                except IntegrityError:
+                    continue  # otro proceso creó la fila: reintentar el UPDATE
+        raise RuntimeError(f"No se pudo reservar un bloque para el contador {self.name!r}.")
+
+
+order_codes = CodeAllocator("order", ORDER_BLOCK_SIZE, sequence=ORDER_SEQUENCE)
+
+
+def new_order_code() -> str:
+    return order_codes.next_code()
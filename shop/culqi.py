@@ -0,0 +1,257 @@
+"""
+Cliente HTTP de Culqi (un solo lugar para hablar con la API).
+
+- Conexiones keep-alive: un ``requests.Session`` por proceso con pool
+  (``CULQI_POOL_SIZE``), sin abrir un TLS nuevo por pedido.
+- Timeouts cortos (``CULQI_TIMEOUT``: conexión, lectura) para no dejar un
+  worker de gunicorn colgado 20 s.
+- Reintentos acotados con backoff exponencial (``CULQI_RETRIES``): GET se
+  reintenta ante errores de red y 429/5xx; POST solo si la conexión ni siquiera
+  se abrió (crear una orden dos veces no es seguro).
+- Circuit breaker: tras ``CULQI_BREAKER_FAILURES`` fallos seguidos se deja de
+  llamar durante ``CULQI_BREAKER_RESET`` segundos y se responde al instante.
+- Latencias por operación (p50/p95/p99) en ``client.stats.snapshot()`` y en el
+  log ``shop.culqi``.
+
+``CULQI_API_BASE`` permite apuntar al servidor falso (``manage.py fake_culqi``).
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_BASE = "https://api.culqi.com/v2"
+
+
+class CulqiError(Exception):
+    """Culqi respondió con error (4xx/5xx)."""
+
+    def __init__(self, message, status=None, data=None):
+        super().__init__(message)
+        self.status = status
+        self.data = data or {}
+
+
+class CulqiUnavailable(CulqiError):
+    """No se pudo hablar con Culqi (red, timeout o circuito abierto)."""
+
+
+# -------------------
+# Circuit breaker
+# -------------------
+class CircuitBreaker:
+    def __init__(self, failures: int = 5, reset_after: float = 30.0):
+        self.max_failures = failures
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_after:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_after:
+                return False
+            # half-open: pasa UNA llamada de prueba; las demás siguen rechazadas
+            # hasta que esa termine bien (success) o pase otro reset_after
+            self._opened_at = time.monotonic()
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.max_failures or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+
+
+# -------------------
+# Métricas
+# -------------------
+class LatencyStats:
+    """Últimas ``window`` latencias por operación + contadores."""
+
+    def __init__(self, window: int = 1000):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def record(self, op: str, seconds: float, outcome: str):
+        with self._lock:
+            self._samples[op].append(seconds)
+            self._counts[op][outcome] += 1
+
+    def count(self, op: str, outcome: str):
+        with self._lock:
+            self._counts[op][outcome] += 1
+
+    @staticmethod
+    def _pct(sorted_values, p):
+        if not sorted_values:
+            return 0.0
+        i = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+        return sorted_values[i]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            out = {}
+            for op in set(self._samples) | set(self._counts):
+                values = sorted(self._samples.get(op, ()))
+                out[op] = {
+                    "count": len(values),
+                    "p50_ms": round(self._pct(values, 50) * 1000, 1),
+                    "p95_ms": round(self._pct(values, 95) * 1000, 1),
+                    "p99_ms": round(self._pct(values, 99) * 1000, 1),
+                    **dict(self._counts.get(op, {})),
+                }
+            return out
+
+
+# -------------------
+# Cliente
+# -------------------
+class CulqiClient:
+    def __init__(
+        self,
+        secret_key: str,
+        base_url: str = DEFAULT_API_BASE,
+        timeout=(3.05, 10),
+        pool_size: int = 10,
+        retries: int = 2,
+        backoff: float = 0.3,
+        breaker: CircuitBreaker = None,
+    ):
+        self.secret_key = secret_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = LatencyStats()
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),  # lecturas/estado; POST solo reintenta conexión
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=False)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {secret_key}",
+            "Content-Type": "application/json",
+        })
+
+    def _request(self, op: str, method: str, path: str, **kwargs) -> dict:
+        if not self.breaker.allow():
+            self.stats.count(op, "short_circuit")
+            raise CulqiUnavailable("Culqi no disponible (circuito abierto).")
+
+        t0 = time.perf_counter()
+        try:
+            r = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        except requests.RequestException as exc:
+            elapsed = time.perf_counter() - t0
+            self.breaker.failure()
+            self.stats.record(op, elapsed, "network_error")
+            logger.warning("culqi %s %s falló en %.0f ms: %s", op, path, elapsed * 1000, exc)
+            raise CulqiUnavailable(f"No se pudo conectar con Culqi: {exc}") from exc
+
+        elapsed = time.perf_counter() - t0
+        try:
+            data = r.json() if r.content else {}
+        except ValueError:
+            data = {"raw": r.text[:500]}
+
+        if r.status_code >= 500:
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+
+        outcome = "ok" if r.status_code < 400 else f"http_{r.status_code}"
+        self.stats.record(op, elapsed, outcome)
+        logger.info("culqi %s %s -> %s en %.0f ms", op, path, r.status_code, elapsed * 1000)
+
+        if r.status_code >= 500:
+            raise CulqiUnavailable(f"Culqi respondió {r.status_code}", status=r.status_code, data=data)
+        if r.status_code >= 400:
+            raise CulqiError(f"Culqi respondió {r.status_code}", status=r.status_code, data=data)
+        return data
+
+    # --- API ---
+    def create_order(self, payload: dict) -> dict:
+        return self._request("create_order", "POST", "/orders", json=payload)
+
+    def get_order(self, culqi_order_id: str) -> dict:
+        return self._request("get_order", "GET", f"/orders/{culqi_order_id}")
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def build_client(**overrides) -> CulqiClient:
+    """Cliente nuevo con la configuración de settings (``overrides`` para comandos/benchmarks)."""
+    options = {
+        "secret_key": settings.CULQI_SECRET_KEY,
+        "base_url": getattr(settings, "CULQI_API_BASE", DEFAULT_API_BASE),
+        "timeout": getattr(settings, "CULQI_TIMEOUT", (3.05, 10)),
+        "pool_size": getattr(settings, "CULQI_POOL_SIZE", 10),
+        "retries": getattr(settings, "CULQI_RETRIES", 2),
+        "breaker": CircuitBreaker(
+            failures=getattr(settings, "CULQI_BREAKER_FAILURES", 5),
+            reset_after=getattr(settings, "CULQI_BREAKER_RESET", 30),
+        ),
+    }
+    options.update(overrides)
+    return CulqiClient(**options)
+
+
+def get_client() -> CulqiClient:
+    """Cliente compartido del proceso (se recrea tras un fork: los sockets no se comparten)."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = build_client()
+            _client_pid = os.getpid()
+        return _client
+
+
+def reset_client():
+    """Descarta el cliente compartido (tests / cambio de settings)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
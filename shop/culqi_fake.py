@@ -0,0 +1,180 @@
+"""
+Servidor Culqi falso (solo para desarrollo, pruebas de carga y benchmarks).
+
+Imita lo mínimo de la API de órdenes que usa la tienda:
+
+- ``POST /v2/orders``        -> 201 con ``{"object": "order", "id": "ord_test_...", "state": "pending", ...}``
+- ``GET  /v2/orders/<id>``   -> 200 con la orden, o 404
+- ``POST /v2/orders/<id>/pay`` (solo del falso) -> marca la orden como pagada
+
+Exige ``Authorization: Bearer <llave>`` (401 si falta). Se puede simular
+latencia (``latency``, segundos) y una fracción de respuestas 503
+(``fail_rate``) para ver reintentos y el circuit breaker en acción.
+
+Uso::
+
+    python manage.py fake_culqi --port 8765 --latency 0.05
+    CULQI_API_BASE=http://127.0.0.1:8765/v2 python manage.py runserver
+
+o dentro de un proceso: ``server = start_fake_culqi(); ...; server.shutdown()``.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_ORDER_PATH = re.compile(r"^/v2/orders/(?P<id>[\w-]+)(?P<pay>/pay)?/?$")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, igual que la API real
+    server_version = "FakeCulqi/1.0"
+    disable_nagle_algorithm = True  # cabeceras y body salen en writes separados
+
+    def log_message(self, fmt, *args):  # silencioso: se usa en benchmarks
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    # --- helpers ---
+    def _send(self, status: int, data: dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return None
+
+    def _gate(self) -> bool:
+        """Latencia, fallos simulados y auth. False si ya se respondió."""
+        srv = self.server
+        srv.count_request(self.client_address)
+        if srv.latency:
+            time.sleep(srv.latency)
+        if srv.fail_rate and random.random() < srv.fail_rate:
+            self._send(503, {"object": "error", "type": "api_error", "merchant_message": "Falla simulada."})
+            return False
+        auth = self.headers.get("Authorization", "")
+        if not auth.startswith("Bearer ") or not auth[7:].strip():
+            self._send(401, {"object": "error", "type": "authentication_error",
+                             "merchant_message": "Llave secreta inválida."})
+            return False
+        return True
+
+    # --- rutas ---
+    def do_POST(self):
+        data = self._read_json()  # siempre se consume el body (keep-alive)
+        if not self._gate():
+            return
+        if data is None:
+            return self._send(400, {"object": "error", "type": "invalid_request_error",
+                                    "merchant_message": "JSON inválido."})
+
+        if self.path.rstrip("/") == "/v2/orders":
+            missing = [k for k in ("amount", "currency_code", "description", "order_number") if not data.get(k)]
+            if missing:
+                return self._send(400, {"object": "error", "type": "invalid_request_error",
+                                        "merchant_message": f"Faltan campos: {', '.join(missing)}"})
+            return self._send(201, self.server.create_order(data))
+
+        m = _ORDER_PATH.match(self.path)
+        if m and m.group("pay"):
+            order = self.server.mark_paid(m.group("id"))
+            if order is None:
+                return self._send(404, {"object": "error", "merchant_message": "Orden no encontrada."})
+            return self._send(200, order)
+
+        self._send(404, {"object": "error", "merchant_message": "Ruta no encontrada."})
+
+    def do_GET(self):
+        if not self._gate():
+            return
+        m = _ORDER_PATH.match(self.path)
+        order = self.server.get_order(m.group("id")) if m and not m.group("pay") else None
+        if order is None:
+            return self._send(404, {"object": "error", "merchant_message": "Orden no encontrada."})
+        self._send(200, order)
+
+
+class FakeCulqiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, fail_rate: float = 0.0, verbose: bool = False):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.verbose = verbose
+        self.orders = {}
+        self.requests = 0
+        self.connections = set()  # (ip, puerto) de clientes: mide el reuso de conexiones
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v2"
+
+    def count_request(self, client_address):
+        with self._lock:
+            self.requests += 1
+            self.connections.add(client_address)
+
+    def create_order(self, data: dict) -> dict:
+        now = int(time.time())
+        order = {
+            "object": "order",
+            "id": f"ord_test_{uuid.uuid4().hex[:16]}",
+            "amount": data["amount"],
+            "currency_code": data["currency_code"],
+            "description": data["description"],
+            "order_number": data["order_number"],
+            "state": "pending",
+            "creation_date": now,
+            "expiration_date": data.get("expiration_date") or now + 86400,
+            "paid_at": None,
+            "metadata": data.get("metadata") or {},
+        }
+        with self._lock:
+            self.orders[order["id"]] = order
+        return order
+
+    def seed_order(self, order_id: str, amount: int = 0, state: str = "pending", **fields) -> dict:
+        """Registra una orden ya existente (p.ej. pedidos de la DB local para conciliar)."""
+        order = {
+            "object": "order", "id": order_id, "amount": amount, "currency_code": "PEN",
+            "state": state, "creation_date": int(time.time()),
+            "paid_at": int(time.time()) if state == "paid" else None, **fields,
+        }
+        with self._lock:
+            self.orders[order_id] = order
+        return order
+
+    def get_order(self, order_id: str):
+        with self._lock:
+            order = self.orders.get(order_id)
+            return dict(order) if order else None
+
+    def mark_paid(self, order_id: str):
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                return None
+            order.update(state="paid", paid_at=int(time.time()))
+            return dict(order)
+
+
+def start_fake_culqi(host: str = "127.0.0.1", port: int = 0, **kwargs) -> FakeCulqiServer:
+    """Levanta el servidor en un hilo daemon (``port=0``: puerto libre)."""
+    server = FakeCulqiServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="fake-culqi", daemon=True).start()
+    return server
@@ -0,0 +1,138 @@
+"""
+Estado del pedido en vivo (Server-Sent Events).
+
+Un solo "poller" por proceso vigila todos los pedidos que tienen clientes
+conectados: cada ``SHOP_EVENTS_POLL_SECONDS`` hace UNA consulta
+(``code__in``) y reparte los cambios a las colas de los suscriptores. Así mil
+clientes esperando su pago cuestan mil conexiones ociosas y una consulta cada
+pocos segundos, no mil recargas de página.
+
+Los cambios hechos en este mismo proceso (webhook de Culqi, acciones del admin,
+subida de comprobante) llaman a ``notify_order_changed()``, que despierta al
+poller al confirmar la transacción: el aviso llega al instante. Los cambios de
+otros procesos llegan en el siguiente ciclo.
+
+Requiere servidor ASGI (p.ej. ``gunicorn -k uvicorn.workers.UvicornWorker
+catalogo.asgi``); bajo WSGI la vista responde un solo evento y el navegador
+vuelve a preguntar cada ``retry`` ms (ver ``order_events`` en views.py).
+"""
+import asyncio
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+STATE_FIELDS = ("code", "status", "payment_status", "paid_at")
+_CHUNK = 500  # códigos por consulta (límite de variables de SQLite)
+
+
+def poll_seconds() -> float:
+    return getattr(settings, "SHOP_EVENTS_POLL_SECONDS", 2)
+
+
+def order_state(order) -> dict:
+    """Lo que recibe el navegador (también sirve con un Order ya cargado)."""
+    return {
+        "code": order.code,
+        "status": order.status,
+        "status_display": order.get_status_display(),
+        "payment_status": order.payment_status,
+        "payment_display": order.get_payment_status_display(),
+        "paid_at": order.paid_at.isoformat() if order.paid_at else None,
+    }
+
+
+def _fetch_states(codes) -> dict:
+    try:
+        states = {}
+        for i in range(0, len(codes), _CHUNK):
+            for order in Order.objects.filter(code__in=codes[i:i + _CHUNK]).only(*STATE_FIELDS):
+                states[order.code] = order_state(order)
+        return states
+    finally:
+        close_old_connections()
+
+
+class OrderEventBroker:
+    """Suscripciones por código de pedido dentro del event loop del proceso."""
+
+    def __init__(self):
+        self._subs = {}   # code -> set[asyncio.Queue]
+        self._last = {}   # code -> último estado enviado
+        self._loop = None
+        self._wake = None
+        self._task = None
+        self._lock = threading.Lock()
+
+    async def subscribe(self, code: str, initial: dict) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # loop nuevo (primer uso, o tests que crean un loop por request)
+            with self._lock:
+                self._loop, self._wake, self._task = loop, asyncio.Event(), None
+            self._subs.clear()
+            self._last.clear()
+
+        queue = asyncio.Queue(maxsize=8)
+        self._subs.setdefault(code, set()).add(queue)
+        self._last.setdefault(code, initial)
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, code: str, queue: asyncio.Queue):
+        queues = self._subs.get(code)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            self._subs.pop(code, None)
+            self._last.pop(code, None)
+
+    def wake(self):
+        """Se puede llamar desde cualquier hilo (vistas sync)."""
+        with self._lock:
+            loop, event = self._loop, self._wake
+        if loop is None or event is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(event.set)
+
+    async def _run(self):
+        while self._subs:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=poll_seconds())
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            codes = list(self._subs)
+            if not codes:
+                break
+            try:
+                states = await sync_to_async(_fetch_states, thread_sensitive=False)(codes)
+            except Exception:
+                logger.exception("No se pudo consultar el estado de %d pedidos", len(codes))
+                continue
+
+            for code, state in states.items():
+                if state == self._last.get(code):
+                    continue
+                self._last[code] = state
+                for queue in list(self._subs.get(code, ())):
+                    if queue.full():  # cliente lento: solo importa el último estado
+                        queue.get_nowait()
+                    queue.put_nowait(state)
+
+
+broker = OrderEventBroker()
+
+
+def notify_order_changed():
+    """Despierta al poller cuando se confirme la transacción actual."""
+    transaction.on_commit(broker.wake)
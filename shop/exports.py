@@ -0,0 +1,180 @@
+"""
+Exportación de pedidos e items a CSV / Excel sin cargar todo en memoria.
+
+- Las filas salen de ``.iterator(chunk_size=EXPORT_CHUNK)`` con
+  ``select_related``: se leen de a miles, nunca la tabla completa.
+- CSV: generador + ``csv.writer`` sobre un buffer "eco" (cada fila se escribe
+  directo a la respuesta con ``StreamingHttpResponse``).
+- XLSX: openpyxl en modo ``write_only`` (las filas van a un temporal, no se
+  arma la hoja en memoria) y el archivo se envía por partes con
+  ``FileResponse``. Un .xlsx es un zip y recién se puede cerrar al final, así
+  que no se puede mandar mientras se genera; la memoria igual queda constante.
+"""
+import csv
+import re
+import tempfile
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import OrderItem
+
+EXPORT_CHUNK = 2000
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+# Excel / LibreOffice toman como fórmula lo que empieza con estos caracteres
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+_PLAIN_NUMBER = re.compile(r"[+-]?\d+(\.\d+)?")  # +51944739301 no es peligroso
+
+
+def _is_formula_like(value) -> bool:
+    """Nombre, dirección, notas... los escribe el cliente: nunca deben llegar como fórmula."""
+    return (
+        isinstance(value, str)
+        and value.startswith(FORMULA_PREFIXES)
+        and not _PLAIN_NUMBER.fullmatch(value)
+    )
+
+
+def _local(dt):
+    # Excel no acepta fechas con zona horaria: se exporta en hora local (Lima)
+    return timezone.localtime(dt).replace(tzinfo=None) if dt else None
+
+
+ORDER_COLUMNS = [
+    ("Código", lambda o: o.code),
+    ("Fecha", lambda o: _local(o.created_at)),
+    ("Cliente", lambda o: o.full_name),
+    ("WhatsApp", lambda o: o.whatsapp_e164 or o.whatsapp),
+    ("Usuario", lambda o: o.user.username if o.user_id else ""),
+    ("Dirección", lambda o: o.address or ""),
+    ("Referencia", lambda o: o.reference or ""),
+    ("Estado", lambda o: o.get_status_display()),
+    ("Pago", lambda o: o.get_payment_status_display()),
+    ("Pagado el", lambda o: _local(o.paid_at)),
+    ("Unidades", lambda o: o.item_count),
+    ("Total (S/)", lambda o: o.total),
+    ("Notas", lambda o: o.notes or ""),
+]
+
+ITEM_COLUMNS = [
+    ("Código", lambda i: i.order.code),
+    ("Fecha", lambda i: _local(i.order.created_at)),
+    ("Cliente", lambda i: i.order.full_name),
+    ("Estado", lambda i: i.order.get_status_display()),
+    ("Pago", lambda i: i.order.get_payment_status_display()),
+    ("Producto", lambda i: i.product.name),
+    ("SKU", lambda i: i.product.sku or ""),
+    ("Cantidad", lambda i: i.qty),
+    ("Precio (S/)", lambda i: i.unit_price),
+    ("Subtotal (S/)", lambda i: i.subtotal),
+]
+
+
+def order_rows(orders):
+    """(encabezados, filas) de pedidos; ``orders`` es un queryset ya filtrado."""
+    qs = orders.select_related("user").order_by("created_at", "id")
+    return [h for h, _ in ORDER_COLUMNS], (
+        [get(o) for _, get in ORDER_COLUMNS] for o in qs.iterator(chunk_size=EXPORT_CHUNK)
+    )
+
+
+def item_rows(orders):
+    """(encabezados, filas) de items de esos pedidos (una fila por producto)."""
+    qs = (
+        OrderItem.objects.filter(order_id__in=orders.values("pk"))
+        .select_related("order", "product")
+        .order_by("order__created_at", "order_id", "id")
+    )
+    return [h for h, _ in ITEM_COLUMNS], (
+        [get(i) for _, get in ITEM_COLUMNS] for i in qs.iterator(chunk_size=EXPORT_CHUNK)
+    )
+
+
+EXPORTS = {"orders": order_rows, "items": item_rows}
+SHEET_TITLES = {"orders": "Pedidos", "items": "Items"}
+
+
+# -------------------
+# CSV
+# -------------------
+class _Echo:
+    """Buffer que devuelve lo escrito (csv.writer escribe una fila y la pasamos tal cual)."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d %H:%M")
+    if _is_formula_like(value):
+        return "'" + value  # el apóstrofo hace que la hoja lo muestre como texto
+    return value
+
+
+def iter_csv(headers, rows):
+    writer = csv.writer(_Echo())
+    yield "\ufeff"  # BOM: Excel abre bien las tildes
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow([_csv_value(v) for v in row])
+
+
+def csv_response(orders, kind: str = "orders", filename: str = "") -> StreamingHttpResponse:
+    headers, rows = EXPORTS[kind](orders)
+    filename = filename or f"{SHEET_TITLES[kind].lower()}-{timezone.localdate():%Y%m%d}.csv"
+    response = StreamingHttpResponse(iter_csv(headers, rows), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+# -------------------
+# XLSX
+# -------------------
+def _xlsx_value(ws, value):
+    if not _is_formula_like(value):
+        return value
+    # openpyxl guarda como fórmula todo texto que empieza con "=": se fuerza celda de texto
+    cell = WriteOnlyCell(ws, value=value)
+    cell.data_type = "s"
+    return cell
+
+
+def write_xlsx(orders, fileobj, kinds=("orders", "items")) -> dict:
+    """Escribe una hoja por tipo en ``fileobj``. Devuelve filas por hoja."""
+    wb = Workbook(write_only=True)
+    counts = {}
+    bold = Font(bold=True)
+    for kind in kinds:
+        ws = wb.create_sheet(SHEET_TITLES[kind])
+        headers, rows = EXPORTS[kind](orders)
+        header_cells = []
+        for title in headers:
+            cell = WriteOnlyCell(ws, value=title)
+            cell.font = bold
+            header_cells.append(cell)
+        ws.append(header_cells)
+        n = 0
+        for row in rows:
+            ws.append([_xlsx_value(ws, v) for v in row])
+            n += 1
+        counts[kind] = n
+    wb.save(fileobj)
+    return counts
+
+
+def xlsx_response(orders, kinds=("orders", "items"), filename: str = "") -> FileResponse:
+    filename = filename or f"pedidos-{timezone.localdate():%Y%m%d}.xlsx"
+    # en disco (no en RAM): un export grande no infla el worker
+    tmp = tempfile.TemporaryFile(suffix=".xlsx")
+    write_xlsx(orders, tmp, kinds)
+    tmp.seek(0)
+    return FileResponse(tmp, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
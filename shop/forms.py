@@ -1,8 +1,13 @@
 from django import forms
-from .models import Order, Address
+from .models import Order, Address, Product
+from .receipts import validate_receipt
+from .transitions import allowed_sources
 
 
 class CheckoutForm(forms.ModelForm):
+    # ✅ se emite con el formulario; el mismo token = el mismo pedido (ver checkout)
+    checkout_token = forms.RegexField(regex=r"^[0-9a-f]{32}$", required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = Order
         fields = ["full_name", "whatsapp", "address", "reference", "notes"]
@@ -20,9 +25,16 @@ class ReceiptUploadForm(forms.ModelForm):
         model = Order
         fields = ["receipt_image"]
         widgets = {
-            "receipt_image": forms.ClearableFileInput(attrs={"class": "form-control"}),
+            "receipt_image": forms.ClearableFileInput(attrs={"class": "form-control", "accept": "image/*"}),
         }
 
+    def clean_receipt_image(self):
+        img = self.cleaned_data.get("receipt_image")
+        # solo validar archivos nuevos (no el que ya estaba guardado)
+        if img and hasattr(img, "content_type"):
+            validate_receipt(img)
+        return img
+
 
 class AddressForm(forms.ModelForm):
     class Meta:
@@ -37,3 +49,73 @@ class AddressForm(forms.ModelForm):
             "notes": forms.Textarea(attrs={"class": "form-control", "rows": 3}),
             "is_default": forms.CheckboxInput(attrs={"class": "form-check-input"}),
         }
+
+
+class ProductAdminForm(forms.ModelForm):
+    """
+    ``stock`` es lo disponible y baja con cada compra: se guarda el valor que
+    se mostró (campo oculto) para aplicar solo la diferencia que escribió el admin.
+    """
+
+    class Meta:
+        model = Product
+        fields = "__all__"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if "stock" in self.fields:
+            self.fields["stock"].show_hidden_initial = True
+            self.fields["stock"].help_text = (
+                "Disponible para vender (sin lo reservado por pedidos sin pagar). "
+                "Lo que cambies se suma o resta al valor actual."
+            )
+
+    def stock_delta(self) -> int:
+        """Cuánto cambió el admin el stock respecto de lo que vio en pantalla."""
+        if "stock" not in self.changed_data:
+            return 0
+        field = self.fields["stock"]
+        shown = field.to_python(self.data.get(self.add_initial_prefix("stock")))
+        if shown is None:
+            shown = self.initial.get("stock") or 0
+        return self.cleaned_data["stock"] - shown
+
+
+class OrderAdminForm(forms.ModelForm):
+    """Edición a mano de un pedido: mismos cambios de estado permitidos que las acciones."""
+
+    class Meta:
+        model = Order
+        fields = "__all__"
+
+    def clean(self):
+        cleaned = super().clean()
+        if not self.instance.pk:
+            return cleaned
+        for field in ("status", "payment_status"):
+            if field not in self.changed_data or not cleaned.get(field):
+                continue
+            before, after = self.initial.get(field), cleaned[field]
+            if before not in allowed_sources(field, after):
+                labels = dict(self.fields[field].choices)
+                self.add_error(
+                    field,
+                    f"No se puede pasar de “{labels.get(before, before)}” a “{labels.get(after, after)}”.",
+                )
+        return cleaned
+
+
+class ProductImportForm(forms.Form):
+    file = forms.FileField(
+        label="Archivo (.csv o .xlsx)",
+        widget=forms.ClearableFileInput(attrs={"accept": ".csv,.xlsx"}),
+    )
+    dry_run = forms.BooleanField(
+        label="Solo simular (mostrar cambios sin guardar)", required=False, initial=True
+    )
+
+    def clean_file(self):
+        f = self.cleaned_data["file"]
+        if not f.name.lower().endswith((".csv", ".xlsx")):
+            raise forms.ValidationError("Sube un archivo .csv o .xlsx.")
+        return f
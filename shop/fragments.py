@@ -0,0 +1,138 @@
+"""
+Cache de fragmentos HTML de las tarjetas de producto.
+
+Cada tarjeta se guarda con la clave (variante, id, versión). La versión de cada
+producto vive en el cache compartido (file/redis, ver settings.CACHES) y se
+renueva por señales al guardar/borrar un Product (incluye ``list_editable`` del
+admin) o explícitamente cuando cambia el stock con ``update()``. Como la versión
+está en el cache compartido, todos los workers de gunicorn ven el mismo valor.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Product
+
+CARD_TEMPLATES = {
+    "list": "shop/partials/product_card_list.html",
+    "home": "shop/partials/product_card_home.html",
+}
+CARD_TIMEOUT = 60 * 60 * 24
+# ✅ subir al cambiar el HTML de las tarjetas (invalida lo cacheado con el markup viejo)
+CARD_MARKUP_VERSION = 2
+FEATURED_COUNT = 6
+
+_PRODUCT_VERSION_KEY = "shop:product:v:{}"
+_CATALOG_VERSION_KEY = "shop:catalog:v"
+
+
+def _new_stamp() -> str:
+    return format(time.time_ns(), "x")
+
+
+# -------------------
+# Versiones
+# -------------------
+def product_versions(ids) -> dict:
+    """{id: versión} con un solo get_many; inicializa las que falten."""
+    keys = {_PRODUCT_VERSION_KEY.format(pid): pid for pid in ids}
+    found = cache.get_many(keys)
+    versions = {keys[k]: v for k, v in found.items()}
+    for key, pid in keys.items():
+        if pid in versions:
+            continue
+        stamp = _new_stamp()
+        # add() no pisa una versión puesta por otro worker en paralelo
+        if not cache.add(key, stamp, None):
+            stamp = cache.get(key, stamp)
+        versions[pid] = stamp
+    return versions
+
+
+def catalog_version() -> str:
+    stamp = cache.get(_CATALOG_VERSION_KEY)
+    if stamp is None:
+        stamp = _new_stamp()
+        if not cache.add(_CATALOG_VERSION_KEY, stamp, None):
+            stamp = cache.get(_CATALOG_VERSION_KEY, stamp)
+    return stamp
+
+
+def bump_product_versions(ids, catalog: bool = False):
+    """
+    Invalida las tarjetas de esos productos (y la lista de destacados si catalog=True).
+    Se ejecuta al confirmar la transacción: si se hiciera antes, otro worker podría
+    cachear datos viejos con la versión nueva.
+    """
+    ids = [pid for pid in ids if pid is not None]
+
+    def _bump():
+        # borrar la versión basta: product_versions() crea una nueva al próximo uso.
+        # Es más barato que set_many en lotes grandes (importaciones de miles de
+        # productos; el FileBasedCache recorre el directorio en cada set).
+        if ids:
+            cache.delete_many([_PRODUCT_VERSION_KEY.format(pid) for pid in ids])
+        if catalog:
+            cache.set(_CATALOG_VERSION_KEY, _new_stamp(), None)
+
+    transaction.on_commit(_bump)
+
+
+# -------------------
+# Render
+# -------------------
+def render_product_cards(ids, variant: str, products=None, new_count: int = 0) -> list:
+    """
+    HTML de las tarjetas en el orden de ``ids``. Las que no estén en cache se
+    renderizan con ``products`` (si ya se consultaron) o con una consulta por id__in.
+    Las primeras ``new_count`` llevan la etiqueta "Nuevo".
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+
+    versions = product_versions(ids)
+    keys = {
+        pid: f"shop:card:{CARD_MARKUP_VERSION}:{variant}:{pid}:{versions[pid]}:{int(i < new_count)}"
+        for i, pid in enumerate(ids)
+    }
+    cached = cache.get_many(keys.values())
+
+    missing = [pid for pid in ids if keys[pid] not in cached]
+    if missing:
+        by_id = {p.id: p for p in products or []}
+        need = [pid for pid in missing if pid not in by_id]
+        if need:
+            by_id.update((p.id, p) for p in Product.objects.filter(id__in=need))
+
+        fresh = {}
+        position = {pid: i for i, pid in enumerate(ids)}
+        for pid in missing:
+            p = by_id.get(pid)
+            if p is None:
+                continue
+            fresh[keys[pid]] = render_to_string(CARD_TEMPLATES[variant], {
+                "p": p,
+                "is_new": position[pid] < new_count,
+            })
+        cache.set_many(fresh, CARD_TIMEOUT)
+        cached.update(fresh)
+
+    return [mark_safe(cached[keys[pid]]) for pid in ids if keys[pid] in cached]
+
+
+def featured_product_ids() -> list:
+    """Ids de los productos nuevos de home, cacheados por versión del catálogo."""
+    key = f"shop:featured:{catalog_version()}"
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(
+            Product.objects.filter(is_active=True)
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)[:FEATURED_COUNT]
+        )
+        cache.set(key, ids, CARD_TIMEOUT)
+    return ids
@@ -0,0 +1,104 @@
+"""
+Variantes responsive de Product.image.
+
+Al subir una foto se generan versiones WebP + JPEG (fallback) en varios anchos
+y se guardan junto al original en ``products/variants/``. Los nombres quedan en
+``Product.image_variants`` para que el template arme ``srcset`` sin tocar disco.
+"""
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+VARIANT_WIDTHS = (320, 640, 960, 1280)
+VARIANT_DIR = "products/variants"
+WEBP_QUALITY = 78
+JPEG_QUALITY = 80
+
+
+def _encode(img, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, "WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        if img.mode != "RGB":
+            # JPEG no tiene transparencia: fondo blanco
+            bg = Image.new("RGB", img.size, (255, 255, 255))
+            bg.paste(img, mask=img.getchannel("A") if "A" in img.getbands() else None)
+            img = bg
+        img.save(buf, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def build_variants(field_file) -> dict:
+    """
+    Genera las variantes para ``field_file`` (un ImageFieldFile) y devuelve el
+    dict para ``image_variants``: {"src": nombre, "width": ancho, "widths": {"320": {"webp", "jpg"}}}.
+    """
+    storage = field_file.storage
+    stem = posixpath.splitext(posixpath.basename(field_file.name))[0]
+
+    with storage.open(field_file.name, "rb") as fh:
+        img = Image.open(fh)
+        img = ImageOps.exif_transpose(img)
+        img.load()
+
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+
+    width, height = img.size
+    # no agrandamos: solo anchos menores al original (y al menos uno)
+    widths = [w for w in VARIANT_WIDTHS if w < width] or [width]
+
+    out = {}
+    for w in widths:
+        h = max(1, round(height * w / width))
+        resized = img if w == width else img.resize((w, h), Image.LANCZOS)
+        names = {}
+        for fmt in ("webp", "jpg"):
+            name = storage.save(f"{VARIANT_DIR}/{stem}-{w}w.{fmt}", ContentFile(_encode(resized, fmt)))
+            names[fmt] = name
+        out[str(w)] = names
+
+    return {"src": field_file.name, "width": width, "widths": out}
+
+
+def _variant_names(variants: dict) -> set:
+    return {name for names in (variants or {}).get("widths", {}).values() for name in names.values()}
+
+
+def variants_outdated(product) -> bool:
+    current = (product.image_variants or {}).get("src")
+    if not product.image:
+        return bool(current)
+    return current != product.image.name
+
+
+def refresh_variants(product, force: bool = False) -> dict:
+    """
+    Regenera (si hace falta) las variantes de ``product`` y devuelve el dict nuevo.
+    No guarda el modelo: el llamador decide cómo (update / bulk_update).
+    """
+    if not force and not variants_outdated(product):
+        return product.image_variants
+
+    old = product.image_variants or {}
+    new = build_variants(product.image) if product.image else {}
+
+    # borrar archivos de variantes anteriores que ya no se usan, pero solo al
+    # confirmar: si la transacción se revierte, el producto sigue apuntando a ellos
+    storage = product._meta.get_field("image").storage
+    stale = _variant_names(old) - _variant_names(new)
+    if stale:
+        transaction.on_commit(lambda: _delete_files(storage, stale))
+    return new
+
+
+def _delete_files(storage, names):
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            pass
@@ -0,0 +1,336 @@
+"""
+Importación masiva de productos desde CSV / Excel.
+
+- El archivo se lee en streaming (``csv.reader`` / openpyxl
+  ``read_only``): nunca se carga entero. Un CSV puede venir en UTF-8 o en el
+  cp1252 del Excel de Windows.
+- Se procesa por bloques de ``chunk_size`` filas; cada bloque es:
+  1 SELECT (``sku__in``) + 1 ``bulk_create`` + 1 ``bulk_update`` dentro de su
+  propia transacción. Si un bloque falla, los anteriores quedan guardados.
+- Los productos se identifican por ``sku``. Solo se actualizan las columnas
+  que trae el archivo, y solo si cambiaron.
+- ``dry_run=True`` no escribe nada y arma el diff (+ nuevo / ~ cambios).
+- ``stock`` del archivo son existencias físicas: se guarda
+  ``existencias − reservado`` (``Product.stock`` es lo disponible, ver
+  shop/inventory.py). Las filas del bloque se bloquean mientras tanto para no
+  pisar una compra en curso.
+
+Los ``bulk_*`` no disparan señales: las tarjetas cacheadas se invalidan con
+``bump_product_versions`` al confirmar cada bloque. El índice de búsqueda se
+mantiene solo (triggers, ver shop/search.py).
+
+Columnas (encabezado, sin importar mayúsculas ni tildes):
+``sku``, ``nombre``/``name``, ``descripcion``/``description``,
+``precio``/``price``, ``stock``, ``activo``/``is_active``.
+"""
+import codecs
+import csv
+import io
+import time
+import unicodedata
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from openpyxl import load_workbook
+
+from .fragments import bump_product_versions
+from .inventory import available_from_on_hand, reserved_by_product
+from .models import Product
+
+DEFAULT_CHUNK = 1000
+MAX_REPORTED_ERRORS = 100
+
+HEADER_ALIASES = {
+    "sku": "sku", "codigo": "sku", "external_id": "sku",
+    "nombre": "name", "name": "name", "producto": "name",
+    "descripcion": "description", "description": "description",
+    "precio": "price", "price": "price",
+    "stock": "stock", "cantidad": "stock",
+    "activo": "is_active", "is_active": "is_active", "active": "is_active",
+}
+IMPORT_FIELDS = ("name", "description", "price", "stock", "is_active")
+_TRUE = {"1", "si", "sí", "true", "x", "yes", "y", "activo"}
+_FALSE = {"0", "no", "false", "n", "inactivo", ""}
+# "CSV UTF-8" o el "CSV" de Excel en Windows (cp1252: "Cerámica" no es UTF-8 válido)
+CSV_ENCODINGS = ("utf-8-sig", "cp1252")
+
+_PRICE_FIELD = Product._meta.get_field("price")
+PRICE_LIMIT = Decimal(10) ** (_PRICE_FIELD.max_digits - _PRICE_FIELD.decimal_places)  # no entra en la columna
+STOCK_MAX = 2_147_483_647  # PositiveIntegerField (Postgres / MySQL)
+
+
+class ProductImportError(ValueError):
+    """El archivo no se puede importar (formato o encabezados)."""
+
+
+def _norm_header(value) -> str:
+    text = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode()
+    return HEADER_ALIASES.get(text.strip().lower().replace(" ", "_"), "")
+
+
+# -------------------
+# Lectura en streaming
+# -------------------
+def _detect_encoding(fileobj) -> str:
+    """
+    Primera codificación de CSV_ENCODINGS que decodifica el archivo completo.
+    Se recorre de a bloques antes de importar: un error a mitad de archivo
+    dejaría los bloques anteriores ya guardados.
+    """
+    for encoding in CSV_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            for block in iter(lambda: fileobj.read(64 * 1024), b""):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            continue
+        finally:
+            fileobj.seek(0)
+        return encoding
+    raise ProductImportError("No se pudo leer el CSV: guárdalo como «CSV UTF-8» desde Excel.")
+
+
+def _csv_rows(fileobj):
+    if isinstance(fileobj, io.TextIOBase):
+        text = fileobj
+    else:
+        text = io.TextIOWrapper(fileobj, encoding=_detect_encoding(fileobj), newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(text, dialect)
+    yield from reader
+
+
+def _xlsx_rows(fileobj):
+    wb = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def read_rows(fileobj, filename: str):
+    """Genera (n° de fila, {campo: valor}) leyendo el archivo de a poco."""
+    name = filename.lower()
+    if name.endswith(".xlsx"):
+        rows = _xlsx_rows(fileobj)
+    elif name.endswith(".csv") or name.endswith(".txt"):
+        rows = _csv_rows(fileobj)
+    else:
+        raise ProductImportError("Formato no soportado: usa .csv o .xlsx")
+
+    header = next(rows, None)
+    if not header:
+        raise ProductImportError("El archivo está vacío.")
+    columns = [_norm_header(h) for h in header]
+    if "sku" not in columns:
+        raise ProductImportError("Falta la columna 'sku'.")
+
+    for line, values in enumerate(rows, start=2):
+        if values is None or all(v in (None, "") for v in values):
+            continue
+        yield line, {col: val for col, val in zip(columns, values) if col}
+
+
+# -------------------
+# Validación
+# -------------------
+def _parse_price(value) -> Decimal:
+    if isinstance(value, (int, float, Decimal)):
+        price = Decimal(str(value))
+    else:
+        text = str(value or "").replace("S/", "").replace(" ", "").strip()
+        if "," in text and "." not in text:
+            text = text.replace(",", ".")  # 12,50
+        else:
+            text = text.replace(",", "")  # 1,250.00
+        try:
+            price = Decimal(text)
+        except InvalidOperation:
+            raise ValueError(f"precio inválido: {value!r}")
+    if not price.is_finite():  # NaN / Infinity (también desde Excel)
+        raise ValueError(f"precio inválido: {value!r}")
+    if price < 0:
+        raise ValueError("precio negativo")
+    # antes de redondear: quantize falla con exponentes enormes (1e30)
+    if price >= PRICE_LIMIT or price.quantize(Decimal("0.01")) >= PRICE_LIMIT:
+        raise ValueError(f"precio demasiado alto: {value!r}")
+    return price.quantize(Decimal("0.01"))
+
+
+def _parse_stock(value) -> int:
+    try:
+        stock = Decimal(str(value).strip() or "0")
+    except InvalidOperation:
+        raise ValueError(f"stock inválido: {value!r}")
+    if not stock.is_finite():
+        raise ValueError(f"stock inválido: {value!r}")
+    if stock < 0:
+        raise ValueError("stock negativo")
+    if stock > STOCK_MAX:
+        raise ValueError(f"stock demasiado alto: {value!r}")
+    return int(stock)
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value if value is not None else "").strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f"activo inválido: {value!r} (usa sí/no)")
+
+
+def clean_row(raw: dict) -> tuple:
+    """(sku, {campo: valor}) con tipos ya convertidos. ValueError si algo no cuadra."""
+    sku = str(raw.get("sku") or "").strip()
+    if isinstance(raw.get("sku"), float) and raw["sku"].is_integer():
+        sku = str(int(raw["sku"]))  # Excel guarda 1001 como 1001.0
+    if not sku:
+        raise ValueError("sin sku")
+    if len(sku) > 64:
+        raise ValueError("sku de más de 64 caracteres")
+
+    values = {}
+    if "name" in raw:
+        name = str(raw["name"] or "").strip()
+        if not name:
+            raise ValueError("nombre vacío")
+        values["name"] = name[:120]
+    if "description" in raw:
+        values["description"] = str(raw["description"] or "").strip()
+    if "price" in raw:
+        values["price"] = _parse_price(raw["price"])
+    if "stock" in raw:
+        values["stock"] = _parse_stock(raw["stock"])
+    if "is_active" in raw:
+        values["is_active"] = _parse_bool(raw["is_active"])
+    return sku, values
+
+
+# -------------------
+# Importación
+# -------------------
+class ImportReport:
+    def __init__(self, dry_run: bool):
+        self.dry_run = dry_run
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.chunks = 0
+        self.error_count = 0
+        self.errors = []   # (fila, mensaje), solo los primeros MAX_REPORTED_ERRORS
+        self.diff = []     # líneas "+ ..." / "~ ..."
+        self.elapsed = 0.0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def summary(self) -> str:
+        rate = self.rows / self.elapsed if self.elapsed else 0
+        prefix = "(simulación) " if self.dry_run else ""
+        return (
+            f"{prefix}{self.rows} filas en {self.elapsed:.2f}s ({rate:,.0f} filas/s): "
+            f"{self.created} nuevos, {self.updated} actualizados, {self.unchanged} sin cambios, "
+            f"{self.error_count} con error"
+        )
+
+
+def _apply_chunk(chunk, report: ImportReport, diff_limit: int):
+    # el último valor gana si el mismo SKU se repite en el bloque
+    by_sku = {}
+    for line, sku, values in chunk:
+        by_sku.setdefault(sku, [line, {}])[1].update(values)
+        by_sku[sku][0] = line
+
+    if report.dry_run:
+        _plan_chunk(by_sku, report, diff_limit)
+        return
+    with transaction.atomic():
+        to_create, to_update, changed_fields = _plan_chunk(by_sku, report, diff_limit, lock=True)
+        created = Product.objects.bulk_create(to_create, batch_size=500) if to_create else []
+        if to_update:
+            Product.objects.bulk_update(to_update, sorted(changed_fields), batch_size=500)
+        # tarjetas / snapshots / destacados: se invalidan al confirmar el bloque
+        # (los nuevos no tienen nada cacheado; basta con la versión del catálogo)
+        bump_product_versions([p.pk for p in to_update], catalog=bool(created or to_update))
+
+
+def _plan_chunk(by_sku, report: ImportReport, diff_limit: int, lock: bool = False):
+    qs = Product.objects.filter(sku__in=list(by_sku)).only("id", "sku", *IMPORT_FIELDS)
+    if lock:
+        qs = qs.select_for_update().order_by("id")  # mismo orden que el checkout
+    existing = {p.sku: p for p in qs}
+    reserved = reserved_by_product([p.pk for p in existing.values()]) if existing else {}
+
+    to_create, to_update, changed_fields = [], [], set()
+    for sku, (line, values) in by_sku.items():
+        product = existing.get(sku)
+        if product is None:
+            if "name" not in values or "price" not in values:
+                report.add_error(line, f"{sku}: producto nuevo sin nombre o precio")
+                continue
+            to_create.append(Product(sku=sku, **values))
+            if len(report.diff) < diff_limit:
+                report.diff.append(f"+ {sku} {values['name']} S/ {values['price']}")
+            continue
+
+        if "stock" in values:
+            values = {**values, "stock": available_from_on_hand(values["stock"], reserved.get(product.pk, 0))}
+        changes = {f: v for f, v in values.items() if getattr(product, f) != v}
+        if not changes:
+            report.unchanged += 1
+            continue
+        if len(report.diff) < diff_limit:
+            detail = ", ".join(f"{f}: {getattr(product, f)!r} → {v!r}" for f, v in changes.items())
+            report.diff.append(f"~ {sku} {detail}")
+        for field, value in changes.items():
+            setattr(product, field, value)
+        changed_fields.update(changes)
+        to_update.append(product)
+
+    report.created += len(to_create)
+    report.updated += len(to_update)
+    return to_create, to_update, changed_fields
+
+
+def import_products(fileobj, filename: str, dry_run: bool = False, chunk_size: int = DEFAULT_CHUNK,
+                    diff_limit: int = 200, progress=None) -> ImportReport:
+    """Importa/actualiza productos por SKU. ``progress(report)`` se llama tras cada bloque."""
+    report = ImportReport(dry_run)
+    t0 = time.perf_counter()
+    chunk = []
+
+    def flush():
+        _apply_chunk(chunk, report, diff_limit)
+        report.chunks += 1
+        chunk.clear()
+        if progress:
+            report.elapsed = time.perf_counter() - t0
+            progress(report)
+
+    for line, raw in read_rows(fileobj, filename):
+        report.rows += 1
+        try:
+            sku, values = clean_row(raw)
+        except ValueError as exc:
+            report.add_error(line, str(exc))
+            continue
+        chunk.append((line, sku, values))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    report.elapsed = time.perf_counter() - t0
+    return report
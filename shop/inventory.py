@@ -0,0 +1,183 @@
+"""
+Reservas de stock (StockHold) entre el checkout y el pago.
+
+Modelo: ``Product.stock`` es lo *disponible* (el checkout ya lo descontó), así
+la lectura "disponible = stock − reservas activas" no necesita ningún JOIN.
+Lo que hay físicamente es ``stock + reservas activas``; por eso nada escribe
+un valor absoluto en ``stock`` sin restar lo reservado:
+
+- admin: lo editado se aplica como diferencia (``adjust_stock``), sin pisar
+  las compras que entraron mientras tanto;
+- importación: el archivo trae existencias físicas y se guarda
+  ``existencias − reservado`` (``available_from_on_hand``).
+
+Cada pedido deja reservas con vencimiento:
+
+- pago / confirmación  -> ``consume_holds`` (la venta queda firme)
+- vencimiento / cancelación / borrado -> ``release_holds`` (las unidades vuelven
+  al stock; al cancelar, también las de una venta ya firme)
+- pago con Culqi / comprobante en revisión -> ``extend_holds``
+
+Las vencidas se liberan solas: ``schedule_hold_sweep`` (lo llaman las páginas
+del catálogo) corre ``release_expired_holds`` en segundo plano como máximo
+cada ``STOCK_HOLD_SWEEP_SECONDS`` por proceso. ``manage.py
+release_expired_holds`` sigue sirviendo para cron.
+
+Los cambios de stock se hacen con un solo UPDATE ... CASE por lote.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .fragments import bump_product_versions
+from .models import Product, StockHold
+from .tasks import run_in_background
+
+
+def hold_ttl() -> timedelta:
+    return timedelta(minutes=getattr(settings, "STOCK_HOLD_MINUTES", 60))
+
+
+def review_ttl() -> timedelta:
+    return timedelta(hours=getattr(settings, "STOCK_HOLD_REVIEW_HOURS", 48))
+
+
+def create_holds(order, lines, now=None):
+    """lines: [(product, qty)] ya descontados del stock dentro de la transacción del checkout."""
+    expires_at = (now or timezone.now()) + hold_ttl()
+    StockHold.objects.bulk_create([
+        StockHold(order=order, product=p, qty=qty, expires_at=expires_at)
+        for p, qty in lines
+    ])
+    return expires_at
+
+
+def extend_holds(order, ttl: timedelta) -> datetime:
+    """Extiende las reservas activas del pedido hasta now + ttl (nunca las acorta)."""
+    expires_at = timezone.now() + ttl
+    StockHold.objects.filter(order=order, state="active", expires_at__lt=expires_at).update(expires_at=expires_at)
+    return expires_at
+
+
+def _adjust_stock(qty_by_product: dict, sign: int):
+    """stock += sign * qty para varios productos en un solo UPDATE (nunca < 0)."""
+    if not qty_by_product:
+        return
+    delta = Case(
+        *[When(id=pid, then=Value(qty)) for pid, qty in qty_by_product.items()],
+        output_field=IntegerField(),
+    )
+    ids = sorted(qty_by_product)
+    # mismo orden de bloqueo que el checkout (por id) para evitar deadlocks
+    list(Product.objects.select_for_update().filter(id__in=ids).order_by("id").values_list("id", flat=True))
+    if sign > 0:
+        Product.objects.filter(id__in=ids).update(stock=F("stock") + delta)
+    else:
+        Product.objects.filter(id__in=ids).update(stock=Greatest(F("stock") - delta, Value(0)))
+    bump_product_versions(ids)
+
+
+def _sum_by_product(holds) -> dict:
+    totals = defaultdict(int)
+    for product_id, qty in holds:
+        totals[product_id] += qty
+    return dict(totals)
+
+
+@transaction.atomic
+def release_holds(order_ids=None, expired_before=None, product_ids=None, consumed: bool = False) -> int:
+    """
+    Devuelve al stock las reservas activas (de esos pedidos y/o vencidas).
+    Con ``consumed=True`` también las consumidas: un pedido pagado o confirmado
+    que se cancela devuelve sus unidades igual que uno sin pagar.
+    Retorna cuántas reservas se liberaron.
+    """
+    states = ["active", "consumed"] if consumed else ["active"]
+    qs = StockHold.objects.select_for_update().filter(state__in=states)
+    if order_ids is not None:
+        qs = qs.filter(order_id__in=order_ids)
+    if expired_before is not None:
+        qs = qs.filter(expires_at__lte=expired_before)
+    if product_ids is not None:
+        qs = qs.filter(product_id__in=product_ids)
+
+    rows = list(qs.values_list("id", "product_id", "qty"))
+    if not rows:
+        return 0
+
+    _adjust_stock(_sum_by_product((pid, qty) for _, pid, qty in rows), +1)
+    StockHold.objects.filter(id__in=[r[0] for r in rows]).update(state="released")
+    return len(rows)
+
+
+def release_expired_holds(product_ids=None) -> int:
+    return release_holds(expired_before=timezone.now(), product_ids=product_ids)
+
+
+@transaction.atomic
+def consume_holds(order_ids) -> int:
+    """
+    La venta queda firme (pago o confirmación). Si alguna reserva ya se había
+    liberado por vencimiento, se vuelve a descontar del stock (sin bajar de 0).
+    """
+    order_ids = list(order_ids)
+    if not order_ids:
+        return 0
+
+    released = list(
+        StockHold.objects.select_for_update()
+        .filter(order_id__in=order_ids, state="released")
+        .values_list("id", "product_id", "qty")
+    )
+    if released:
+        _adjust_stock(_sum_by_product((pid, qty) for _, pid, qty in released), -1)
+
+    return StockHold.objects.filter(order_id__in=order_ids, state__in=["active", "released"]).update(state="consumed")
+
+
+@transaction.atomic
+def adjust_stock(product_id, delta: int):
+    """Ajuste manual (admin): suma ``delta`` a lo disponible sobre el valor actual (nunca < 0)."""
+    if delta:
+        _adjust_stock({product_id: abs(delta)}, 1 if delta > 0 else -1)
+
+
+def available_from_on_hand(on_hand: int, reserved: int) -> int:
+    """Existencias físicas -> ``Product.stock`` (lo reservado ya salió del disponible)."""
+    return max(on_hand - reserved, 0)
+
+
+_sweep_lock = threading.Lock()
+_last_sweep = None
+
+
+def sweep_interval() -> int:
+    return getattr(settings, "STOCK_HOLD_SWEEP_SECONDS", 60)
+
+
+def schedule_hold_sweep():
+    """Libera las reservas vencidas en segundo plano, a lo sumo una vez por intervalo."""
+    global _last_sweep
+    now = time.monotonic()
+    with _sweep_lock:
+        if _last_sweep is not None and now - _last_sweep < sweep_interval():
+            return
+        _last_sweep = now
+    run_in_background(release_expired_holds)
+
+
+def reserved_by_product(product_ids) -> dict:
+    """Unidades en reservas activas por producto (usa el índice parcial)."""
+    return dict(
+        StockHold.objects.filter(state="active", product_id__in=product_ids)
+        .values("product_id")
+        .annotate(total=Sum("qty"))
+        .values_list("product_id", "total")
+    )
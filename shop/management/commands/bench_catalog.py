@@ -0,0 +1,154 @@
+import random
+import re
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from shop.models import Product
+from shop.pagination import encode_cursor, keyset_queryset
+from shop.views import CATALOG_ORDERINGS, CATALOG_PAGE_SIZE, _catalog_queryset
+
+BENCH_PREFIX = "[bench] "
+WORDS = ["vela", "collar", "pulsera", "aretes", "jabón", "taza", "agenda", "bolso", "gorra", "café"]
+
+# Variantes de product_list: (nombre, q, min, max, order, profundidad de página, estricta)
+# "estricta" = el índice debe dar el orden (sin sort); las demás solo no deben hacer recorrido completo.
+VARIANTS = [
+    ("nuevos", "", "", "", "new", 0, True),
+    ("nuevos · página profunda", "", "", "", "new", 0.5, True),
+    ("precio ↑", "", "", "", "price_asc", 0, True),
+    ("precio ↑ · página profunda", "", "", "", "price_asc", 0.5, True),
+    ("precio ↓", "", "", "", "price_desc", 0, True),
+    ("rango de precio", "", "20", "60", "new", 0, False),
+    ("búsqueda", "vela", "", "", "relevance", 0, False),
+    ("búsqueda + precio ↑", "collar", "", "", "price_asc", 0, False),
+]
+
+# Planes que indican un recorrido completo de shop_product / un sort en memoria
+FULL_SCAN = {
+    "sqlite": re.compile(r"SCAN shop_product(?! USING|_fts)"),
+    "postgresql": re.compile(r"Seq Scan on shop_product\b"),
+}
+SORT = {
+    "sqlite": re.compile(r"TEMP B-TREE FOR ORDER BY"),
+    "postgresql": re.compile(r"^\s*(->\s*)?(Incremental )?Sort\b", re.M),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de las consultas de product_list: crea N productos de prueba, "
+        "muestra EXPLAIN y tiempos por variante. Los productos de prueba se ven en el catálogo mientras "
+        "existen, así que solo corre contra una base desechable. "
+        "Uso: python manage.py bench_catalog 20000 --scratch [--check]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("count", nargs="?", type=int, default=20000)
+        parser.add_argument(
+            "--scratch",
+            action="store_true",
+            help="Confirma que la base configurada es desechable (copia local, CI), no la de la tienda",
+        )
+        parser.add_argument("--repeat", type=int, default=7, help="Repeticiones por variante (se reporta la mediana)")
+        parser.add_argument("--keep", action="store_true", help="No borrar los productos de prueba al terminar")
+        parser.add_argument("--no-plans", action="store_true", help="No imprimir los planes completos")
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Falla si alguna variante hace recorrido completo o sort inesperado (para CI / antes de deploy)",
+        )
+
+    def handle(self, *args, **options):
+        if not options["scratch"]:
+            raise CommandError(
+                f"bench_catalog siembra productos activos en la base «{connection.settings_dict['NAME']}» "
+                "y aparecen en el catálogo. Úsalo solo en una base desechable y confírmalo con --scratch."
+            )
+        count = options["count"]
+        repeat = max(1, options["repeat"])
+
+        self._seed(count)
+        try:
+            problems = self._run(repeat, show_plans=not options["no_plans"])
+        finally:
+            if not options["keep"]:
+                Product.objects.filter(name__startswith=BENCH_PREFIX).delete()
+
+        if options["check"] and problems:
+            raise CommandError("Planes con recorrido completo/sort: " + ", ".join(problems))
+
+    def _seed(self, count):
+        Product.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        now = timezone.now()
+        batch = []
+        for i in range(count):
+            batch.append(Product(
+                name=f"{BENCH_PREFIX}{random.choice(WORDS).capitalize()} {i}",
+                description=" ".join(random.choices(WORDS, k=12)),
+                price=Decimal(random.randint(500, 25000)) / 100,
+                stock=random.randint(0, 50),
+                is_active=random.random() > 0.1,
+            ))
+            if len(batch) == 1000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Product.objects.bulk_create(batch)
+
+        # created_at es auto_now_add: lo repartimos en el último año para que el orden sea realista
+        rows = list(Product.objects.filter(name__startswith=BENCH_PREFIX).only("id"))
+        for p in rows:
+            p.created_at = now - timedelta(seconds=random.randint(0, 365 * 86400))
+        Product.objects.bulk_update(rows, ["created_at"], batch_size=1000)
+
+        with connection.cursor() as cur:
+            cur.execute("ANALYZE shop_product" if connection.vendor == "postgresql" else "ANALYZE")
+        self.stdout.write(f"Sembrados {count} productos de prueba ({connection.vendor}).")
+
+    def _cursor_at(self, qs, order, depth):
+        """Cursor "next" apuntando a la fila en la posición depth (0..1) del listado."""
+        if not depth:
+            return ""
+        ordering = CATALOG_ORDERINGS[order]
+        total = qs.count()
+        row = qs.order_by(*ordering)[int(total * depth)]
+        return encode_cursor(order, "next", [getattr(row, f.lstrip("-")) for f in ordering])
+
+    def _run(self, repeat, show_plans):
+        problems = []
+        full_scan = FULL_SCAN.get(connection.vendor)
+        sort = SORT.get(connection.vendor)
+
+        for name, q, minp, maxp, order, depth, strict in VARIANTS:
+            qs, order = _catalog_queryset(q, minp, maxp, order)
+            cursor = self._cursor_at(qs, order, depth)
+            page_qs = keyset_queryset(qs, CATALOG_ORDERINGS[order], cursor, CATALOG_PAGE_SIZE, order)
+
+            plan = page_qs.explain()
+            timings = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                rows = len(list(page_qs.all()))
+                timings.append((time.perf_counter() - t0) * 1000)
+
+            flagged = bool(full_scan and full_scan.search(plan)) or bool(strict and sort and sort.search(plan))
+            if flagged:
+                problems.append(name)
+
+            line = f"{name:<28} {statistics.median(timings):8.2f} ms  (min {min(timings):.2f}, filas {rows})"
+            self.stdout.write(self.style.ERROR(line + "  ⚠ plan") if flagged else line)
+            if show_plans or flagged:
+                for plan_line in plan.splitlines():
+                    self.stdout.write("    " + plan_line)
+
+        if problems:
+            self.stdout.write(self.style.WARNING(f"⚠ {len(problems)} variante(s) sin índice."))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ Todas las variantes del catálogo usan índice."))
+        return problems
@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from shop.culqi import CircuitBreaker, CulqiClient, CulqiError
+from shop.culqi_fake import start_fake_culqi
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el cliente Culqi (shop/culqi.py) contra el servidor falso en este mismo proceso: "
+        "throughput, p50/p95/p99 y cuántas conexiones TCP se abrieron. "
+        "Uso: python manage.py bench_culqi [--requests 500] [--threads 8] [--latency 0.02] [--fail-rate 0]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--latency", type=float, default=0.02, help="Latencia simulada de Culqi (s)")
+        parser.add_argument("--fail-rate", type=float, default=0.0, help="Fracción de 503 simulados (0-1)")
+        parser.add_argument("--pool", type=int, default=10, help="Conexiones keep-alive del cliente")
+
+    def handle(self, *args, **options):
+        n = max(1, options["requests"])
+        threads = max(1, options["threads"])
+        server = start_fake_culqi(latency=options["latency"], fail_rate=options["fail_rate"])
+        client = CulqiClient(
+            "sk_test_bench", base_url=server.base_url, pool_size=options["pool"], backoff=0.01,
+            breaker=CircuitBreaker(failures=10_000),  # medir el cliente, no cortar el benchmark
+        )
+
+        def one(i):
+            order = client.create_order({
+                "amount": 1000 + i,
+                "currency_code": "PEN",
+                "description": f"Bench {i}",
+                "order_number": f"BENCH-{i}",
+            })
+            client.get_order(order["id"])
+
+        errors = 0
+        t0 = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                for fut in [pool.submit(one, i) for i in range(n)]:
+                    try:
+                        fut.result()
+                    except CulqiError:
+                        errors += 1
+            elapsed = time.perf_counter() - t0
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(
+            f"{n} pedidos ({n * 2} llamadas) con {threads} hilos en {elapsed:.2f}s "
+            f"-> {n * 2 / elapsed:,.0f} llamadas/s, {errors} con error"
+        )
+        for op, s in sorted(client.stats.snapshot().items()):
+            extra = ", ".join(f"{k}={v}" for k, v in s.items() if not k.startswith("p") and k != "count")
+            self.stdout.write(
+                f"  {op:<13} n={s['count']:<6} p50={s['p50_ms']}ms p95={s['p95_ms']}ms p99={s['p99_ms']}ms  {extra}"
+            )
+        self.stdout.write(
+            f"Conexiones TCP abiertas: {len(server.connections)} para {server.requests} requests HTTP"
+        )
+        ok = len(server.connections) <= max(options["pool"], threads) + errors
+        style = self.style.SUCCESS if ok else self.style.WARNING
+        self.stdout.write(style("✅ keep-alive reutiliza conexiones." if ok else "⚠️ se abrieron más conexiones de lo esperado."))
@@ -0,0 +1,125 @@
+import multiprocessing
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from shop.codes import ALPHABET, CODE_PREFIX, CodeAllocator, encode, is_valid_code
+from shop.models import CodeCounter
+
+BENCH_COUNTER = "bench"
+
+
+def _process_worker(args):
+    """Proceso hijo: reparte ``count`` números y devuelve los inicios de bloque usados."""
+    count, block = args
+    connections.close_all()  # no compartir la conexión heredada del padre
+    allocator = CodeAllocator(BENCH_COUNTER, block)
+    starts = set()
+    for _ in range(count):
+        allocator.next_value()
+        starts.add(allocator._end - block)
+    connections.close_all()
+    return sorted(starts)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el generador de códigos de pedido (shop/codes.py) y verifica que no se repitan. "
+        "Usa un contador propio ('bench'), no consume códigos reales. "
+        "Uso: python manage.py bench_order_codes [--count 2000000] [--threads 4] [--processes 4]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=2_000_000, help="Códigos a generar con hilos")
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--processes", type=int, default=4, help="Procesos compitiendo por bloques (0 = omitir)")
+        parser.add_argument("--block", type=int, default=1000, help="Números por reserva en la DB")
+        parser.add_argument("--keep", action="store_true", help="No borrar el contador de prueba")
+
+    def handle(self, *args, **options):
+        count = max(1, options["count"])
+        threads = max(1, options["threads"])
+        block = max(1, options["block"])
+
+        CodeCounter.objects.filter(name=BENCH_COUNTER).delete()
+        try:
+            self._bench_encode(min(count, 500_000))
+            self._bench_threads(count, threads, block)
+            if options["processes"] > 0:
+                self._bench_processes(count, options["processes"], block)
+            self._check_typos()
+        finally:
+            if not options["keep"]:
+                CodeCounter.objects.filter(name=BENCH_COUNTER).delete()
+
+    # -------------------
+    def _bench_encode(self, n):
+        t0 = time.perf_counter()
+        for i in range(n):
+            encode(i)
+        elapsed = time.perf_counter() - t0
+        self.stdout.write(f"encode():            {n / elapsed:>12,.0f} códigos/s")
+
+    def _bench_threads(self, count, threads, block):
+        allocator = CodeAllocator(BENCH_COUNTER, block)
+        per_thread = [count // threads + (1 if i < count % threads else 0) for i in range(threads)]
+
+        def work(n):
+            try:
+                return [allocator.next_code() for _ in range(n)]
+            finally:
+                connections.close_all()
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(work, per_thread))
+        elapsed = time.perf_counter() - t0
+
+        codes = [c for chunk in results for c in chunk]
+        unique = len(set(codes))
+        self.stdout.write(
+            f"{threads} hilos:             {count / elapsed:>12,.0f} códigos/s "
+            f"({count:,} en {elapsed:.2f}s, {allocator.reservations:,} reservas en DB)"
+        )
+        if unique != len(codes):
+            raise CommandError(f"❌ {len(codes) - unique} códigos repetidos entre hilos")
+        bad = [c for c in random.sample(codes, min(1000, len(codes))) if not is_valid_code(c)]
+        if bad:
+            raise CommandError(f"❌ dígito de control inválido: {bad[:3]}")
+        self.stdout.write(self.style.SUCCESS(f"✅ {unique:,} códigos únicos (ej. {codes[0]}, {codes[-1]})"))
+
+    def _bench_processes(self, count, processes, block):
+        per_proc = max(1, count // processes)
+        connections.close_all()
+        ctx = multiprocessing.get_context("fork")
+        t0 = time.perf_counter()
+        with ctx.Pool(processes) as pool:
+            results = pool.map(_process_worker, [(per_proc, block)] * processes)
+        elapsed = time.perf_counter() - t0
+
+        starts = [s for chunk in results for s in chunk]
+        total = per_proc * processes
+        self.stdout.write(
+            f"{processes} procesos:          {total / elapsed:>12,.0f} números/s "
+            f"({total:,} en {elapsed:.2f}s, {len(starts):,} bloques)"
+        )
+        if len(set(starts)) != len(starts):
+            raise CommandError("❌ dos procesos recibieron el mismo bloque")
+        self.stdout.write(self.style.SUCCESS("✅ ningún bloque repetido entre procesos"))
+
+    def _check_typos(self):
+        """Un carácter cambiado siempre invalida el código (propiedad de Luhn mod N)."""
+        rng = random.Random(0)
+        caught = tried = 0
+        for n in rng.sample(range(1 << 30), 2000):
+            body = encode(n)[len(CODE_PREFIX):]
+            pos = rng.randrange(len(body))
+            wrong = rng.choice([ch for ch in ALPHABET if ch != body[pos]])
+            tried += 1
+            caught += not is_valid_code(CODE_PREFIX + body[:pos] + wrong + body[pos + 1:])
+        self.stdout.write(f"Errores de tipeo detectados: {caught}/{tried}")
+        if caught != tried:
+            raise CommandError("❌ el dígito de control dejó pasar un error de tipeo")
@@ -0,0 +1,107 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.culqi import build_client
+from shop.culqi_fake import start_fake_culqi
+from shop.models import Order, OrderStatusHistory
+from shop.payments import apply_culqi_states, fetch_culqi_states
+
+BENCH_PREFIX = "RCB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de la conciliación con Culqi contra un Culqi falso en este proceso: crea sus "
+        "propios pedidos de prueba (RCB-...), les asigna estados al azar en el servidor falso, "
+        "los consulta en paralelo y los aplica con apply_culqi_states. No toca pedidos reales. "
+        "Uso: python manage.py bench_reconcile [--orders 2000] [--workers 8] [--latency 0.05]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=2000)
+        parser.add_argument("--workers", type=int, default=8, help="Consultas simultáneas (una conexión cada una)")
+        parser.add_argument("--latency", type=float, default=0.05, help="Latencia del Culqi falso (segundos)")
+        parser.add_argument("--keep", action="store_true", help="No borrar los pedidos de prueba")
+
+    def handle(self, *args, **options):
+        n = max(1, options["orders"])
+        workers = max(1, options["workers"])
+
+        self._cleanup()
+        orders = self._seed(n)
+        server = start_fake_culqi(latency=options["latency"])
+        expected_paid = 0
+        for order in orders:
+            state = random.choice(["pending", "pending", "paid", "expired"])
+            expected_paid += state == "paid"
+            server.seed_order(order.culqi_order_id, state=state)
+
+        client = build_client(
+            base_url=server.base_url,
+            secret_key=settings.CULQI_SECRET_KEY or "sk_test_fake",
+            pool_size=max(workers, getattr(settings, "CULQI_POOL_SIZE", 10)),
+        )
+        try:
+            t0 = time.perf_counter()
+            states, errors, _ = fetch_culqi_states(orders, client, workers)
+            fetch_elapsed = time.perf_counter() - t0
+
+            t1 = time.perf_counter()
+            result = apply_culqi_states(orders, states)
+            apply_elapsed = time.perf_counter() - t1
+            self._report(n, workers, fetch_elapsed, apply_elapsed, errors, result, expected_paid, client, server)
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+            if not options["keep"]:
+                self._cleanup()
+
+    # -------------------
+    def _cleanup(self):
+        Order.objects.filter(code__startswith=f"{BENCH_PREFIX}-").delete()
+
+    def _seed(self, n):
+        Order.objects.bulk_create(
+            [
+                Order(
+                    full_name="Bench Conciliación",
+                    whatsapp="944739301",
+                    address="Prueba de carga",
+                    total=10,
+                    code=f"{BENCH_PREFIX}-{i:06d}",
+                    culqi_order_id=f"ord_rcb_{i:06d}",
+                )
+                for i in range(n)
+            ],
+            batch_size=500,
+        )
+        return list(
+            Order.objects.filter(code__startswith=f"{BENCH_PREFIX}-")
+            .order_by("id")
+            .only("id", "code", "culqi_order_id", "culqi_last_state", "culqi_last_event_at", "payment_status", "paid_at")
+        )
+
+    def _report(self, n, workers, fetch_elapsed, apply_elapsed, errors, result, expected_paid, client, server):
+        self.stdout.write(
+            f"{n} pedidos consultados con {workers} hilos en {fetch_elapsed:.2f}s "
+            f"-> {n / fetch_elapsed:,.0f} consultas/s ({errors} con error, {len(server.connections)} conexiones TCP)"
+        )
+        for op, s in client.stats.snapshot().items():
+            self.stdout.write(f"  {op}: p50={s['p50_ms']}ms p95={s['p95_ms']}ms p99={s['p99_ms']}ms")
+        self.stdout.write(
+            f"  apply_culqi_states: {result['changed']} actualizados ({result['paid']} pagados) en {apply_elapsed:.2f}s"
+        )
+
+        paid = Order.objects.filter(code__startswith=f"{BENCH_PREFIX}-", payment_status="paid").count()
+        history = OrderStatusHistory.objects.filter(
+            order__code__startswith=f"{BENCH_PREFIX}-", source="reconcile"
+        ).count()
+        if errors or paid != expected_paid or history != expected_paid:
+            raise CommandError(
+                f"❌ {paid}/{expected_paid} pagados, {history} en el historial, {errors} errores"
+            )
+        self.stdout.write(self.style.SUCCESS(f"✅ {paid}/{expected_paid} pagados, con historial"))
@@ -0,0 +1,217 @@
+import base64
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+
+from shop.culqi import LatencyStats
+from shop.models import Order, WebhookEvent
+
+BENCH_PREFIX = "WHB"
+EVENT_PREFIX = "evt_bench_"
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class QueryCounter:
+    """Cuenta consultas SQL por tipo de hilo: requests del servidor vs. worker en segundo plano."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        kind = "worker" if threading.current_thread().name.startswith("shop-bg") else "request"
+        with self._lock:
+            self.counts[kind] += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga del webhook de Culqi: crea pedidos de prueba, dispara eventos "
+        "order.status.changed en paralelo (data como dict y como string JSON, con Basic Auth y "
+        "reintentos duplicados) y mide throughput, p50/p95/p99 y consultas SQL por evento. "
+        "Uso: python manage.py bench_webhooks [--orders 500] [--concurrency 16]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=500, help="Pedidos de prueba (2 eventos c/u: pending + paid)")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--dup-rate", type=float, default=0.2, help="Fracción de eventos reenviados (reintentos)")
+        parser.add_argument("--no-auth", action="store_true", help="Sin Basic Auth")
+        parser.add_argument(
+            "--url", default="",
+            help="Webhook de un servidor ya levantado (gunicorn/uvicorn); por defecto se levanta uno en este proceso",
+        )
+        parser.add_argument("--drain-timeout", type=float, default=60, help="Segundos máximos esperando al worker")
+        parser.add_argument("--keep", action="store_true", help="No borrar pedidos/eventos de prueba")
+
+    def handle(self, *args, **options):
+        n = max(1, options["orders"])
+        concurrency = max(1, options["concurrency"])
+        user, pwd = "", ""
+        if not options["no_auth"]:
+            user = os.environ.get("CULQI_WEBHOOK_USER", "").strip() or "bench"
+            pwd = os.environ.get("CULQI_WEBHOOK_PASS", "").strip() or "bench-secret"
+
+        self._cleanup()
+        orders = self._seed(n)
+        events = self._build_events(orders, options["dup_rate"])
+
+        counter = QueryCounter()
+        server = None
+        env_backup = {k: os.environ.get(k) for k in ("CULQI_WEBHOOK_USER", "CULQI_WEBHOOK_PASS")}
+        try:
+            if options["url"]:
+                url = options["url"]
+            else:
+                os.environ["CULQI_WEBHOOK_USER"], os.environ["CULQI_WEBHOOK_PASS"] = user, pwd
+                server = self._start_server(counter)
+                url = f"http://127.0.0.1:{server.server_port}{reverse('culqi_webhook')}"
+
+            stats, statuses, elapsed = self._fire(url, events, concurrency, user, pwd)
+            drain_wait = self._wait_drained(options["drain_timeout"])
+            self._report(n, events, stats, statuses, elapsed, drain_wait, counter, local=server is not None)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+                connection_created.disconnect(counter.install)
+            for key, value in env_backup.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            if not options["keep"]:
+                self._cleanup()
+
+    # -------------------
+    def _cleanup(self):
+        WebhookEvent.objects.filter(event_id__startswith=EVENT_PREFIX).delete()
+        Order.objects.filter(code__startswith=f"{BENCH_PREFIX}-").delete()
+
+    def _seed(self, n):
+        orders = [
+            Order(
+                full_name="Bench Webhook",
+                whatsapp="944739301",
+                address="Prueba de carga",
+                total=10,
+                code=f"{BENCH_PREFIX}-{i:06d}",
+                culqi_order_id=f"ord_bench_{i:06d}",
+            )
+            for i in range(n)
+        ]
+        Order.objects.bulk_create(orders, batch_size=500)
+        return orders
+
+    def _build_events(self, orders, dup_rate):
+        """pending + paid por pedido; data alterna dict / string JSON; algunos por order_number."""
+        events = []
+        for i, order in enumerate(orders):
+            for step, state in enumerate(("pending", "paid")):
+                data = {"state": state, "amount": 1000, "currency_code": "PEN"}
+                if i % 4 == 3:
+                    data["order_number"] = order.code  # sin id: se busca por código
+                else:
+                    data["id"] = order.culqi_order_id
+                evt = {
+                    "object": "event",
+                    "id": f"{EVENT_PREFIX}{i:06d}_{step}",
+                    "type": "order.status.changed",
+                    "data": json.dumps(data) if i % 2 else data,
+                }
+                events.append(json.dumps(evt).encode("utf-8"))
+        events += random.sample(events, int(len(events) * dup_rate))  # reintentos de Culqi
+        random.shuffle(events)
+        return events
+
+    def _start_server(self, counter):
+        for conn in connections.all():
+            counter.install(conn)
+        connection_created.connect(counter.install)
+        server = ThreadedWSGIServer(("127.0.0.1", 0), _QuietHandler, allow_reuse_address=True)
+        server.set_app(get_internal_wsgi_application())
+        threading.Thread(target=server.serve_forever, name="bench-wsgi", daemon=True).start()
+        return server
+
+    def _fire(self, url, events, concurrency, user, pwd):
+        headers = {"Content-Type": "application/json"}
+        if user:
+            headers["Authorization"] = "Basic " + base64.b64encode(f"{user}:{pwd}".encode()).decode()
+        local = threading.local()
+        stats = LatencyStats(window=len(events))
+        statuses = Counter()
+        lock = threading.Lock()
+
+        def send(body):
+            session = getattr(local, "session", None)
+            if session is None:
+                session = local.session = requests.Session()  # keep-alive por hilo, como Culqi
+            t0 = time.perf_counter()
+            try:
+                status = session.post(url, data=body, headers=headers, timeout=30).status_code
+            except requests.RequestException:
+                status = "error"
+            stats.record("webhook", time.perf_counter() - t0, "ok" if status == 200 else f"http_{status}")
+            with lock:
+                statuses[status] += 1
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(send, events))
+        return stats, statuses, time.perf_counter() - t0
+
+    def _wait_drained(self, timeout):
+        t0 = time.perf_counter()
+        while WebhookEvent.objects.filter(event_id__startswith=EVENT_PREFIX, processed_at__isnull=True).exists():
+            if time.perf_counter() - t0 > timeout:
+                raise CommandError(f"La bandeja no se vació en {timeout:.0f}s (¿worker caído?).")
+            time.sleep(0.05)
+        return time.perf_counter() - t0
+
+    def _report(self, n, events, stats, statuses, elapsed, drain_wait, counter, local):
+        s = stats.snapshot()["webhook"]
+        total = len(events)
+        self.stdout.write(
+            f"{total} webhooks ({n} pedidos, {total - 2 * n} duplicados) en {elapsed:.2f}s "
+            f"-> {total / elapsed:,.0f} eventos/s"
+        )
+        self.stdout.write(f"  latencia: p50={s['p50_ms']}ms p95={s['p95_ms']}ms p99={s['p99_ms']}ms")
+        self.stdout.write(f"  respuestas: {dict(statuses)}")
+        self.stdout.write(f"  bandeja vacía {drain_wait:.2f}s después del último webhook")
+        if local:
+            self.stdout.write(
+                f"  SQL por webhook (request): {counter.counts['request'] / total:.2f} | "
+                f"SQL del worker por evento: {counter.counts['worker'] / total:.2f}"
+            )
+
+        stored = WebhookEvent.objects.filter(event_id__startswith=EVENT_PREFIX).count()
+        paid = Order.objects.filter(code__startswith=f"{BENCH_PREFIX}-", payment_status="paid").count()
+        results = Counter(
+            WebhookEvent.objects.filter(event_id__startswith=EVENT_PREFIX).values_list("result", flat=True)
+        )
+        ok = stored == 2 * n and paid == n and statuses.get(200) == total
+        style = self.style.SUCCESS if ok else self.style.ERROR
+        self.stdout.write(style(
+            f"{'✅' if ok else '❌'} {stored}/{2 * n} eventos únicos guardados, {paid}/{n} pedidos pagados, "
+            f"resultados: {dict(results)}"
+        ))
@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from shop.fragments import bump_product_versions
+from shop.images import refresh_variants, variants_outdated
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera las variantes responsive (WebP/JPEG) de las fotos de productos existentes. "
+        "Uso: python manage.py build_image_variants [--workers 4] [--force]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Hilos en paralelo (Pillow libera el GIL)")
+        parser.add_argument("--force", action="store_true", help="Regenerar aunque ya existan")
+        parser.add_argument("--batch", type=int, default=200, help="Productos por bulk_update")
+
+    def handle(self, *args, **options):
+        force = options["force"]
+        batch_size = max(1, options["batch"])
+
+        products = [
+            p for p in Product.objects.exclude(image="").exclude(image__isnull=True).only("id", "image", "image_variants")
+            if force or variants_outdated(p)
+        ]
+        if not products:
+            self.stdout.write("No hay fotos pendientes.")
+            return
+
+        def work(p):
+            try:
+                return p, refresh_variants(p, force=force), None
+            except Exception as exc:  # foto corrupta / faltante: seguimos con las demás
+                return p, None, exc
+            finally:
+                close_old_connections()
+
+        t0 = time.perf_counter()
+        done, failed, pending = 0, 0, []
+
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as pool:
+            futures = [pool.submit(work, p) for p in products]
+            for fut in as_completed(futures):
+                p, variants, exc = fut.result()
+                if exc is not None:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f"⚠ Producto {p.id}: {exc}"))
+                    continue
+                p.image_variants = variants
+                pending.append(p)
+                if len(pending) >= batch_size:
+                    done += self._flush(pending)
+
+        done += self._flush(pending)
+        elapsed = time.perf_counter() - t0
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {done} productos con variantes, {failed} con error, en {elapsed:.1f}s "
+            f"({done / elapsed if elapsed else 0:.1f} fotos/s)."
+        ))
+
+    def _flush(self, pending):
+        if not pending:
+            return 0
+        Product.objects.bulk_update(pending, ["image_variants"])
+        bump_product_versions([p.id for p in pending])
+        n = len(pending)
+        pending.clear()
+        return n
@@ -0,0 +1,80 @@
+import sys
+import time
+from datetime import datetime, time as dt_time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shop.exports import EXPORTS, iter_csv, write_xlsx
+from shop.models import Order
+
+
+def _day(value, end=False):
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Fecha inválida: {value} (usa AAAA-MM-DD)")
+    return timezone.make_aware(datetime.combine(day, dt_time.max if end else dt_time.min))
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta pedidos / items a CSV o Excel con memoria constante (sirve para millones de filas). "
+        "Uso: python manage.py export_orders --format xlsx -o pedidos.xlsx [--since 2026-01-01] [--status delivered]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+        parser.add_argument("--kind", choices=["orders", "items"], default="orders", help="Solo CSV (Excel lleva ambas hojas)")
+        parser.add_argument("-o", "--output", default="", help="Archivo de salida (CSV: stdout si se omite)")
+        parser.add_argument("--since", default="", help="Creados desde AAAA-MM-DD")
+        parser.add_argument("--until", default="", help="Creados hasta AAAA-MM-DD (inclusive)")
+        parser.add_argument("--status", action="append", default=[], help="Estado (se puede repetir)")
+        parser.add_argument("--payment-status", action="append", default=[], help="Estado de pago (se puede repetir)")
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if options["since"]:
+            orders = orders.filter(created_at__gte=_day(options["since"]))
+        if options["until"]:
+            orders = orders.filter(created_at__lte=_day(options["until"], end=True))
+        if options["status"]:
+            orders = orders.filter(status__in=options["status"])
+        if options["payment_status"]:
+            orders = orders.filter(payment_status__in=options["payment_status"])
+
+        t0 = time.perf_counter()
+        if options["format"] == "xlsx":
+            if not options["output"]:
+                raise CommandError("Excel necesita --output archivo.xlsx")
+            with open(options["output"], "wb") as fh:
+                counts = write_xlsx(orders, fh)
+            rows = sum(counts.values())
+            detail = ", ".join(f"{k}={v}" for k, v in counts.items())
+        else:
+            headers, row_iter = EXPORTS[options["kind"]](orders)
+            counted = [0]
+
+            def count_rows(it):
+                for row in it:
+                    counted[0] += 1
+                    yield row
+
+            out = open(options["output"], "w", encoding="utf-8", newline="") if options["output"] else sys.stdout
+            try:
+                for line in iter_csv(headers, count_rows(row_iter)):
+                    out.write(line)
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            rows = counted[0]
+            detail = options["kind"]
+
+        elapsed = time.perf_counter() - t0
+        if options["output"]:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {rows} filas ({detail}) en {elapsed:.2f}s -> {rows / elapsed if elapsed else 0:,.0f} filas/s: "
+                f"{options['output']}"
+            ))
+        else:
+            self.stderr.write(f"{rows} filas en {elapsed:.2f}s")
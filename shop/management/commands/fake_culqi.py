@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from shop.culqi_fake import FakeCulqiServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Servidor Culqi falso para desarrollo y pruebas de carga (no cobra nada). "
+        "Uso: python manage.py fake_culqi [--port 8765] [--latency 0.05] [--fail-rate 0.1]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=0.0, help="Segundos de espera por request")
+        parser.add_argument("--fail-rate", type=float, default=0.0, help="Fracción de respuestas 503 (0-1)")
+        parser.add_argument("--quiet", action="store_true", help="No loguear cada request")
+
+    def handle(self, *args, **options):
+        server = FakeCulqiServer(
+            (options["host"], options["port"]),
+            latency=options["latency"], fail_rate=options["fail_rate"], verbose=not options["quiet"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ Culqi falso en {server.base_url}"))
+        self.stdout.write(f"   export CULQI_API_BASE={server.base_url}")
+        self.stdout.write(f"   marcar pagada: curl -X POST -H 'Authorization: Bearer x' {server.base_url}/orders/<id>/pay")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.imports import DEFAULT_CHUNK, ProductImportError, import_products
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea/actualiza productos desde un CSV o Excel, por SKU y por bloques. "
+        "Uso: python manage.py import_products catalogo.xlsx [--dry-run] [--chunk 1000]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Archivo .csv o .xlsx")
+        parser.add_argument("--dry-run", action="store_true", help="Mostrar el diff sin guardar")
+        parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="Filas por transacción")
+        parser.add_argument("--diff-limit", type=int, default=50, help="Líneas de diff a mostrar")
+        parser.add_argument("--quiet", action="store_true", help="Sin progreso por bloque")
+
+    def handle(self, *args, **options):
+        def progress(report):
+            if not options["quiet"]:
+                self.stdout.write(f"  bloque {report.chunks}: {report.rows} filas ({report.rows / report.elapsed:,.0f}/s)")
+
+        try:
+            with open(options["path"], "rb") as fh:
+                report = import_products(
+                    fh, options["path"], dry_run=options["dry_run"], chunk_size=max(1, options["chunk"]),
+                    diff_limit=options["diff_limit"], progress=progress,
+                )
+        except (OSError, ProductImportError) as exc:
+            raise CommandError(str(exc))
+
+        for line in report.diff:
+            self.stdout.write(line)
+        for line, message in report.errors:
+            self.stdout.write(self.style.WARNING(f"⚠ fila {line}: {message}"))
+        if report.error_count > len(report.errors):
+            self.stdout.write(self.style.WARNING(f"⚠ ... y {report.error_count - len(report.errors)} errores más"))
+        self.stdout.write(self.style.SUCCESS(f"✅ {report.summary()}"))
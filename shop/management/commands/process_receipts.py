@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.models import Order
+from shop.receipts import process_receipt
+
+
+class Command(BaseCommand):
+    help = (
+        "Normaliza comprobantes pendientes (reduce, quita metadata, genera miniatura). "
+        "Sirve para comprobantes antiguos o si el proceso web se reinició a mitad. "
+        "Uso: python manage.py process_receipts [--loop 30]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=500)
+        parser.add_argument("--loop", type=int, default=0, help="Repetir cada N segundos (modo worker)")
+
+    def handle(self, *args, **options):
+        while True:
+            ids = list(
+                Order.objects.exclude(receipt_image="")
+                .filter(receipt_image__isnull=False, receipt_processed_at__isnull=True)
+                .order_by("id")
+                .values_list("id", flat=True)[: options["limit"]]
+            )
+            done = 0
+            for order_id in ids:
+                try:
+                    done += process_receipt(order_id)
+                except Exception as exc:
+                    self.stdout.write(self.style.WARNING(f"⚠ Pedido {order_id}: {exc}"))
+            if ids or not options["loop"]:
+                self.stdout.write(self.style.SUCCESS(f"✅ {done}/{len(ids)} comprobantes procesados."))
+            if not options["loop"]:
+                return
+            time.sleep(options["loop"])
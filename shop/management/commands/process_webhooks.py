@@ -0,0 +1,40 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.models import WebhookEvent
+from shop.payments import drain
+
+
+class Command(BaseCommand):
+    help = (
+        "Aplica los webhooks de Culqi pendientes en la bandeja (por lotes). "
+        "Normalmente los procesa el propio proceso web; esto recoge lo que quedó si se reinició. "
+        "Uso: python manage.py process_webhooks [--loop 10] [--prune-days 30]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=0, help="Eventos por lote (0 = SHOP_WEBHOOK_BATCH)")
+        parser.add_argument("--loop", type=int, default=0, help="Repetir cada N segundos (modo worker)")
+        parser.add_argument("--prune-days", type=int, default=0, help="Borrar eventos procesados más antiguos que N días")
+
+    def handle(self, *args, **options):
+        if options["prune_days"]:
+            cutoff = timezone.now() - timedelta(days=options["prune_days"])
+            deleted, _ = WebhookEvent.objects.filter(processed_at__lt=cutoff).delete()
+            self.stdout.write(f"🧹 {deleted} eventos antiguos borrados.")
+
+        while True:
+            t0 = time.perf_counter()
+            totals = drain(options["batch"] or None)
+            elapsed = time.perf_counter() - t0
+            count = sum(v for k, v in totals.items() if k not in ("paid", "failed"))
+            if count or not options["loop"]:
+                detail = ", ".join(f"{k}={v}" for k, v in sorted(totals.items())) or "nada pendiente"
+                rate = f" ({count / elapsed:,.0f}/s)" if count and elapsed else ""
+                self.stdout.write(self.style.SUCCESS(f"✅ {count} webhooks en {elapsed:.2f}s{rate}: {detail}"))
+            if not options["loop"]:
+                return
+            time.sleep(options["loop"])
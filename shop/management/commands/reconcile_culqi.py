@@ -0,0 +1,63 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.culqi import build_client
+from shop.payments import apply_culqi_states, fetch_culqi_states, reconcile_candidates
+
+
+class Command(BaseCommand):
+    help = (
+        "Consulta a Culqi el estado de los pedidos sin pagar (por si se perdió un webhook) "
+        "y los actualiza con un solo bulk_update. "
+        "Uso: python manage.py reconcile_culqi [--hours 48] [--workers 8] [--dry-run] "
+        "(para medirlo contra un Culqi falso: bench_reconcile)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=48, help="Solo pedidos creados en las últimas N horas")
+        parser.add_argument("--limit", type=int, default=0, help="Máximo de pedidos (0 = todos)")
+        parser.add_argument("--workers", type=int, default=8, help="Consultas simultáneas (una conexión cada una)")
+        parser.add_argument("--dry-run", action="store_true", help="Solo mostrar qué cambiaría")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options["hours"])
+        orders = reconcile_candidates(since, options["limit"] or None)
+        if not orders:
+            self.stdout.write(self.style.SUCCESS("✅ No hay pedidos Culqi pendientes de conciliar."))
+            return
+
+        workers = max(1, options["workers"])
+        # un solo pool de conexiones para todos los hilos
+        client = build_client(pool_size=max(workers, getattr(settings, "CULQI_POOL_SIZE", 10)))
+        t0 = time.perf_counter()
+        try:
+            states, errors, unavailable = fetch_culqi_states(orders, client, workers)
+            fetch_elapsed = time.perf_counter() - t0
+        finally:
+            client.close()
+
+        self.stdout.write(
+            f"{len(orders)} pedidos consultados con {workers} hilos en {fetch_elapsed:.2f}s "
+            f"-> {len(orders) / fetch_elapsed:,.0f} consultas/s ({errors} con error)"
+        )
+        for op, s in client.stats.snapshot().items():
+            self.stdout.write(f"  {op}: p50={s['p50_ms']}ms p95={s['p95_ms']}ms p99={s['p99_ms']}ms")
+        if unavailable and client.breaker.state != "closed":
+            self.stdout.write(self.style.WARNING("⚠️ Culqi no responde (circuito abierto); se cortó antes de tiempo."))
+
+        if options["dry_run"]:
+            paid = sum(1 for state, _ in states.values() if state == "paid")
+            changed = sum(1 for o in orders if o.pk in states and states[o.pk][0] != o.culqi_last_state)
+            self.stdout.write(f"(dry-run) {changed} cambiarían de estado, {paid} quedarían pagados.")
+            return
+
+        t1 = time.perf_counter()
+        result = apply_culqi_states(orders, states)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {result['changed']} pedidos actualizados ({result['paid']} pagados) "
+            f"en {time.perf_counter() - t1:.2f}s."
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.inventory import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = (
+        "Devuelve al stock las reservas vencidas de pedidos no pagados. "
+        "Uso: python manage.py release_expired_holds [--loop 60] (cron o worker)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", type=int, default=0, help="Repetir cada N segundos (modo worker)")
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_holds()
+            if released or not options["loop"]:
+                self.stdout.write(self.style.SUCCESS(f"✅ {released} reservas vencidas liberadas."))
+            if not options["loop"]:
+                return
+            time.sleep(options["loop"])
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def install_search(apps, schema_editor):
+    from shop import search
+    search.install(schema_editor.connection)
+
+
+def uninstall_search(apps, schema_editor):
+    from shop import search
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_order_culqi_last_event_at_order_culqi_last_state_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-18 03:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='receipt_processed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='receipt_thumb',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='receipts/thumbs/', verbose_name='Miniatura'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-18 03:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_order_receipt_processing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('qty', models.PositiveIntegerField()),
+                ('state', models.CharField(choices=[('active', 'Activa'), ('consumed', 'Confirmada'), ('released', 'Liberada')], default='active', max_length=10)),
+                ('expires_at', models.DateTimeField(verbose_name='Vence')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='shop.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='shop.product')),
+            ],
+            options={
+                'verbose_name': 'Reserva de stock',
+                'verbose_name_plural': 'Reservas de stock',
+                'indexes': [models.Index(condition=models.Q(('state', 'active')), fields=['expires_at'], name='stockhold_active_exp_idx'), models.Index(condition=models.Q(('state', 'active')), fields=['product'], name='stockhold_active_prod_idx')],
+            },
+        ),
+    ]
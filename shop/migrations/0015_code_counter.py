@@ -0,0 +1,35 @@
+# Generated by Django 5.2.10 on 2026-10-18 03:36
+
+from django.db import migrations, models
+
+
+def install_sequence(apps, schema_editor):
+    from shop import codes
+    codes.install_sequence(schema_editor.connection)
+
+
+def uninstall_sequence(apps, schema_editor):
+    from shop import codes
+    codes.uninstall_sequence(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeCounter',
+            fields=[
+                ('name', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Contador de códigos',
+                'verbose_name_plural': 'Contadores de códigos',
+            },
+        ),
+        migrations.RunPython(install_sequence, uninstall_sequence),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.10 on 2026-10-18 03:41
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+BATCH = 1000
+
+
+def backfill_whatsapp_e164(apps, schema_editor):
+    """Por lotes de BATCH (keyset por id), cada lote en su propia transacción."""
+    from shop.phones import normalize_whatsapp
+
+    Order = apps.get_model("shop", "Order")
+    db = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        batch = list(
+            Order.objects.using(db).filter(id__gt=last_id).order_by("id").only("id", "whatsapp")[:BATCH]
+        )
+        if not batch:
+            break
+        for order in batch:
+            order.whatsapp_e164 = normalize_whatsapp(order.whatsapp)
+        with transaction.atomic(using=db):
+            Order.objects.using(db).bulk_update(batch, ["whatsapp_e164"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    # sin transacción global: cada lote se confirma por separado
+    atomic = False
+
+    dependencies = [
+        ('shop', '0015_code_counter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='whatsapp_e164',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16, verbose_name='WhatsApp (E.164)'),
+        ),
+        migrations.RunPython(backfill_whatsapp_e164, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['code', 'whatsapp_e164'], name='order_track_idx'),
+        ),
+    ]
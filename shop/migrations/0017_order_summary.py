@@ -0,0 +1,64 @@
+# Generated by Django 5.2.10 on 2026-10-18 03:42
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+BATCH = 1000
+
+
+def backfill_summary(apps, schema_editor):
+    """item_count / first_product_name por lotes de pedidos (keyset por id)."""
+    Order = apps.get_model("shop", "Order")
+    OrderItem = apps.get_model("shop", "OrderItem")
+    db = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        ids = list(
+            Order.objects.using(db).filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:BATCH]
+        )
+        if not ids:
+            break
+        summary = {oid: [0, ""] for oid in ids}
+        rows = (
+            OrderItem.objects.using(db).filter(order_id__in=ids)
+            .order_by("order_id", "id")
+            .values_list("order_id", "qty", "product__name")
+        )
+        for order_id, qty, name in rows:
+            entry = summary[order_id]
+            entry[0] += qty
+            entry[1] = entry[1] or name[:120]
+        with transaction.atomic(using=db):
+            Order.objects.using(db).bulk_update(
+                [Order(id=oid, item_count=count, first_product_name=name) for oid, (count, name) in summary.items()],
+                ["item_count", "first_product_name"],
+            )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # sin transacción global: cada lote se confirma por separado
+    atomic = False
+
+    dependencies = [
+        ('shop', '0016_order_whatsapp_e164'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='first_product_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=120, verbose_name='Primer producto'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Unidades'),
+        ),
+        migrations.RunPython(backfill_summary, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_user_recent_idx'),
+        ),
+    ]
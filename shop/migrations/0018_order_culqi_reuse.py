@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-18 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_order_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='culqi_amount',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='culqi_expires_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
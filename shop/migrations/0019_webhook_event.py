@@ -0,0 +1,35 @@
+# Generated by Django 5.2.10 on 2026-10-18 03:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_order_culqi_reuse'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(default='culqi', max_length=20)),
+                ('dedup_key', models.CharField(max_length=64, unique=True)),
+                ('event_id', models.CharField(blank=True, default='', max_length=80)),
+                ('event_type', models.CharField(blank=True, default='', max_length=60)),
+                ('payload', models.TextField()),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('result', models.CharField(blank=True, choices=[('', 'Pendiente'), ('applied', 'Aplicado'), ('unchanged', 'Sin cambios'), ('ignored', 'Ignorado'), ('order_not_found', 'Pedido no encontrado'), ('error', 'Error')], default='', max_length=20)),
+                ('last_error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'verbose_name': 'Webhook recibido',
+                'verbose_name_plural': 'Webhooks recibidos',
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='webhook_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.10 on 2026-10-18 03:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_webhook_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('status', 'Estado'), ('payment_status', 'Pago')], max_length=20)),
+                ('from_state', models.CharField(max_length=20)),
+                ('to_state', models.CharField(max_length=20)),
+                ('source', models.CharField(blank=True, default='', max_length=20)),
+                ('note', models.CharField(blank=True, default='', max_length=200)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_history', to='shop.order')),
+            ],
+            options={
+                'verbose_name': 'Cambio de estado',
+                'verbose_name_plural': 'Historial de estados',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['order', '-created_at'], name='order_history_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-18 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0021_product_sku'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='code',
+            field=models.CharField(editable=False, max_length=20, unique=True),
+        ),
+    ]
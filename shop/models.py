@@ -1,27 +1,60 @@
+import uuid
+
 from django.conf import settings
 from django.db import models
 from django.utils import timezone
-import uuid
 
 
 class Product(models.Model):
+    # ✅ código estable del producto: la importación masiva (shop/imports.py) lo usa para encontrarlo
+    sku = models.CharField("SKU", max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=120)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to="products/", blank=True, null=True)
+    # ✅ variantes WebP/JPEG por ancho (las genera shop/images.py al subir la foto)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # ✅ catálogo: solo activos, mismo orden que product_list (id = desempate del cursor)
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=models.Q(is_active=True),
+                name="product_active_new_idx",
+            ),
+            models.Index(
+                fields=["price", "id"],
+                condition=models.Q(is_active=True),
+                name="product_active_price_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
 
 def _new_order_code() -> str:
-    # Código corto tipo: DANI-4F8A2C
+    # Solo para migraciones antiguas (0007): los pedidos nuevos reciben su código en Order.save()
     return "DANI-" + uuid.uuid4().hex[:6].upper()
 
 
+class CodeCounter(models.Model):
+    """Contador para reservar bloques de códigos (motores sin secuencias)."""
+    name = models.CharField(max_length=30, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Contador de códigos"
+        verbose_name_plural = "Contadores de códigos"
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
 class Address(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="addresses")
     label = models.CharField("Etiqueta", max_length=60, default="Casa")  # Casa / Trabajo / etc.
@@ -56,7 +89,8 @@ class Order(models.Model):
         ("paid", "Pagado"),
     ]
 
-    code = models.CharField(max_length=20, unique=True, default=_new_order_code, editable=False)
+    # ✅ se asigna en save() (contador por bloques, sin choques; ver shop/codes.py)
+    code = models.CharField(max_length=20, unique=True, editable=False)
 
     # ✅ Login opcional: si el cliente está logueado, guardas su user
     user = models.ForeignKey(
@@ -65,6 +99,8 @@ class Order(models.Model):
 
     full_name = models.CharField("Nombre completo", max_length=120, default="")
     whatsapp = models.CharField("WhatsApp", max_length=30, default="")
+    # ✅ el mismo número en E.164 (+51...), lo llena una señal; se usa para buscar el pedido
+    whatsapp_e164 = models.CharField("WhatsApp (E.164)", max_length=16, blank=True, default="", editable=False)
 
     # ✅ delivery por coordinación
     address = models.CharField("Dirección", max_length=180, blank=True, null=True)
@@ -72,6 +108,9 @@ class Order(models.Model):
     notes = models.TextField("Notas", blank=True, null=True)
 
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # ✅ resumen para "Mis pedidos" (sin leer los items); lo mantiene shop/orders.py
+    item_count = models.PositiveIntegerField("Unidades", default=0, editable=False)
+    first_product_name = models.CharField("Primer producto", max_length=120, blank=True, default="", editable=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="new")
 
     payment_status = models.CharField(max_length=20, choices=PAYMENT_CHOICES, default="unpaid")
@@ -79,20 +118,44 @@ class Order(models.Model):
 
     receipt_image = models.ImageField("Comprobante", upload_to="receipts/", blank=True, null=True)
     receipt_uploaded_at = models.DateTimeField(blank=True, null=True)
+    # ✅ lo llena shop/receipts.py en segundo plano (imagen reducida + miniatura)
+    receipt_thumb = models.ImageField("Miniatura", upload_to="receipts/thumbs/", blank=True, null=True, editable=False)
+    receipt_processed_at = models.DateTimeField(blank=True, null=True, editable=False)
 
     # ✅ Culqi (para QR con monto automático + webhook)
     culqi_order_id = models.CharField(max_length=60, blank=True, null=True, unique=True)
     culqi_last_state = models.CharField(max_length=30, blank=True, default="")
     culqi_last_event_at = models.DateTimeField(blank=True, null=True)
+    # ✅ orden Culqi vigente: se reutiliza mientras no venza y el monto (céntimos) no cambie
+    culqi_amount = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    culqi_expires_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    # ✅ token del formulario de checkout: reintentos / doble clic devuelven el mismo pedido
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # ✅ seguimiento de invitados: código + WhatsApp normalizado en una sola búsqueda
+            models.Index(fields=["code", "whatsapp_e164"], name="order_track_idx"),
+            # ✅ "Mis pedidos": mismo orden que el cursor (id = desempate)
+            models.Index(fields=["user", "-created_at", "-id"], name="order_user_recent_idx"),
+        ]
 
     def __str__(self):
         return f"{self.code} - {self.full_name}"
 
+    def save(self, *args, **kwargs):
+        # Código corto tipo: DANI-7K2M9QX. Solo al guardar: Order() no gasta números ni toca la DB
+        if not self.code:
+            from .codes import new_order_code
+            self.code = new_order_code()
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "code"}
+        super().save(*args, **kwargs)
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
@@ -104,3 +167,106 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.product.name} x{self.qty}"
+
+
+class StockHold(models.Model):
+    """
+    Unidades apartadas para un pedido aún no pagado/confirmado.
+
+    El stock se descuenta en el checkout (Product.stock ya es lo disponible);
+    la reserva registra cuánto devolver si el pedido no se paga a tiempo.
+    """
+    STATE_CHOICES = [
+        ("active", "Activa"),
+        ("consumed", "Confirmada"),
+        ("released", "Liberada"),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="holds")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="holds")
+    qty = models.PositiveIntegerField()
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default="active")
+    expires_at = models.DateTimeField("Vence")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Reserva de stock"
+        verbose_name_plural = "Reservas de stock"
+        indexes = [
+            # ✅ barrido de vencidas y "reservado por producto" sin recorrer el histórico
+            models.Index(fields=["expires_at"], condition=models.Q(state="active"), name="stockhold_active_exp_idx"),
+            models.Index(fields=["product"], condition=models.Q(state="active"), name="stockhold_active_prod_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} x{self.qty} ({self.state})"
+
+
+class WebhookEvent(models.Model):
+    """
+    Bandeja de entrada de webhooks (solo se agrega).
+
+    El endpoint guarda el evento con un INSERT y responde 200; shop/payments.py
+    lo aplica después por lotes. ``dedup_key`` evita procesar dos veces los
+    reintentos de Culqi.
+    """
+    RESULT_CHOICES = [
+        ("", "Pendiente"),
+        ("applied", "Aplicado"),
+        ("unchanged", "Sin cambios"),
+        ("ignored", "Ignorado"),
+        ("order_not_found", "Pedido no encontrado"),
+        ("error", "Error"),
+    ]
+
+    provider = models.CharField(max_length=20, default="culqi")
+    dedup_key = models.CharField(max_length=64, unique=True)
+    event_id = models.CharField(max_length=80, blank=True, default="")
+    event_type = models.CharField(max_length=60, blank=True, default="")
+    payload = models.TextField()
+    received_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    result = models.CharField(max_length=20, choices=RESULT_CHOICES, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        verbose_name = "Webhook recibido"
+        verbose_name_plural = "Webhooks recibidos"
+        indexes = [
+            # ✅ el worker solo recorre lo pendiente (índice chico aunque el histórico crezca)
+            models.Index(fields=["id"], condition=models.Q(processed_at__isnull=True), name="webhook_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.event_type} {self.event_id or self.dedup_key[:12]}"
+
+
+class OrderStatusHistory(models.Model):
+    """Historial de cambios de estado (solo se agrega; lo escribe shop/transitions.py)."""
+    FIELD_CHOICES = [
+        ("status", "Estado"),
+        ("payment_status", "Pago"),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="status_history")
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    from_state = models.CharField(max_length=20)
+    to_state = models.CharField(max_length=20)
+    source = models.CharField(max_length=20, blank=True, default="")  # admin / webhook / reconcile / cliente
+    changed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    note = models.CharField(max_length=200, blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Cambio de estado"
+        verbose_name_plural = "Historial de estados"
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            models.Index(fields=["order", "-created_at"], name="order_history_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.order_id} {self.field}: {self.from_state} → {self.to_state}"
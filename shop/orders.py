@@ -0,0 +1,154 @@
+"""
+Creación de pedidos (checkout) en una sola transacción.
+
+- Bloquea las filas de Product en orden de id (``select_for_update``) para que
+  dos compras simultáneas no se lleven la misma última unidad, y sin deadlocks.
+- Descuenta stock con un único UPDATE condicional (``stock >= qty`` por fila).
+- Inserta todos los OrderItem con un solo ``bulk_create``.
+- Deja reservas (StockHold) con vencimiento: si no se paga, el stock vuelve.
+
+Así el número de consultas no depende de la cantidad de líneas del carrito.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .codes import new_order_code
+from .fragments import bump_product_versions
+from .inventory import create_holds, release_expired_holds
+from .models import Order, OrderItem, Product
+
+
+class OutOfStock(Exception):
+    """Ninguna línea del carrito tiene stock (o el stock cambió durante la compra)."""
+
+
+class AlreadyPlaced(Exception):
+    """El token de checkout ya creó un pedido (doble clic / reintento)."""
+
+    def __init__(self, order):
+        super().__init__(order.code)
+        self.order = order
+
+
+def find_placed_order(idempotency_key):
+    if not idempotency_key:
+        return None
+    return Order.objects.filter(idempotency_key=idempotency_key).first()
+
+
+def place_order(form, cart: dict, user=None, idempotency_key=None):
+    """
+    Crea el Order del ``form`` (CheckoutForm válido) con las líneas de ``cart``.
+    Devuelve (order, adjusted): adjusted=True si alguna cantidad se redujo por stock.
+    Lanza AlreadyPlaced si ``idempotency_key`` ya generó un pedido.
+    """
+    try:
+        return _place_order(form, cart, user, idempotency_key or None)
+    except IntegrityError:
+        # dos envíos simultáneos con el mismo token: ganó el otro
+        existing = find_placed_order(idempotency_key)
+        if existing is None:
+            raise
+        raise AlreadyPlaced(existing)
+
+
+def _place_order(form, cart, user, idempotency_key):
+    ids = sorted(int(pid) for pid in cart)
+
+    # devolver primero las reservas vencidas de estos productos (por si no corre el barrido)
+    release_expired_holds(product_ids=ids)
+
+    # el código se pide antes de abrir la transacción: sale del bloque en memoria
+    # (dentro de ella, sin secuencia de Postgres, costaría un UPDATE al contador por pedido)
+    code = new_order_code()
+
+    with transaction.atomic():
+        products = list(
+            Product.objects.select_for_update()
+            .filter(id__in=ids, is_active=True)
+            .order_by("id")
+        )
+
+        # con las filas ya bloqueadas, un envío repetido ve el pedido del primero
+        existing = find_placed_order(idempotency_key)
+        if existing is not None:
+            raise AlreadyPlaced(existing)
+
+        lines = []
+        adjusted = False
+        for p in products:
+            want = int(cart.get(str(p.id), 0))
+            qty = min(want, p.stock)
+            if qty != want:
+                adjusted = True
+            if qty > 0:
+                lines.append((p, qty))
+
+        if len(products) != len(ids):
+            adjusted = True
+        if not lines:
+            raise OutOfStock()
+
+        total = sum((p.price * qty for p, qty in lines), Decimal("0.00"))
+
+        order = form.save(commit=False)
+        order.code = code
+        # ✅ si está logueado, el pedido queda “de su cuenta”
+        if user is not None and user.is_authenticated:
+            order.user = user
+        order.total = total
+        order.status = "new"
+        order.payment_status = getattr(order, "payment_status", "unpaid")  # por si existe
+        order.idempotency_key = idempotency_key
+        order.item_count = sum(qty for _, qty in lines)
+        order.first_product_name = lines[0][0].name[:120]
+        order.save()
+
+        # un solo UPDATE: stock = stock - qty, solo si alcanza en cada fila
+        qty_by_id = Case(
+            *[When(id=p.id, then=Value(qty)) for p, qty in lines],
+            output_field=IntegerField(),
+        )
+        updated = (
+            Product.objects.filter(id__in=[p.id for p, _ in lines], stock__gte=qty_by_id)
+            .update(stock=F("stock") - qty_by_id)
+        )
+        if updated != len(lines):
+            # otra compra ganó la carrera (p.ej. SQLite no bloquea filas): deshacer todo
+            raise OutOfStock()
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=p,
+                qty=qty,
+                unit_price=p.price,
+                subtotal=p.price * qty,
+            )
+            for p, qty in lines
+        ])
+
+        create_holds(order, lines)
+        bump_product_versions([p.id for p, _ in lines])
+
+    return order, adjusted
+
+
+def refresh_order_summaries(order_ids):
+    """Recalcula item_count / first_product_name (p.ej. si se editan items en el admin)."""
+    order_ids = list(order_ids)
+    summary = {oid: [0, ""] for oid in order_ids}
+    rows = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .order_by("order_id", "id")
+        .values_list("order_id", "qty", "product__name")
+    )
+    for order_id, qty, name in rows:
+        entry = summary[order_id]
+        entry[0] += qty
+        entry[1] = entry[1] or name[:120]
+
+    orders = [Order(id=oid, item_count=count, first_product_name=name) for oid, (count, name) in summary.items()]
+    Order.objects.bulk_update(orders, ["item_count", "first_product_name"])
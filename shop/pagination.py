@@ -0,0 +1,191 @@
+"""
+Paginación por cursor (keyset).
+
+En vez de OFFSET, cada página filtra "después de la última fila vista" sobre
+las mismas columnas del ORDER BY (con ``id`` como desempate), así la página N
+cuesta lo mismo que la página 1. El cursor es opaco para el cliente
+(base64 de un JSON con los valores de la última/primera fila).
+"""
+import base64
+import binascii
+import json
+import math
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils import timezone
+
+
+@dataclass
+class KeysetPage:
+    object_list: list
+    next_cursor: str = ""
+    prev_cursor: str = ""
+
+    @property
+    def has_next(self):
+        return bool(self.next_cursor)
+
+    @property
+    def has_prev(self):
+        return bool(self.prev_cursor)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(tag: str, direction: str, values) -> str:
+    raw = json.dumps({"o": tag, "d": direction, "v": [_jsonable(v) for v in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, tag: str, size: int):
+    """
+    Devuelve (direction, values) o None si el cursor no es válido
+    o pertenece a otro orden (en ese caso se muestra la primera página).
+    Solo revisa la forma: los tipos los valida ``clean_cursor_values``.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(data, dict) or data.get("o") != tag:
+        return None
+    direction, values = data.get("d"), data.get("v")
+    if direction not in ("next", "prev") or not isinstance(values, list) or len(values) != size:
+        return None
+    return direction, values
+
+
+def _ordering_field(qs, name):
+    annotation = qs.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field  # p.ej. search_rank (FloatField)
+    return qs.model._meta.get_field(name)
+
+
+def clean_cursor_values(qs, ordering, values):
+    """
+    Convierte y valida los valores del cursor con el campo de cada columna.
+    Devuelve None si alguno no sirve (cursor manipulado o de otra versión).
+    """
+    cleaned = []
+    for field_name, value in zip(ordering, values):
+        if value is None or not isinstance(value, (str, int, float)) or isinstance(value, bool):
+            return None
+        try:
+            # clean = to_python + validadores (rango del id, max_digits del precio…)
+            value = _ordering_field(qs, field_name.lstrip("-")).clean(value, None)
+        except (FieldDoesNotExist, ValidationError, ValueError, TypeError, ArithmeticError):
+            return None
+        if value is None or (isinstance(value, float) and not math.isfinite(value)):
+            return None
+        if isinstance(value, datetime) and timezone.is_naive(value) and settings.USE_TZ:
+            value = timezone.make_aware(value)
+        cleaned.append(value)
+    return cleaned
+
+
+def _decode(qs, ordering, cursor: str, tag: str):
+    decoded = decode_cursor(cursor, tag, len(ordering))
+    if decoded is None:
+        return None
+    values = clean_cursor_values(qs, ordering, decoded[1])
+    if values is None:
+        return None
+    return decoded[0], values
+
+
+def _keyset_filter(ordering, values, forward: bool) -> Q:
+    """
+    (a, b, c) > (va, vb, vc) respetando la dirección de cada columna:
+    a > va OR (a = va AND b > vb) OR (a = va AND b = vb AND c > vc)
+    """
+    cond = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        desc = field.startswith("-")
+        name = field.lstrip("-")
+        op = "lt" if desc == forward else "gt"
+        cond |= equal & Q(**{f"{name}__{op}": value})
+        equal &= Q(**{name: value})
+    return cond
+
+
+def _reverse(ordering):
+    return [f[1:] if f.startswith("-") else "-" + f for f in ordering]
+
+
+def _row_values(obj, ordering):
+    return [getattr(obj, f.lstrip("-")) for f in ordering]
+
+
+def keyset_queryset(qs, ordering, cursor: str = "", per_page: int = 24, tag: str = ""):
+    """
+    Queryset exacto (filtrado, ordenado y con LIMIT) que ejecuta una página.
+    Útil para inspeccionar el plan con ``.explain()``.
+    """
+    ordering = list(ordering)
+    decoded = _decode(qs, ordering, cursor, tag)
+    if decoded is None:
+        return qs.order_by(*ordering)[: per_page + 1]
+    direction, values = decoded
+    forward = direction == "next"
+    order_by = ordering if forward else _reverse(ordering)
+    return qs.filter(_keyset_filter(ordering, values, forward)).order_by(*order_by)[: per_page + 1]
+
+
+def keyset_paginate(qs, ordering, cursor: str = "", per_page: int = 24, tag: str = "") -> KeysetPage:
+    """
+    ``ordering`` debe terminar en una columna única (normalmente ``id``/``-id``).
+    ``tag`` identifica el orden para invalidar cursores de otro orden.
+    """
+    ordering = list(ordering)
+    decoded = _decode(qs, ordering, cursor, tag)
+    rows = list(keyset_queryset(qs, ordering, cursor, per_page, tag))
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if decoded is None:
+        page = KeysetPage(rows)
+        if more:
+            page.next_cursor = encode_cursor(tag, "next", _row_values(rows[-1], ordering))
+        return page
+
+    forward = decoded[0] == "next"
+    if not forward:
+        rows.reverse()
+
+    page = KeysetPage(rows)
+    if not rows:
+        return page
+
+    first, last = _row_values(rows[0], ordering), _row_values(rows[-1], ordering)
+    if forward:
+        # veníamos de una página anterior, así que hay "prev"
+        page.prev_cursor = encode_cursor(tag, "prev", first)
+        if more:
+            page.next_cursor = encode_cursor(tag, "next", last)
+    else:
+        page.next_cursor = encode_cursor(tag, "next", last)
+        if more:
+            page.prev_cursor = encode_cursor(tag, "prev", first)
+    return page
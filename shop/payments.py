@@ -0,0 +1,349 @@
+"""
+Webhooks de Culqi: bandeja de entrada + procesamiento por lotes.
+
+El endpoint (``culqi_webhook``) solo hace ``record_culqi_event``: un INSERT con
+``ignore_conflicts`` (los reintentos de Culqi chocan con ``dedup_key`` y no
+hacen nada) y responde 200. Así la latencia del webhook no depende de cuántos
+pagos lleguen a la vez.
+
+``process_pending`` drena la bandeja por lotes:
+
+- toma hasta ``SHOP_WEBHOOK_BATCH`` eventos pendientes (en Postgres con
+  ``SKIP LOCKED``: dos workers nunca toman el mismo evento);
+- resuelve TODOS sus pedidos con una sola consulta ``IN`` (por
+  ``culqi_order_id`` o por ``code``);
+- aplica los cambios de forma idempotente: un pedido ya pagado no se vuelve a
+  pagar, y un evento más viejo que el último aplicado no pisa el estado.
+
+Se dispara en segundo plano con ``kick()`` tras cada webhook; si el proceso se
+reinicia, ``python manage.py process_webhooks`` recoge lo pendiente.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .culqi import CulqiError, CulqiUnavailable
+from .events import notify_order_changed
+from .inventory import consume_holds
+from .models import Order, WebhookEvent
+from .tasks import run_in_background
+from .transitions import bulk_transition, log_transitions
+
+logger = logging.getLogger(__name__)
+
+CULQI_ORDER_EVENT = "order.status.changed"
+MAX_ATTEMPTS = 5
+
+
+def batch_size() -> int:
+    return getattr(settings, "SHOP_WEBHOOK_BATCH", 200)
+
+
+# -------------------
+# Entrada (endpoint)
+# -------------------
+def record_culqi_event(raw_body: bytes, evt: dict):
+    """Guarda el evento con 1 INSERT; si ya estaba (reintento de Culqi) no hace nada."""
+    event_id = str(evt.get("id") or "")[:80]
+    # el id del evento identifica los reintentos; sin id, el cuerpo exacto
+    dedup_source = f"culqi:{event_id}".encode() if event_id else raw_body
+    event = WebhookEvent(
+        provider="culqi",
+        dedup_key=hashlib.sha256(dedup_source).hexdigest(),
+        event_id=event_id,
+        event_type=str(evt.get("type") or "")[:60],
+        payload=raw_body.decode("utf-8"),
+    )
+    WebhookEvent.objects.bulk_create([event], ignore_conflicts=True)
+
+
+def parse_culqi_data(evt: dict) -> dict:
+    """``data`` llega como dict o como string JSON (según el plugin/panel)."""
+    data = evt.get("data")
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            data = {}
+    return data if isinstance(data, dict) else {}
+
+
+# -------------------
+# Worker
+# -------------------
+def _parse(event: WebhookEvent):
+    """(estado, culqi_order_id, order_number) o None si el evento no nos sirve."""
+    try:
+        evt = json.loads(event.payload)
+    except ValueError:
+        return None
+    if not isinstance(evt, dict) or evt.get("type") != CULQI_ORDER_EVENT:
+        return None
+    data = parse_culqi_data(evt)
+    state = str(data.get("state") or "").strip().lower()[:30]
+    culqi_order_id = str(data.get("id") or "").strip()
+    order_number = str(data.get("order_number") or data.get("orderNumber") or "").strip().upper()
+    if not state or not (culqi_order_id or order_number):
+        return None
+    return state, culqi_order_id, order_number
+
+
+def apply_culqi_events(events) -> Counter:
+    """Aplica un lote de eventos (dentro de una transacción). Marca cada evento con su resultado."""
+    parsed = {}
+    for event in events:
+        event.attempts += 1
+        info = _parse(event)
+        if info is None:
+            event.result = "ignored"
+        else:
+            parsed[event.pk] = info
+
+    culqi_ids = {p[1] for p in parsed.values() if p[1]}
+    codes = {p[2] for p in parsed.values() if p[2]}
+    orders_by_culqi, orders_by_code = {}, {}
+    if parsed:
+        # ✅ una sola consulta para todo el lote
+        for order in Order.objects.filter(Q(culqi_order_id__in=culqi_ids) | Q(code__in=codes)).only(
+            "id", "code", "culqi_order_id", "payment_status", "culqi_last_state", "culqi_last_event_at"
+        ):
+            if order.culqi_order_id:
+                orders_by_culqi[order.culqi_order_id] = order
+            orders_by_code[order.code] = order
+
+    touched, paid_ids = {}, set()
+    for event in events:
+        if event.pk not in parsed:
+            continue
+        state, culqi_order_id, order_number = parsed[event.pk]
+        order = orders_by_culqi.get(culqi_order_id) or orders_by_code.get(order_number)
+        if order is None:
+            event.result = "order_not_found"
+            continue
+        # un reintento viejo no pisa un estado más nuevo, y "paid" es final
+        stale = order.culqi_last_event_at and event.received_at < order.culqi_last_event_at
+        if stale or (order.culqi_last_state == "paid" and state != "paid"):
+            event.result = "unchanged"
+        else:
+            order.culqi_last_state = state
+            order.culqi_last_event_at = event.received_at
+            touched[order.pk] = order
+            event.result = "applied"
+        if state == "paid" and order.payment_status != "paid":
+            paid_ids.add(order.pk)
+            event.result = "applied"
+
+    if touched:
+        Order.objects.bulk_update(touched.values(), ["culqi_last_state", "culqi_last_event_at"])
+
+    newly_paid = []
+    if paid_ids:
+        # ✅ idempotente: solo pasan los que sigan sin pagar (y queda en el historial)
+        newly_paid = bulk_transition(
+            Order.objects.filter(id__in=paid_ids), "payment_status", "paid", source="webhook"
+        )
+        if newly_paid:
+            consume_holds(newly_paid)
+            notify_order_changed()
+
+    now = timezone.now()
+    for event in events:
+        event.processed_at = now
+        event.last_error = ""
+    WebhookEvent.objects.bulk_update(events, ["processed_at", "attempts", "result", "last_error"])
+    return Counter({"paid": len(newly_paid), **Counter(e.result for e in events)})
+
+
+def _claim(limit: int):
+    return list(
+        WebhookEvent.objects.select_for_update(skip_locked=True)
+        .filter(processed_at__isnull=True)
+        .order_by("id")[:limit]
+    )
+
+
+def _claim_ids(event_ids):
+    return WebhookEvent.objects.select_for_update().filter(id__in=event_ids, processed_at__isnull=True)
+
+
+def _mark_failed(event_ids, exc):
+    """El lote falló: +1 intento; tras MAX_ATTEMPTS se da por procesado con error."""
+    error = repr(exc)[:2000]
+    with transaction.atomic():
+        for event in _claim_ids(event_ids):
+            event.attempts += 1
+            event.last_error = error
+            if event.attempts >= MAX_ATTEMPTS:
+                event.result = "error"
+                event.processed_at = timezone.now()
+            event.save(update_fields=["attempts", "last_error", "result", "processed_at"])
+
+
+def process_pending(limit: int = None) -> Counter:
+    """Procesa UN lote de la bandeja. Devuelve contadores por resultado (vacío = nada pendiente)."""
+    limit = limit or batch_size()
+    events = []
+    try:
+        with transaction.atomic():
+            events = _claim(limit)
+            if not events:
+                return Counter()
+            return apply_culqi_events(events)
+    except Exception:
+        if not events:
+            raise
+        logger.exception("Falló un lote de %d webhooks; se reintenta uno por uno", len(events))
+
+    # un evento malo no debe trabar al resto: se reintenta cada uno por separado
+    totals = Counter()
+    for event_id in [e.pk for e in events]:
+        try:
+            with transaction.atomic():
+                one = list(_claim_ids([event_id]))
+                if one:
+                    totals += apply_culqi_events(one)
+        except Exception as exc:
+            logger.exception("Webhook %s falló", event_id)
+            _mark_failed([event_id], exc)
+            totals["failed"] += 1
+    return totals
+
+
+def drain(limit: int = None) -> Counter:
+    """Procesa lotes hasta vaciar la bandeja."""
+    totals = Counter()
+    while True:
+        done = process_pending(limit)
+        if not done:
+            return totals
+        totals += done
+
+
+# -------------------
+# Disparo en segundo plano
+# -------------------
+_kick_lock = threading.Lock()
+_kick_scheduled = False
+
+
+def _drain_in_background():
+    global _kick_scheduled
+    with _kick_lock:
+        # lo que llegue desde ahora vuelve a disparar un drenado
+        _kick_scheduled = False
+    drain()
+
+
+def _schedule():
+    global _kick_scheduled
+    with _kick_lock:
+        if _kick_scheduled:
+            return  # ya hay un drenado en cola que verá este evento
+        _kick_scheduled = True
+    run_in_background(_drain_in_background)
+
+
+def kick():
+    """Pide un drenado de la bandeja al confirmar la transacción actual (se agrupan los pedidos)."""
+    transaction.on_commit(_schedule)
+
+
+# -------------------
+# Conciliación (manage.py reconcile_culqi)
+# -------------------
+RECONCILE_FIELDS = ("culqi_last_state", "culqi_last_event_at", "payment_status", "paid_at")
+
+
+def reconcile_candidates(since, limit: int = None) -> list:
+    """Pedidos con orden Culqi, sin pagar, creados desde ``since`` (por si se perdió un webhook)."""
+    qs = (
+        Order.objects.filter(culqi_order_id__isnull=False, created_at__gte=since)
+        .exclude(culqi_order_id="")
+        .exclude(payment_status="paid")
+        .order_by("id")
+        .only("id", "code", "culqi_order_id", *RECONCILE_FIELDS)
+    )
+    return list(qs[:limit] if limit else qs)
+
+
+def culqi_paid_at(data: dict):
+    ts = data.get("paid_at")
+    if isinstance(ts, (int, float)) and ts > 0:
+        # Culqi manda epoch en segundos (a veces en ms)
+        return datetime.fromtimestamp(ts / 1000 if ts > 1e11 else ts, tz=dt_timezone.utc)
+    return None
+
+
+def fetch_culqi_states(orders, client, workers: int = 8):
+    """
+    Consulta a Culqi cada pedido en paralelo (``client`` comparte su pool entre hilos).
+    Devuelve (states para ``apply_culqi_states``, n° de errores, n° de "Culqi no disponible").
+    """
+    def fetch(order):
+        try:
+            return order, client.get_order(order.culqi_order_id), None
+        except CulqiError as exc:
+            return order, None, exc
+
+    states, errors, unavailable = {}, 0, 0
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="culqi-reconcile") as pool:
+        for order, data, exc in pool.map(fetch, orders):
+            if exc is not None:
+                errors += 1
+                unavailable += isinstance(exc, CulqiUnavailable)
+                continue
+            state = str(data.get("state") or "").strip().lower()[:30]
+            if state:
+                states[order.pk] = (state, culqi_paid_at(data))
+    return states, errors, unavailable
+
+
+def apply_culqi_states(orders, states: dict) -> dict:
+    """
+    ``states``: {order.pk: (estado, paid_at o None)} consultados a Culqi.
+
+    Escribe todo con UN ``bulk_update``. Los pedidos que se pagaron mientras
+    tanto (p.ej. llegó el webhook) quedan fuera: nunca se pagan dos veces.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = sorted(states)
+        still_unpaid = {}
+        for i in range(0, len(ids), 500):  # límite de variables de SQLite
+            still_unpaid.update(
+                Order.objects.select_for_update()
+                .filter(id__in=ids[i:i + 500])
+                .exclude(payment_status="paid")
+                .values_list("id", "payment_status")
+            )
+        changed, newly_paid = [], []
+        for order in orders:
+            if order.pk not in still_unpaid or order.pk not in states:
+                continue
+            state, paid_at = states[order.pk]
+            if state == "paid":
+                order.payment_status = "paid"
+                order.paid_at = paid_at or now
+                newly_paid.append((order.pk, still_unpaid[order.pk]))
+            elif state == order.culqi_last_state:
+                continue
+            order.culqi_last_state = state
+            order.culqi_last_event_at = now
+            changed.append(order)
+
+        if changed:
+            Order.objects.bulk_update(changed, RECONCILE_FIELDS, batch_size=500)
+        if newly_paid:
+            log_transitions(newly_paid, "payment_status", "paid", source="reconcile")
+            consume_holds([pk for pk, _ in newly_paid])
+            notify_order_changed()
+    return {"changed": len(changed), "paid": len(newly_paid)}
@@ -0,0 +1,31 @@
+"""
+Números de WhatsApp en formato E.164 (+51XXXXXXXXX).
+
+El cliente escribe el número como quiere ("944 739 301", "+51 944-739-301",
+"51944739301"...). Para buscar pedidos y para Culqi se usa siempre la forma
+normalizada, que se guarda en ``Order.whatsapp_e164``.
+"""
+import re
+
+DEFAULT_COUNTRY_CODE = "51"  # Perú
+_NON_DIGITS = re.compile(r"\D+")
+
+
+def normalize_whatsapp(raw, country_code: str = DEFAULT_COUNTRY_CODE) -> str:
+    """"+51944739301" o "" si no hay dígitos suficientes."""
+    raw = (raw or "").strip()
+    digits = _NON_DIGITS.sub("", raw)
+    if not digits:
+        return ""
+
+    if raw.startswith("+"):
+        pass
+    elif digits.startswith("00"):  # prefijo internacional: 0051...
+        digits = digits[2:]
+    elif not digits.startswith(country_code) or len(digits) <= 9:
+        # número local (celular de 9 dígitos): anteponer el código de país
+        digits = country_code + digits.lstrip("0")
+
+    if not 8 <= len(digits) <= 15:
+        return ""
+    return "+" + digits
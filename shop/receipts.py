@@ -0,0 +1,105 @@
+"""
+Normalización de comprobantes de pago.
+
+El cliente sube lo que tenga (capturas de varios MB). En segundo plano:
+- se corrige la orientación EXIF y se descarta toda la metadata,
+- se reduce a un lado máximo de RECEIPT_MAX_SIDE y se recomprime a JPEG,
+- se genera una miniatura para el admin y el detalle del pedido,
+- se borra el archivo original.
+
+Si la imagen no se puede decodificar (archivo truncado o corrupto que pasó la
+validación del encabezado) se conserva el original tal cual, sin miniatura, y
+se marca como procesado para no reintentarlo en cada vuelta.
+"""
+import io
+import logging
+import posixpath
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_MAX_UPLOAD = 10 * 1024 * 1024  # 10 MB
+RECEIPT_MAX_PIXELS = 40_000_000
+RECEIPT_FORMATS = {"JPEG", "PNG", "WEBP", "GIF", "MPO"}
+RECEIPT_MAX_SIDE = 1600
+RECEIPT_THUMB_SIDE = 320
+RECEIPT_QUALITY = 82
+
+
+def validate_receipt(upload):
+    """Validación rápida (sin decodificar la imagen completa) para el form."""
+    if upload.size > RECEIPT_MAX_UPLOAD:
+        raise ValidationError("La imagen pesa más de 10 MB.")
+    try:
+        upload.seek(0)
+        img = Image.open(upload)
+        fmt, (w, h) = img.format, img.size
+    except (UnidentifiedImageError, OSError):
+        raise ValidationError("El archivo no es una imagen válida.")
+    finally:
+        upload.seek(0)
+    if fmt not in RECEIPT_FORMATS:
+        raise ValidationError("Formato no soportado. Usa JPG, PNG o WEBP.")
+    if w * h > RECEIPT_MAX_PIXELS:
+        raise ValidationError("La imagen es demasiado grande.")
+
+
+def _jpeg(img, side: int) -> bytes:
+    img = img.copy()
+    img.thumbnail((side, side), Image.LANCZOS)
+    buf = io.BytesIO()
+    # sin exif= ni icc: el JPEG sale sin metadata
+    img.save(buf, "JPEG", quality=RECEIPT_QUALITY, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def process_receipt(order_id: int) -> bool:
+    """
+    Normaliza el comprobante actual del pedido. Idempotente: si ya está
+    procesado (o el cliente subió otro mientras tanto) no hace nada.
+    """
+    order = Order.objects.filter(pk=order_id).only("id", "code", "receipt_image", "receipt_processed_at").first()
+    if not order or not order.receipt_image or order.receipt_processed_at:
+        return False
+
+    storage = order.receipt_image.storage
+    original = order.receipt_image.name
+
+    try:
+        with storage.open(original, "rb") as fh:
+            img = Image.open(fh)
+            img = ImageOps.exif_transpose(img)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.load()
+    except (UnidentifiedImageError, OSError, ValueError, SyntaxError, Image.DecompressionBombError) as exc:
+        logger.warning("Comprobante del pedido %s no se pudo procesar (%s); se deja el original", order.code, exc)
+        Order.objects.filter(pk=order.pk, receipt_image=original, receipt_processed_at__isnull=True).update(
+            receipt_processed_at=timezone.now(),
+        )
+        return False
+
+    stem = f"{order.code}-{timezone.now():%Y%m%d%H%M%S}"
+    full_name = storage.save(f"receipts/{stem}.jpg", ContentFile(_jpeg(img, RECEIPT_MAX_SIDE)))
+    thumb_name = storage.save(f"receipts/thumbs/{stem}.jpg", ContentFile(_jpeg(img, RECEIPT_THUMB_SIDE)))
+
+    # solo si sigue siendo el mismo archivo (el cliente pudo subir otro)
+    updated = Order.objects.filter(pk=order.pk, receipt_image=original, receipt_processed_at__isnull=True).update(
+        receipt_image=full_name,
+        receipt_thumb=thumb_name,
+        receipt_processed_at=timezone.now(),
+    )
+    if not updated:
+        storage.delete(full_name)
+        storage.delete(thumb_name)
+        return False
+
+    if posixpath.normpath(original) != posixpath.normpath(full_name):
+        storage.delete(original)
+    return True
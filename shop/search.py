@@ -0,0 +1,199 @@
+"""
+Búsqueda de productos con índice full-text.
+
+- Postgres: columna ``search_vector`` (tsvector) con índice GIN, mantenida por
+  un trigger con stemming en español + unaccent.
+- SQLite (local/dev): tabla virtual FTS5 ``shop_product_fts`` con triggers.
+- Otros motores: fallback a ``icontains``.
+
+El esquema lo crea la migración 0009. Se usan triggers (y no señales de Django)
+para que también queden indexados los ``update()`` / ``bulk_create()``.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+PG_CONFIG = "shop_es"
+FTS_TABLE = "shop_product_fts"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_MAX_TOKENS = 8
+
+
+# -------------------
+# Esquema Postgres
+# -------------------
+PG_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    f"""
+    DO $$
+    BEGIN
+      IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{PG_CONFIG}') THEN
+        CREATE TEXT SEARCH CONFIGURATION {PG_CONFIG} (COPY = pg_catalog.spanish);
+        ALTER TEXT SEARCH CONFIGURATION {PG_CONFIG}
+          ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+      END IF;
+    END $$;
+    """,
+    "ALTER TABLE shop_product ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"""
+    CREATE OR REPLACE FUNCTION shop_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+      NEW.search_vector :=
+        setweight(to_tsvector('{PG_CONFIG}', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('{PG_CONFIG}', coalesce(NEW.description, '')), 'B');
+      RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    "DROP TRIGGER IF EXISTS shop_product_search_vector_trg ON shop_product",
+    """
+    CREATE TRIGGER shop_product_search_vector_trg
+      BEFORE INSERT OR UPDATE OF name, description ON shop_product
+      FOR EACH ROW EXECUTE FUNCTION shop_product_search_vector_update();
+    """,
+    # backfill: el trigger recalcula el vector
+    "UPDATE shop_product SET name = name",
+    "CREATE INDEX IF NOT EXISTS shop_product_search_gin ON shop_product USING gin (search_vector)",
+]
+
+PG_UNINSTALL = [
+    "DROP INDEX IF EXISTS shop_product_search_gin",
+    "DROP TRIGGER IF EXISTS shop_product_search_vector_trg ON shop_product",
+    "DROP FUNCTION IF EXISTS shop_product_search_vector_update()",
+    "ALTER TABLE shop_product DROP COLUMN IF EXISTS search_vector",
+    f"DROP TEXT SEARCH CONFIGURATION IF EXISTS {PG_CONFIG}",
+]
+
+
+# -------------------
+# Esquema SQLite (FTS5 external content)
+# -------------------
+SQLITE_TRIGGERS = {
+    "shop_product_fts_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS shop_product_fts_ai AFTER INSERT ON shop_product BEGIN
+          INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    """,
+    "shop_product_fts_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS shop_product_fts_ad AFTER DELETE ON shop_product BEGIN
+          INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+          VALUES ('delete', old.id, old.name, old.description);
+        END
+    """,
+    "shop_product_fts_au": f"""
+        CREATE TRIGGER IF NOT EXISTS shop_product_fts_au AFTER UPDATE OF name, description ON shop_product BEGIN
+          INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+          VALUES ('delete', old.id, old.name, old.description);
+          INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    """,
+}
+
+SQLITE_TABLE = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+      name, description,
+      content='shop_product', content_rowid='id',
+      tokenize='unicode61 remove_diacritics 2',
+      prefix='2 3'
+    )
+"""
+
+
+def install(conn=None):
+    conn = conn or connection
+    with conn.cursor() as cur:
+        if conn.vendor == "postgresql":
+            for sql in PG_INSTALL:
+                cur.execute(sql)
+        elif conn.vendor == "sqlite":
+            cur.execute(SQLITE_TABLE)
+            for sql in SQLITE_TRIGGERS.values():
+                cur.execute(sql)
+            cur.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall(conn=None):
+    conn = conn or connection
+    with conn.cursor() as cur:
+        if conn.vendor == "postgresql":
+            for sql in PG_UNINSTALL:
+                cur.execute(sql)
+        elif conn.vendor == "sqlite":
+            for name in SQLITE_TRIGGERS:
+                cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cur.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def ensure_installed(conn=None):
+    """
+    En SQLite, Django reconstruye la tabla (create/copy/drop/rename) en varias
+    migraciones y eso borra los triggers. Se llama en post_migrate para
+    recrearlos (y reindexar) si faltan.
+    """
+    conn = conn or connection
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'shop_product'")
+        if cur.fetchone() is None:
+            return
+        cur.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name IN (%s)"
+            % ", ".join(["%s"] * (len(SQLITE_TRIGGERS) + 1)),
+            [FTS_TABLE, *SQLITE_TRIGGERS],
+        )
+        found = {row[0] for row in cur.fetchall()}
+    if len(found) != len(SQLITE_TRIGGERS) + 1:
+        install(conn)
+
+
+# -------------------
+# Consulta
+# -------------------
+def _tokens(q: str):
+    return _TOKEN_RE.findall(q.lower())[:_MAX_TOKENS]
+
+
+def search_products(qs, q: str):
+    """
+    Filtra ``qs`` por el texto ``q`` y anota ``search_rank`` (mayor = más relevante).
+    Cada palabra se busca como prefijo (sirve para buscar mientras se escribe).
+    """
+    tokens = _tokens(q)
+    if not tokens:
+        return qs.none()
+
+    vendor = connection.vendor
+
+    if vendor == "postgresql":
+        # tokens solo contienen \w, así que es seguro armar la sintaxis tsquery
+        tsquery = " & ".join(f"{t}:*" for t in tokens)
+        match = f"shop_product.search_vector @@ to_tsquery('{PG_CONFIG}', %s)"
+        rank = f"ts_rank_cd(shop_product.search_vector, to_tsquery('{PG_CONFIG}', %s))"
+        return (
+            qs.alias(search_match=RawSQL(match, (tsquery,), output_field=BooleanField()))
+            .filter(search_match=True)
+            .annotate(search_rank=RawSQL(rank, (tsquery,), output_field=FloatField()))
+        )
+
+    if vendor == "sqlite":
+        match = " AND ".join('"%s"*' % t.replace('"', '""') for t in tokens)
+        # JOIN con la tabla FTS (una sola consulta full-text). Una subconsulta
+        # correlacionada para el rank repetiría el MATCH por cada fila.
+        # bm25: menor = mejor, lo invertimos para ordenar igual que en Postgres.
+        return (
+            qs.extra(
+                tables=[FTS_TABLE],
+                where=[f"{FTS_TABLE}.rowid = shop_product.id", f"{FTS_TABLE} MATCH %s"],
+                params=[match],
+            )
+            .annotate(search_rank=RawSQL(f"-bm25({FTS_TABLE}, 10.0, 1.0)", (), output_field=FloatField()))
+        )
+
+    cond = Q()
+    for t in tokens:
+        cond &= Q(name__icontains=t) | Q(description__icontains=t)
+    return qs.filter(cond).annotate(search_rank=RawSQL("0", (), output_field=FloatField()))
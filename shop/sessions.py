@@ -0,0 +1,71 @@
+"""
+Sesiones en cache + DB (``SESSION_ENGINE = "shop.sessions"``).
+
+Igual que ``cached_db`` (lecturas desde la cache, la DB como respaldo), pero
+los cambios que solo tocan el carrito no escriben en ``django_session`` en cada
+clic: van a la cache y la DB se pone al día como máximo cada
+``SESSION_DB_SYNC_SECONDS``. Login, logout, acceso a pedidos, etc. se escriben
+en la DB de inmediato, como siempre.
+
+Si la cache se pierde (o recorta la sesión al llenarse) se recupera la última
+copia de la DB: a lo sumo se pierden ``SESSION_DB_SYNC_SECONDS`` de cambios del
+carrito. Los límites de la cache "sessions" están dimensionados para eso en
+settings.CACHES.
+"""
+import copy
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+logger = logging.getLogger(__name__)
+
+# claves que pueden esperar a la próxima sincronización con la DB
+LAZY_KEYS = {"cart"}
+SYNCED_AT_KEY = "_shop_db_synced"
+
+
+def _sync_seconds() -> int:
+    return getattr(settings, "SESSION_DB_SYNC_SECONDS", 60)
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = "shop.sessions"
+
+    def load(self):
+        data = super().load()
+        # copia profunda: order_access (lista) se modifica en el lugar; una copia
+        # superficial compartiría la lista y el cambio no se notaría
+        self._loaded = copy.deepcopy(data)
+        return data
+
+    def _only_lazy_changes(self) -> bool:
+        loaded = getattr(self, "_loaded", None)
+        if loaded is None:
+            return False
+        current = self._session
+        keys = (set(loaded) | set(current)) - LAZY_KEYS - {SYNCED_AT_KEY}
+        return all(loaded.get(k) == current.get(k) for k in keys)
+
+    def save(self, must_create=False):
+        now = int(time.time())
+        if (
+            must_create
+            or self.session_key is None
+            or not self._only_lazy_changes()
+            or now - self._session.get(SYNCED_AT_KEY, 0) >= _sync_seconds()
+        ):
+            self._session[SYNCED_AT_KEY] = now
+            super().save(must_create)
+            self._loaded = copy.deepcopy(self._session)
+            return
+
+        # ✅ solo cambió el carrito: escribir en cache y postergar la DB
+        try:
+            self._cache.set(self.cache_key, self._session, self.get_expiry_age())
+        except Exception:
+            logger.exception("No se pudo guardar la sesión en cache; se escribe en la DB")
+            self._session[SYNCED_AT_KEY] = now
+            super().save(must_create)
+        self._loaded = copy.deepcopy(self._session)
@@ -0,0 +1,47 @@
+import logging
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .fragments import bump_product_versions
+from .images import refresh_variants, variants_outdated
+from .inventory import release_holds
+from .models import Order, Product
+from .phones import normalize_whatsapp
+
+logger = logging.getLogger(__name__)
+
+
+# ✅ cualquier edición de producto (admin, list_editable, shell) invalida su tarjeta
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    bump_product_versions([instance.pk], catalog=True)
+
+
+# ✅ foto nueva -> variantes responsive (WebP + JPEG)
+@receiver(post_save, sender=Product)
+def product_image_variants(sender, instance, raw=False, **kwargs):
+    if raw or not variants_outdated(instance):
+        return
+    try:
+        variants = refresh_variants(instance)
+    except Exception:
+        logger.exception("No se pudieron generar variantes para el producto %s", instance.pk)
+        return
+    instance.image_variants = variants
+    Product.objects.filter(pk=instance.pk).update(image_variants=variants)
+
+
+# ✅ WhatsApp normalizado (E.164) para el seguimiento de pedidos y Culqi
+@receiver(pre_save, sender=Order)
+def order_whatsapp_e164(sender, instance, raw=False, **kwargs):
+    instance.whatsapp_e164 = normalize_whatsapp(instance.whatsapp)
+
+
+# ✅ borrar un pedido (admin, acción masiva, shell) devuelve lo que tenía apartado;
+# el CASCADE de StockHold solo borraría las filas. Lo ya consumido es una venta
+# firme: para devolverlo, cancelar el pedido antes de borrarlo.
+@receiver(pre_delete, sender=Order)
+def order_release_holds(sender, instance, **kwargs):
+    release_holds(order_ids=[instance.pk])
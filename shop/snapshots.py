@@ -0,0 +1,93 @@
+"""
+Snapshots de productos en memoria para el carrito y el checkout.
+
+``cart_detail`` y ``checkout`` solo necesitan nombre, precio, stock y foto.
+En vez de instanciar el modelo completo (con ``description``) en cada request,
+se guarda por proceso un registro compacto (``__slots__``) por producto.
+
+Invalidación: cada snapshot recuerda la versión del producto (shop/fragments.py,
+en el cache compartido) con la que se leyó. Como las versiones se renuevan al
+editar el producto o cambiar su stock, un snapshot con otra versión se vuelve a
+leer de la DB. En el caso común el carrito no hace ninguna consulta.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .fragments import product_versions
+from .models import Product
+
+_FIELDS = ("id", "name", "price", "stock", "is_active", "image")
+
+
+class ProductSnapshot:
+    __slots__ = _FIELDS + ("version",)
+
+    def __init__(self, id, name, price, stock, is_active, image, version):
+        self.id = id
+        self.name = name
+        self.price = price
+        self.stock = stock
+        self.is_active = is_active
+        self.image = image or ""
+        self.version = version
+
+    @property
+    def image_url(self) -> str:
+        return default_storage.url(self.image) if self.image else ""
+
+    def __repr__(self):
+        return f"<ProductSnapshot {self.id} v{self.version}>"
+
+
+_lock = threading.Lock()
+_cache: "OrderedDict[int, ProductSnapshot]" = OrderedDict()
+
+
+def _max_size() -> int:
+    return getattr(settings, "SHOP_SNAPSHOT_CACHE_SIZE", 2000)
+
+
+def get_snapshots(ids) -> dict:
+    """{id: ProductSnapshot} de los productos que existen (activos o no)."""
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    if not ids:
+        return {}
+
+    versions = product_versions(ids)
+    found, missing = {}, []
+    with _lock:
+        for pid in ids:
+            snap = _cache.get(pid)
+            if snap is not None and snap.version == versions[pid]:
+                _cache.move_to_end(pid)
+                found[pid] = snap
+            else:
+                missing.append(pid)
+
+    if missing:
+        # la versión se leyó antes que la fila: si alguien edita en medio, la
+        # próxima lectura ve otra versión y vuelve a consultar (nunca queda viejo)
+        fresh = {
+            row[0]: ProductSnapshot(*row, version=versions[row[0]])
+            for row in Product.objects.filter(id__in=missing).values_list(*_FIELDS)
+        }
+        with _lock:
+            for pid in missing:
+                if pid in fresh:
+                    _cache[pid] = fresh[pid]
+                    _cache.move_to_end(pid)
+                else:
+                    _cache.pop(pid, None)
+            while len(_cache) > _max_size():
+                _cache.popitem(last=False)
+        found.update(fresh)
+
+    return found
+
+
+def clear():
+    with _lock:
+        _cache.clear()
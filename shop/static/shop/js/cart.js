@@ -0,0 +1,97 @@
+// ✅ Carrito sin recargar la página.
+// Los botones siguen siendo links/forms normales (funcionan sin JS);
+// con JS se interceptan y se llama a la API JSON (/api/carrito/...).
+(function () {
+  function csrfToken() {
+    var meta = document.querySelector('meta[name="csrf-token"]');
+    if (meta) return meta.content;
+    var m = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+    return m ? decodeURIComponent(m[1]) : "";
+  }
+
+  function post(url, body) {
+    return fetch(url, {
+      method: "POST",
+      credentials: "same-origin",
+      headers: { "X-CSRFToken": csrfToken(), "Accept": "application/json" },
+      body: body || null,
+    }).then(function (r) {
+      return r.json().catch(function () { throw new Error("HTTP " + r.status); });
+    });
+  }
+
+  function toast(text) {
+    var box = document.querySelector(".toast-container");
+    if (!text || !box || !window.bootstrap) return;
+    var el = document.createElement("div");
+    el.className = "toast align-items-center mb-2";
+    el.setAttribute("role", "status");
+    el.dataset.bsDelay = "2200";
+    el.innerHTML =
+      '<div class="toast-header"><strong class="me-auto">Catálogo de Daniela</strong>' +
+      '<button type="button" class="btn-close ms-2" data-bs-dismiss="toast" aria-label="Close"></button></div>' +
+      '<div class="toast-body"></div>';
+    el.querySelector(".toast-body").textContent = text;
+    box.appendChild(el);
+    el.addEventListener("hidden.bs.toast", function () { el.remove(); });
+    new bootstrap.Toast(el).show();
+  }
+
+  function render(data) {
+    document.querySelectorAll("[data-cart-count]").forEach(function (el) {
+      el.textContent = data.cart_count;
+      el.classList.toggle("d-none", !data.cart_count);
+    });
+    document.querySelectorAll("[data-cart-total]").forEach(function (el) {
+      el.textContent = "S/ " + data.total_display;
+    });
+
+    var row = data.product_id && document.querySelector('[data-cart-row="' + data.product_id + '"]');
+    if (row) {
+      if (!data.line) {
+        row.remove();
+      } else {
+        row.querySelectorAll("[data-cart-qty]").forEach(function (el) {
+          if ("value" in el) el.value = data.line.qty; else el.textContent = data.line.qty;
+        });
+        row.querySelectorAll("[data-cart-subtotal]").forEach(function (el) {
+          el.textContent = "S/ " + data.line.subtotal_display;
+        });
+      }
+    }
+    // carrito vacío: mostrar el estado vacío que arma el servidor
+    if (!data.cart_count && document.querySelector("[data-cart-page]")) {
+      window.location.reload();
+    }
+  }
+
+  function send(el, url, body, fallback) {
+    el.classList.add("disabled");
+    post(url, body)
+      .then(function (data) {
+        render(data);
+        toast(data.message);
+      })
+      .catch(fallback)
+      .finally(function () { el.classList.remove("disabled"); });
+  }
+
+  document.addEventListener("click", function (e) {
+    var el = e.target.closest("[data-cart-api]");
+    if (!el || el.classList.contains("disabled")) return;
+    e.preventDefault();
+    send(el, el.dataset.cartApi, null, function () { window.location.href = el.href; });
+  });
+
+  document.addEventListener("submit", function (e) {
+    var form = e.target.closest("form[data-cart-form]");
+    if (!form) return;
+    e.preventDefault();
+    send(form, form.action, new FormData(form), function () { form.submit(); });
+  });
+
+  document.addEventListener("change", function (e) {
+    var input = e.target.closest("form[data-cart-form] [data-cart-qty]");
+    if (input) input.form.requestSubmit();
+  });
+})();
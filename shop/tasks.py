@@ -0,0 +1,44 @@
+"""
+Trabajo en segundo plano dentro del mismo proceso (sin Celery/Redis).
+
+Las tareas se encolan al confirmar la transacción y corren en un pool de hilos,
+así la request responde de inmediato. Si el proceso muere antes de terminar,
+los comandos de management correspondientes (p.ej. ``process_receipts``)
+recogen lo pendiente: las tareas deben ser idempotentes.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "SHOP_BACKGROUND_WORKERS", 2),
+            thread_name_prefix="shop-bg",
+        )
+    return _executor
+
+
+def _run(fn, args, kwargs):
+    try:
+        fn(*args, **kwargs)
+    except Exception:
+        logger.exception("Falló la tarea en segundo plano %s", getattr(fn, "__name__", fn))
+    finally:
+        close_old_connections()
+
+
+def run_in_background(fn, *args, **kwargs):
+    """Ejecuta fn(*args) en un hilo aparte cuando la transacción actual haga commit."""
+    if getattr(settings, "SHOP_BACKGROUND_SYNC", False):
+        transaction.on_commit(lambda: fn(*args, **kwargs))
+        return
+    transaction.on_commit(lambda: _get_executor().submit(_run, fn, args, kwargs))
@@ -0,0 +1,48 @@
+from django import template
+from django.utils.html import format_html
+
+register = template.Library()
+
+CARD_SIZES = "(min-width: 992px) 33vw, (min-width: 576px) 50vw, 100vw"
+
+
+def _srcset(storage, widths: dict, fmt: str) -> str:
+    return ", ".join(
+        f"{storage.url(names[fmt])} {w}w"
+        for w, names in sorted(widths.items(), key=lambda kv: int(kv[0]))
+        if fmt in names
+    )
+
+
+@register.simple_tag
+def responsive_image(product, sizes=CARD_SIZES, alt=None, loading="lazy"):
+    """
+    <picture> con srcset WebP + JPEG a partir de Product.image_variants.
+    Uso: {% responsive_image p %} / {% responsive_image product sizes="100vw" loading="eager" %}
+    Si aún no hay variantes, cae al <img> original.
+    """
+    image = product.image
+    if not image:
+        return ""
+
+    alt = product.name if alt is None else alt
+    variants = product.image_variants or {}
+    widths = variants.get("widths") or {}
+    if variants.get("src") != image.name or not widths:
+        return format_html('<img src="{}" alt="{}" loading="{}">', image.url, alt, loading)
+
+    storage = image.storage
+    largest = max(widths, key=int)
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="{}" decoding="async">'
+        '</picture>',
+        _srcset(storage, widths, "webp"),
+        sizes,
+        storage.url(widths[largest]["jpg"]),
+        _srcset(storage, widths, "jpg"),
+        sizes,
+        alt,
+        loading,
+    )
@@ -1,3 +1,1045 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from PIL import Image
+
+from .codes import is_valid_code
+from .culqi import CulqiClient, CulqiError, CulqiUnavailable, build_client
+from .culqi_fake import start_fake_culqi
+from .imports import ProductImportError, import_products
+from .models import CodeCounter, Order, OrderItem, OrderStatusHistory, Product, StockHold, WebhookEvent
+from .orders import OutOfStock, place_order
+from .pagination import encode_cursor, keyset_paginate
+from .events import OrderEventBroker, order_state
+from .exports import csv_response, write_xlsx
+from .forms import CheckoutForm
+from .fragments import featured_product_ids, render_product_cards
+from .payments import (
+    apply_culqi_states, fetch_culqi_states, process_pending, reconcile_candidates, record_culqi_event,
+)
+from .phones import normalize_whatsapp
+from .receipts import RECEIPT_MAX_SIDE, RECEIPT_THUMB_SIDE, process_receipt
+from .search import search_products
+from .sessions import SessionStore
+from . import snapshots
+from .transitions import bulk_transition
+from .views import CART_BATCH_MAX_LINES, CATALOG_ORDERINGS, MY_ORDERS_PAGE_SIZE
+
+# ✅ caches en memoria: los tests no tocan .cache/ del proyecto; tareas de fondo en línea
+TEST_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests-default"},
+    "sessions": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests-sessions"},
+}
+
+
+@override_settings(CACHES=TEST_CACHES, SHOP_BACKGROUND_SYNC=True)
+class ShopTestCase(TestCase):
+    customer = {"full_name": "Ana Pérez", "whatsapp": "944739301", "address": "Av. Siempre Viva 123"}
+
+    def setUp(self):
+        # las cachés locmem y los snapshots en memoria sobreviven al rollback de cada test
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        snapshots.clear()
+
+    def use_temp_media(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def fake_culqi(self, **kwargs):
+        """Culqi falso en un hilo + cliente apuntando a él (se cierran al terminar)."""
+        server = start_fake_culqi(**kwargs)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        client = build_client(base_url=server.base_url, secret_key="sk_test_fake", retries=0)
+        self.addCleanup(client.close)
+        return server, client
+
+    def png(self, size=(800, 600)):
+        buf = io.BytesIO()
+        Image.new("RGB", size, (236, 72, 153)).save(buf, "PNG")
+        return buf.getvalue()
+
+    def make_product(self, name="Taza", price="10.00", stock=5, **kwargs):
+        return Product.objects.create(name=name, price=Decimal(price), stock=stock, **kwargs)
+
+    def set_cart(self, cart):
+        session = self.client.session
+        session["cart"] = ",".join(f"{pid}:{qty}" for pid, qty in sorted(cart.items()))
+        session.save()
+
+    def place(self, cart, **customer):
+        form = CheckoutForm(data={**self.customer, **customer})
+        self.assertTrue(form.is_valid(), form.errors)
+        return place_order(form, {str(pid): qty for pid, qty in cart.items()})
+
+
+class OrderCodeTests(ShopTestCase):
+    def test_unsaved_order_does_not_allocate_a_code(self):
+        order = Order(full_name="Sin guardar")
+        self.assertEqual(order.code, "")
+        self.assertFalse(CodeCounter.objects.exists())
+
+    def test_saved_orders_get_unique_valid_codes(self):
+        codes = {Order.objects.create(full_name=f"Cliente {i}").code for i in range(5)}
+        self.assertEqual(len(codes), 5)
+        self.assertTrue(all(is_valid_code(code) for code in codes))
+
+
+class CheckoutTests(ShopTestCase):
+    def test_place_order_discounts_stock_and_creates_items_and_holds(self):
+        mug, plate = self.make_product("Taza", stock=5), self.make_product("Plato", price="4.50", stock=2)
+
+        order, adjusted = self.place({mug.pk: 2, plate.pk: 1})
+
+        self.assertFalse(adjusted)
+        self.assertEqual(order.total, Decimal("24.50"))
+        self.assertEqual(order.item_count, 3)
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 2)
+        mug.refresh_from_db()
+        plate.refresh_from_db()
+        self.assertEqual((mug.stock, plate.stock), (3, 1))
+        self.assertEqual(
+            sorted(StockHold.objects.filter(order=order, state="active").values_list("product_id", "qty")),
+            sorted([(mug.pk, 2), (plate.pk, 1)]),
+        )
+
+    def test_quantities_are_capped_at_available_stock(self):
+        mug = self.make_product(stock=2)
+
+        order, adjusted = self.place({mug.pk: 5})
+
+        self.assertTrue(adjusted)
+        self.assertEqual(order.items.get().qty, 2)
+        mug.refresh_from_db()
+        self.assertEqual(mug.stock, 0)
+
+    def test_sold_out_cart_raises_and_creates_nothing(self):
+        mug = self.make_product(stock=0)
+
+        with self.assertRaises(OutOfStock):
+            self.place({mug.pk: 1})
+
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_view_places_order_and_empties_cart(self):
+        mug = self.make_product(stock=3)
+        self.set_cart({mug.pk: 2})
+
+        response = self.client.post(reverse("checkout"), {**self.customer, "checkout_token": "a" * 32})
+
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse("order_detail_code", args=[order.code]), fetch_redirect_response=False)
+        self.assertEqual(self.client.session.get("cart", ""), "")
+        self.assertIn(order.code, self.client.session["order_access"])
+
+    def test_resubmitting_the_same_token_returns_the_first_order(self):
+        mug = self.make_product(stock=5)
+        self.set_cart({mug.pk: 1})
+        data = {**self.customer, "checkout_token": "b" * 32}
+
+        first = self.client.post(reverse("checkout"), data)
+        # doble clic: el carrito ya se vació, pero el token es el mismo
+        second = self.client.post(reverse("checkout"), data)
+
+        order = Order.objects.get()
+        self.assertEqual(first["Location"], second["Location"])
+        self.assertEqual(order.items.get().qty, 1)
+        mug.refresh_from_db()
+        self.assertEqual(mug.stock, 4)
+
+    def test_checkout_get_does_not_allocate_codes(self):
+        mug = self.make_product()
+        self.set_cart({mug.pk: 1})
+
+        response = self.client.get(reverse("checkout"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(CodeCounter.objects.exists())
+
+
+class WebhookTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(full_name="Pago", culqi_order_id="ord_test_1", total=10)
+
+    def event(self, state, event_id):
+        return {
+            "object": "event",
+            "id": event_id,
+            "type": "order.status.changed",
+            "data": json.dumps({"id": "ord_test_1", "state": state}),
+        }
+
+    def post(self, evt):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse("culqi_webhook"), json.dumps(evt), content_type="application/json")
+
+    def test_retried_event_is_stored_once_and_pays_the_order(self):
+        evt = self.event("paid", "evt_1")
+
+        responses = [self.post(evt) for _ in range(3)]
+
+        self.assertEqual([r.status_code for r in responses], [200, 200, 200])
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "paid")
+        self.assertIsNotNone(self.order.paid_at)
+        self.assertEqual(
+            OrderStatusHistory.objects.filter(order=self.order, field="payment_status", to_state="paid").count(), 1
+        )
+
+    def test_late_pending_event_does_not_undo_a_payment(self):
+        for evt in (self.event("paid", "evt_1"), self.event("pending", "evt_2")):
+            record_culqi_event(json.dumps(evt).encode(), evt)
+
+        process_pending()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "paid")
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+
+class BulkTransitionTests(ShopTestCase):
+    def test_only_allowed_orders_move_and_each_gets_history(self):
+        new = Order.objects.create(full_name="Nuevo")
+        delivered = Order.objects.create(full_name="Entregado", status="delivered")
+
+        changed = bulk_transition(Order.objects.all(), "status", "cancelled", source="test")
+
+        self.assertEqual(changed, [new.pk])
+        new.refresh_from_db()
+        delivered.refresh_from_db()
+        self.assertEqual((new.status, delivered.status), ("cancelled", "delivered"))
+        history = OrderStatusHistory.objects.get()
+        self.assertEqual((history.order_id, history.from_state, history.to_state), (new.pk, "new", "cancelled"))
+
+    def test_paid_keeps_existing_paid_at(self):
+        order = Order.objects.create(full_name="Pendiente", payment_status="pending_review")
+
+        bulk_transition(Order.objects.all(), "payment_status", "paid")
+        order.refresh_from_db()
+        first_paid_at = order.paid_at
+        bulk_transition(Order.objects.all(), "payment_status", "paid")
+
+        order.refresh_from_db()
+        self.assertIsNotNone(first_paid_at)
+        self.assertEqual(order.paid_at, first_paid_at)
+        self.assertEqual(OrderStatusHistory.objects.count(), 1)
+
+
+class ProductImportTests(ShopTestCase):
+    def test_dry_run_reports_diff_without_writing(self):
+        self.make_product("Taza", price="10.00", stock=5, sku="T-1")
+        data = "sku;nombre;precio;stock\nT-1;Taza;12,50;5\nT-2;Plato;4;3\n;Sin sku;1;1\n".encode()
+
+        report = import_products(io.BytesIO(data), "productos.csv", dry_run=True)
+
+        self.assertEqual((report.created, report.updated, report.error_count), (1, 1, 1))
+        self.assertIn("+ T-2 Plato S/ 4.00", report.diff)
+        self.assertTrue(any(line.startswith("~ T-1 price") for line in report.diff))
+        self.assertFalse(Product.objects.filter(sku="T-2").exists())
+
+    def test_stock_column_is_on_hand_minus_active_holds(self):
+        mug = self.make_product(stock=5, sku="T-1")
+        self.place({mug.pk: 2})
+
+        import_products(io.BytesIO(b"sku,stock\nT-1,10\n"), "productos.csv")
+
+        mug.refresh_from_db()
+        self.assertEqual(mug.stock, 8)
+
+    def test_out_of_range_numbers_are_row_errors(self):
+        data = (
+            "sku,nombre,precio,stock\n"
+            "A,Uno,NaN,1\nB,Dos,Infinity,1\nC,Tres,1e30,1\nD,Cuatro,100000000,1\n"
+            "E,Cinco,5,1e30\nF,Seis,5,Infinity\nG,Siete,99999999.99,2147483647\n"
+        ).encode()
+
+        report = import_products(io.BytesIO(data), "productos.csv")
+
+        self.assertEqual([line for line, _ in report.errors], [2, 3, 4, 5, 6, 7])
+        self.assertEqual(list(Product.objects.values_list("sku", flat=True)), ["G"])
+
+    def test_excel_cp1252_csv_is_read(self):
+        data = "sku;nombre;precio\nC-1;Cerámica;15\n".encode("cp1252")
+
+        report = import_products(io.BytesIO(data), "productos.csv")
+
+        self.assertEqual(report.created, 1)
+        self.assertEqual(Product.objects.get(sku="C-1").name, "Cerámica")
+
+    def test_undecodable_csv_raises_import_error_before_writing(self):
+        data = b"sku,nombre,precio\nA,Uno,1\n" + b"B,\x81\x8d,1\n"
+
+        with self.assertRaises(ProductImportError):
+            import_products(io.BytesIO(data), "productos.csv")
+        self.assertFalse(Product.objects.exists())
+
+
+class SearchTests(ShopTestCase):
+    def test_prefix_match_ignores_accents_and_ranks_name_first(self):
+        in_name = self.make_product("Cerámica pintada")
+        in_description = self.make_product("Florero", description="Hecho de ceramica artesanal")
+        self.make_product("Vaso de vidrio")
+
+        results = list(search_products(Product.objects.all(), "ceram").order_by("-search_rank"))
+
+        self.assertEqual(results, [in_name, in_description])
+
+    def test_catalog_search_hides_inactive_products(self):
+        self.make_product("Cuadro bordado")
+        self.make_product("Cuadro retirado", is_active=False)
+
+        response = self.client.get(reverse("product_list"), {"q": "cuadro"})
+
+        self.assertContains(response, "Cuadro bordado")
+        self.assertNotContains(response, "Cuadro retirado")
+
+    def test_empty_query_matches_nothing(self):
+        self.make_product("Taza")
+        self.assertFalse(search_products(Product.objects.all(), "  ¿?  ").exists())
+
+
+class KeysetPaginationTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        # precios distintos: el orden por precio es estable y fácil de verificar
+        self.products = [self.make_product(f"Producto {i:02d}", price=f"{i + 1}.00") for i in range(30)]
+
+    def tampered(self, tag, values):
+        return encode_cursor(tag, "next", values)
+
+    def test_next_and_prev_cursors_walk_the_catalog(self):
+        first = keyset_paginate(Product.objects.all(), CATALOG_ORDERINGS["price_asc"], per_page=24, tag="price_asc")
+        second = keyset_paginate(
+            Product.objects.all(), CATALOG_ORDERINGS["price_asc"], first.next_cursor, per_page=24, tag="price_asc"
+        )
+        back = keyset_paginate(
+            Product.objects.all(), CATALOG_ORDERINGS["price_asc"], second.prev_cursor, per_page=24, tag="price_asc"
+        )
+
+        self.assertEqual([p.pk for p in first], [p.pk for p in self.products[:24]])
+        self.assertEqual([p.pk for p in second], [p.pk for p in self.products[24:]])
+        self.assertFalse(second.has_next)
+        self.assertEqual([p.pk for p in back], [p.pk for p in first])
+
+    def test_tampered_cursors_fall_back_to_the_first_page(self):
+        cases = [
+            ("price_asc", ["abc", 1]),
+            ("new", ["notadate", 1]),
+            ("new", [None, None]),
+            ("price_asc", [{"x": 1}, 1]),
+            ("price_asc", ["NaN", 1]),
+            ("price_asc", ["5.00", 10 ** 30]),
+        ]
+        for tag, values in cases:
+            with self.subTest(tag=tag, values=values):
+                response = self.client.get(
+                    reverse("product_list"), {"order": tag, "cursor": self.tampered(tag, values)}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.context["page"].has_prev)
+                self.assertEqual(len(response.context["page"]), 24)
+
+    def test_tampered_relevance_cursor_falls_back_to_the_first_page(self):
+        cursor = self.tampered("relevance", ["mucho", "2026-01-01T00:00:00+00:00", 1])
+        response = self.client.get(reverse("product_list"), {"q": "producto", "cursor": cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context["page"].has_prev)
+
+    def test_garbage_cursor_is_ignored(self):
+        response = self.client.get(reverse("product_list"), {"cursor": "%%%no-es-base64"})
+        self.assertEqual(response.status_code, 200)
+
+
+class BenchCatalogTests(ShopTestCase):
+    def test_refuses_to_seed_without_scratch_flag(self):
+        with self.assertRaises(CommandError):
+            call_command("bench_catalog", "10", stdout=io.StringIO())
+        self.assertFalse(Product.objects.exists())
+
+
+class ProductCardCacheTests(ShopTestCase):
+    def test_cards_are_cached_until_the_product_changes(self):
+        product = self.make_product("Vela de soya")
+        self.assertIn("Vela de soya", render_product_cards([product.pk], "list")[0])
+
+        # update() no dispara señales: la tarjeta cacheada sigue igual
+        Product.objects.filter(pk=product.pk).update(name="Vela renombrada")
+        self.assertIn("Vela de soya", render_product_cards([product.pk], "list")[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.refresh_from_db()
+            product.name = "Vela aromática"
+            product.save()
+        self.assertIn("Vela aromática", render_product_cards([product.pk], "list")[0])
+
+    def test_featured_ids_follow_the_catalog_version(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.make_product("Primero")
+        self.assertEqual(featured_product_ids(), [first.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.make_product("Segundo")
+        self.assertEqual(featured_product_ids(), [second.pk, first.pk])
+
+
+class ImageVariantTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media()
+
+    def photo(self, name, size=(800, 600)):
+        return SimpleUploadedFile(name, self.png(size), content_type="image/png")
+
+    def files(self, product):
+        return {name for names in product.image_variants["widths"].values() for name in names.values()}
+
+    def test_upload_builds_smaller_webp_and_jpeg_variants(self):
+        product = self.make_product(image=self.photo("vela.png"))
+        product.refresh_from_db()
+
+        self.assertEqual(product.image_variants["src"], product.image.name)
+        self.assertEqual(sorted(product.image_variants["widths"], key=int), ["320", "640"])
+        for name in self.files(product):
+            self.assertTrue(default_storage.exists(name))
+
+    def test_old_variants_are_deleted_only_after_commit(self):
+        product = self.make_product(image=self.photo("vela.png"))
+        product.refresh_from_db()
+        old = self.files(product)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.image = self.photo("vela-nueva.png", size=(400, 300))
+            product.save()
+        # antes del commit los archivos viejos siguen ahí (un rollback no rompe la foto)
+        self.assertTrue(all(default_storage.exists(name) for name in old))
+
+        for callback in callbacks:
+            callback()
+        self.assertFalse(any(default_storage.exists(name) for name in old))
+
+
+class ReceiptProcessingTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media()
+        self.order = Order.objects.create(full_name="Comprobante", total=10)
+
+    def attach(self, content, name="captura.png"):
+        self.order.receipt_image.save(name, ContentFile(content))
+        return self.order.receipt_image.name
+
+    def test_receipt_is_resized_thumbnailed_and_original_removed(self):
+        original = self.attach(self.png((3000, 2000)))
+
+        self.assertTrue(process_receipt(self.order.pk))
+        self.order.refresh_from_db()
+
+        self.assertIsNotNone(self.order.receipt_processed_at)
+        self.assertFalse(default_storage.exists(original))
+        with default_storage.open(self.order.receipt_image.name) as fh:
+            img = Image.open(fh)
+            self.assertEqual((img.format, max(img.size)), ("JPEG", RECEIPT_MAX_SIDE))
+        with default_storage.open(self.order.receipt_thumb.name) as fh:
+            self.assertEqual(max(Image.open(fh).size), RECEIPT_THUMB_SIDE)
+
+        # idempotente: ya procesado
+        self.assertFalse(process_receipt(self.order.pk))
+
+    def test_undecodable_receipt_is_kept_and_marked_processed(self):
+        original = self.attach(self.png()[:200])
+
+        with self.assertLogs("shop.receipts", "WARNING"):
+            self.assertFalse(process_receipt(self.order.pk))
+        self.order.refresh_from_db()
+
+        self.assertEqual(self.order.receipt_image.name, original)
+        self.assertTrue(default_storage.exists(original))
+        self.assertFalse(self.order.receipt_thumb)
+        self.assertIsNotNone(self.order.receipt_processed_at)
+
+
+class HoldReleaseTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.make_product(stock=5)
+        self.order, _ = self.place({self.product.pk: 2})
+        self.admin = User.objects.create_superuser("daniela", "d@example.com", "x")
+        self.client.force_login(self.admin)
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock
+
+    def action(self, name):
+        return self.client.post(
+            reverse("admin:shop_order_changelist"), {"action": name, "_selected_action": [self.order.pk]}
+        )
+
+    def test_deleting_an_unpaid_order_returns_its_holds(self):
+        self.assertEqual(self.stock(), 3)
+        self.order.delete()
+        self.assertEqual(self.stock(), 5)
+
+    def test_bulk_delete_from_admin_returns_holds(self):
+        self.client.post(
+            reverse("admin:shop_order_changelist"),
+            {"action": "delete_selected", "_selected_action": [self.order.pk], "post": "yes"},
+        )
+        self.assertFalse(Order.objects.filter(pk=self.order.pk).exists())
+        self.assertEqual(self.stock(), 5)
+
+    def test_cancelling_a_confirmed_order_returns_consumed_holds(self):
+        self.action("mark_confirmed")
+        self.assertEqual(StockHold.objects.get(order=self.order).state, "consumed")
+        self.assertEqual(self.stock(), 3)
+
+        self.action("mark_cancelled")
+        self.assertEqual(StockHold.objects.get(order=self.order).state, "released")
+        self.assertEqual(self.stock(), 5)
+
+        # otra cancelación no devuelve dos veces
+        self.action("mark_cancelled")
+        self.assertEqual(self.stock(), 5)
+
+
+class SessionStoreTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        store = SessionStore()
+        store["cart"] = "1:1"
+        store.create()
+        self.key = store.session_key
+
+    def db_data(self):
+        return Session.objects.get(session_key=self.key).get_decoded()
+
+    def change(self, **values):
+        store = SessionStore(self.key)
+        store.load()
+        for key, value in values.items():
+            store[key] = value
+        store.save()
+
+    def test_cart_changes_stay_in_cache_until_the_next_sync(self):
+        self.change(cart="1:3")
+
+        self.assertEqual(SessionStore(self.key)["cart"], "1:3")
+        self.assertEqual(self.db_data()["cart"], "1:1")
+
+        with self.settings(SESSION_DB_SYNC_SECONDS=0):
+            self.change(cart="1:4")
+        self.assertEqual(self.db_data()["cart"], "1:4")
+
+    def test_other_keys_are_written_to_the_db_at_once(self):
+        self.change(cart="1:2", order_access=["DANI-ABC"])
+        self.assertEqual(self.db_data()["order_access"], ["DANI-ABC"])
+        self.assertEqual(self.db_data()["cart"], "1:2")
+
+    def test_lost_cache_entry_falls_back_to_the_db_copy(self):
+        self.change(cart="1:3")
+        caches["sessions"].clear()
+        self.assertEqual(SessionStore(self.key)["cart"], "1:1")
+
+
+class CartApiTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mug = self.make_product("Taza", price="12.50", stock=2)
+
+    def post(self, name, pk, **data):
+        return self.client.post(reverse(name, args=[pk]), data, HTTP_ACCEPT="application/json")
+
+    def cart(self):
+        return self.client.session.get("cart", "")
+
+    def test_add_returns_line_total_and_count(self):
+        self.post("cart_api_add", self.mug.pk)
+        data = self.post("cart_api_add", self.mug.pk).json()
+
+        self.assertTrue(data["ok"])
+        self.assertEqual(data["line"], {"qty": 2, "price": "12.50", "subtotal": "25.00", "subtotal_display": "25,00"})
+        self.assertEqual((data["total"], data["cart_count"]), ("25.00", 2))
+        self.assertEqual(self.cart(), f"{self.mug.pk}:2")
+
+    def test_quantity_is_capped_at_stock(self):
+        response = self.post("cart_api_set", self.mug.pk, qty=9)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Solo quedan 2", response.json()["message"])
+        self.assertEqual(self.cart(), f"{self.mug.pk}:2")
+
+    def test_sold_out_and_inactive_products_are_rejected(self):
+        sold_out = self.make_product("Agotado", stock=0)
+        hidden = self.make_product("Oculto", is_active=False)
+
+        self.assertEqual(self.post("cart_api_add", sold_out.pk).status_code, 409)
+        self.assertEqual(self.post("cart_api_add", hidden.pk).status_code, 404)
+        self.assertEqual(self.cart(), "")
+
+    def test_decrease_remove_and_invalid_quantity(self):
+        self.post("cart_api_set", self.mug.pk, qty=2)
+        self.assertEqual(self.post("cart_api_decrease", self.mug.pk).json()["line"]["qty"], 1)
+        self.assertEqual(self.post("cart_api_set", self.mug.pk, qty="dos").status_code, 400)
+
+        data = self.post("cart_api_remove", self.mug.pk).json()
+        self.assertEqual((data["line"], data["cart_count"]), (None, 0))
+
+    def test_without_javascript_redirects_back(self):
+        response = self.client.post(reverse("cart_api_add", args=[self.mug.pk]))
+        self.assertRedirects(response, reverse("cart_detail"), fetch_redirect_response=False)
+        self.assertEqual(self.cart(), f"{self.mug.pk}:1")
+
+
+class CartBatchTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mug = self.make_product("Taza", price="10.00", stock=10)
+        self.plate = self.make_product("Plato", price="5.00", stock=3)
+
+    def batch(self, mode, *items):
+        payload = {"mode": mode, "items": [{"product_id": pid, "qty": qty} for pid, qty in items]}
+        return self.client.post(
+            reverse("cart_api_batch"), json.dumps(payload),
+            content_type="application/json", HTTP_ACCEPT="application/json",
+        )
+
+    def test_add_sums_repeated_lines_and_existing_quantities(self):
+        self.set_cart({self.mug.pk: 1})
+        data = self.batch("add", (self.mug.pk, 2), (self.plate.pk, 1), (self.mug.pk, 3)).json()
+
+        self.assertTrue(data["ok"])
+        self.assertEqual((data["cart_count"], data["total"]), (7, "65.00"))
+
+    def test_one_line_over_stock_leaves_the_cart_untouched(self):
+        self.set_cart({self.mug.pk: 1})
+        response = self.batch("add", (self.mug.pk, 2), (self.plate.pk, 4))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["errors"], [
+            {"product_id": self.plate.pk, "message": "Solo quedan 3 unidades de Plato.", "available": 3},
+        ])
+        self.assertEqual(self.client.session["cart"], f"{self.mug.pk}:1")
+
+    def test_set_replaces_quantities_and_zero_removes(self):
+        self.set_cart({self.mug.pk: 4, self.plate.pk: 1})
+        data = self.batch("set", (self.mug.pk, 2), (self.plate.pk, 0)).json()
+        self.assertEqual(data["cart_count"], 2)
+        self.assertEqual(self.client.session["cart"], f"{self.mug.pk}:2")
+
+    def test_malformed_payloads_are_rejected(self):
+        for payload in ('{"items": "x"}', '{"mode": "nope", "items": []}', "no es json"):
+            with self.subTest(payload=payload):
+                response = self.client.post(
+                    reverse("cart_api_batch"), payload,
+                    content_type="application/json", HTTP_ACCEPT="application/json",
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.batch("add", (self.mug.pk, -1)).status_code, 400)
+        self.assertEqual(self.batch("add", *[(self.mug.pk, 1)] * (CART_BATCH_MAX_LINES + 1)).status_code, 400)
+
+    def test_form_post_uses_repeated_fields(self):
+        response = self.client.post(
+            reverse("cart_api_batch"), {"product_id": [self.mug.pk, self.plate.pk], "qty": [1, 2]}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.session["cart"], f"{self.mug.pk}:1,{self.plate.pk}:2")
+
+
+class ProductSnapshotTests(ShopTestCase):
+    def test_second_read_is_served_from_memory(self):
+        mug = self.make_product("Taza", price="12.50")
+        snapshots.get_snapshots([mug.pk])
+
+        with self.assertNumQueries(0):
+            snap = snapshots.get_snapshots([mug.pk, str(mug.pk)])[mug.pk]
+        self.assertEqual((snap.name, snap.price, snap.stock), ("Taza", Decimal("12.50"), 5))
+
+    def test_edit_bumps_the_version_and_rereads(self):
+        mug = self.make_product("Taza")
+        snapshots.get_snapshots([mug.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mug.price = Decimal("15.00")
+            mug.save()
+        self.assertEqual(snapshots.get_snapshots([mug.pk])[mug.pk].price, Decimal("15.00"))
+
+    def test_deleted_products_are_dropped(self):
+        mug = self.make_product("Taza")
+        pk = mug.pk
+        snapshots.get_snapshots([pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            mug.delete()
+        self.assertEqual(snapshots.get_snapshots([pk]), {})
+
+    @override_settings(SHOP_SNAPSHOT_CACHE_SIZE=2)
+    def test_least_recently_used_snapshot_is_evicted(self):
+        a, b, c = (self.make_product(name) for name in ("A", "B", "C"))
+        snapshots.get_snapshots([a.pk, b.pk])
+        snapshots.get_snapshots([a.pk])
+        snapshots.get_snapshots([c.pk])
+
+        with self.assertNumQueries(0):
+            snapshots.get_snapshots([a.pk, c.pk])
+        with self.assertNumQueries(1):
+            snapshots.get_snapshots([b.pk])
+
+
+class WhatsappTrackingTests(ShopTestCase):
+    def test_normalize_whatsapp_variants(self):
+        cases = {
+            "944 739 301": "+51944739301",
+            "+51 944-739-301": "+51944739301",
+            "51944739301": "+51944739301",
+            "0051944739301": "+51944739301",
+            "0944739301": "+51944739301",
+            "+34 612 345 678": "+34612345678",
+            "": "",
+            "abc": "",
+            "12": "",
+        }
+        for raw, expected in cases.items():
+            with self.subTest(raw=raw):
+                self.assertEqual(normalize_whatsapp(raw), expected)
+
+    def test_order_stores_the_normalized_number(self):
+        order = Order.objects.create(full_name="Ana", whatsapp="944-739-301", total=10)
+        self.assertEqual(order.whatsapp_e164, "+51944739301")
+
+    def test_track_order_matches_any_spelling_of_the_number(self):
+        order = Order.objects.create(full_name="Ana", whatsapp="944739301", total=10)
+
+        response = self.client.post(reverse("track_order"), {"code": order.code.lower(), "whatsapp": "+51 944 739 301"})
+        self.assertRedirects(response, reverse("order_detail_code", args=[order.code]), fetch_redirect_response=False)
+        self.assertIn(order.code, self.client.session["order_access"])
+
+    def test_track_order_rejects_a_wrong_number(self):
+        order = Order.objects.create(full_name="Ana", whatsapp="944739301", total=10)
+
+        response = self.client.post(reverse("track_order"), {"code": order.code, "whatsapp": "944739302"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("order_access", self.client.session)
+
+
+class MyOrdersTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("ana", "ana@example.com", "x")
+        self.orders = [
+            Order.objects.create(user=self.user, full_name="Ana", total=10) for _ in range(MY_ORDERS_PAGE_SIZE + 2)
+        ]
+        Order.objects.create(user=User.objects.create_user("otra"), full_name="Otra", total=10)
+        self.client.force_login(self.user)
+
+    def page(self, **params):
+        response = self.client.get(reverse("my_orders"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context["page"]
+
+    def test_pages_list_only_my_orders_newest_first(self):
+        first = self.page()
+        second = self.page(cursor=first.next_cursor)
+
+        newest = [o.pk for o in reversed(self.orders)]
+        self.assertEqual([o.pk for o in first], newest[:MY_ORDERS_PAGE_SIZE])
+        self.assertEqual([o.pk for o in second], newest[MY_ORDERS_PAGE_SIZE:])
+        self.assertFalse(second.has_next)
+
+    def test_forged_cursors_show_the_first_page(self):
+        first = [o.pk for o in self.page()]
+        for values in (["notadate", 1], [None, None], [{"a": 1}, 1], ["2026-01-01T00:00:00", "x"]):
+            with self.subTest(values=values):
+                page = self.page(cursor=encode_cursor("orders", "next", values))
+                self.assertEqual([o.pk for o in page], first)
+                self.assertFalse(page.has_prev)
+
+
+class OrderEventsTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(full_name="Ana", total=10)
+
+    def test_wsgi_answers_one_event_with_retry(self):
+        session = self.client.session
+        session["order_access"] = [self.order.code]
+        session.save()
+
+        response = self.client.get(reverse("order_events", args=[self.order.code]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = response.content.decode()
+        self.assertTrue(body.startswith("retry: "))
+        data = json.loads(body.split("data: ", 1)[1])
+        self.assertEqual((data["code"], data["status"], data["payment_status"]), (self.order.code, "new", "unpaid"))
+
+    def test_unknown_or_foreign_orders_are_refused(self):
+        self.assertEqual(self.client.get(reverse("order_events", args=["DANI-NOPE"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("order_events", args=[self.order.code])).status_code, 403)
+
+    def test_broker_pushes_only_changed_states(self):
+        initial = order_state(self.order)
+        paid = {**initial, "payment_status": "paid"}
+        broker = OrderEventBroker()
+
+        async def scenario():
+            queue = await broker.subscribe(self.order.code, initial)
+            other = await broker.subscribe(self.order.code, initial)
+
+            broker.wake()
+            first = await asyncio.wait_for(queue.get(), 1)
+            self.assertEqual(await asyncio.wait_for(other.get(), 1), paid)
+
+            # el mismo estado otra vez no se reenvía
+            broker.wake()
+            await asyncio.sleep(0.05)
+            self.assertTrue(queue.empty())
+
+            broker.unsubscribe(self.order.code, queue)
+            broker.unsubscribe(self.order.code, other)
+            return first
+
+        with mock.patch("shop.events._fetch_states", lambda codes: {self.order.code: paid}):
+            self.assertEqual(asyncio.run(scenario()), paid)
+
+
+class CulqiClientTests(ShopTestCase):
+    payload = {"amount": 1250, "currency_code": "PEN", "description": "Pedido", "order_number": "DANI-TEST"}
+
+    def test_create_and_get_reuse_one_connection(self):
+        server, client = self.fake_culqi()
+
+        created = client.create_order(self.payload)
+        for _ in range(3):
+            self.assertEqual(client.get_order(created["id"])["state"], "pending")
+
+        self.assertEqual(server.requests, 4)
+        self.assertEqual(len(server.connections), 1)
+        stats = client.stats.snapshot()
+        self.assertEqual((stats["create_order"]["ok"], stats["get_order"]["ok"]), (1, 3))
+
+    def test_client_errors_raise_culqi_error(self):
+        server, _ = self.fake_culqi()
+        client = CulqiClient(secret_key="", base_url=server.base_url, retries=0)
+        self.addCleanup(client.close)
+
+        with self.assertRaises(CulqiError) as ctx:
+            client.get_order("ord_nope")
+        self.assertEqual(ctx.exception.status, 401)
+        self.assertNotIsInstance(ctx.exception, CulqiUnavailable)
+
+    def test_breaker_opens_after_repeated_server_errors(self):
+        server, client = self.fake_culqi(fail_rate=1.0)
+        client.breaker.max_failures = 2
+
+        for _ in range(2):
+            with self.assertRaises(CulqiUnavailable):
+                client.get_order("ord_x")
+        self.assertEqual(client.breaker.state, "open")
+
+        # con el circuito abierto ni siquiera se llama al servidor
+        with self.assertRaises(CulqiUnavailable):
+            client.get_order("ord_x")
+        self.assertEqual(server.requests, 2)
+        self.assertEqual(client.stats.snapshot()["get_order"]["short_circuit"], 1)
+
+
+class CulqiOrderReuseTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server, client = self.fake_culqi()
+        patcher = mock.patch("shop.views.get_culqi_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.order, _ = self.place({self.make_product(price="12.50").pk: 2})
+        session = self.client.session
+        session["order_access"] = [self.order.code]
+        session.save()
+
+    def open_payment(self):
+        response = self.client.post(reverse("culqi_create_order", args=[self.order.code]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_reopening_the_modal_reuses_the_culqi_order(self):
+        first = self.open_payment()
+        second = self.open_payment()
+
+        self.assertEqual((first["reused"], second["reused"]), (False, True))
+        self.assertEqual(first["order_id"], second["order_id"])
+        self.assertEqual(first["amount"], 2500)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_new_culqi_order_when_total_changes_or_expiry_is_near(self):
+        first = self.open_payment()
+
+        Order.objects.filter(pk=self.order.pk).update(total=Decimal("30.00"))
+        changed = self.open_payment()
+        self.assertFalse(changed["reused"])
+        self.assertNotEqual(changed["order_id"], first["order_id"])
+
+        Order.objects.filter(pk=self.order.pk).update(culqi_expires_at=timezone.now() + timedelta(seconds=60))
+        self.assertFalse(self.open_payment()["reused"])
+
+    def test_cancelled_culqi_order_is_replaced(self):
+        first = self.open_payment()
+        Order.objects.filter(pk=self.order.pk).update(culqi_last_state="expired")
+        replaced = self.open_payment()
+        self.assertNotEqual(replaced["order_id"], first["order_id"])
+        self.assertEqual(self.server.requests, 2)
+
+    def test_unavailable_culqi_answers_503(self):
+        self.server.fail_rate = 1.0
+        response = self.client.post(reverse("culqi_create_order", args=[self.order.code]))
+        self.assertEqual(response.status_code, 503)
+
+
+class ReconcileTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server, self.culqi = self.fake_culqi()
+        self.orders = {}
+        for state in ("paid", "pending", "expired"):
+            order, _ = self.place({self.make_product(name=state).pk: 1})
+            order.culqi_order_id = f"ord_{state}"
+            order.save(update_fields=["culqi_order_id"])
+            self.server.seed_order(order.culqi_order_id, state=state)
+            self.orders[state] = order
+
+    def reconcile(self, **options):
+        out = io.StringIO()
+        with mock.patch("shop.management.commands.reconcile_culqi.build_client", return_value=self.culqi):
+            call_command("reconcile_culqi", stdout=out, **options)
+        return out.getvalue()
+
+    def test_pays_missed_webhooks_and_records_culqi_states(self):
+        output = self.reconcile(workers=2)
+
+        self.assertIn("3 pedidos actualizados (1 pagados)", output)
+        paid = Order.objects.get(pk=self.orders["paid"].pk)
+        self.assertEqual(paid.payment_status, "paid")
+        self.assertIsNotNone(paid.paid_at)
+        self.assertTrue(OrderStatusHistory.objects.filter(order=paid, source="reconcile", to_state="paid").exists())
+        self.assertEqual(set(paid.holds.values_list("state", flat=True)), {"consumed"})
+        self.assertEqual(Order.objects.get(pk=self.orders["expired"].pk).culqi_last_state, "expired")
+
+        # segunda vuelta: nada cambió
+        self.assertIn("0 pedidos actualizados (0 pagados)", self.reconcile())
+
+    def test_dry_run_writes_nothing(self):
+        output = self.reconcile(dry_run=True)
+        self.assertIn("(dry-run) 3 cambiarían de estado, 1 quedarían pagados.", output)
+        self.assertFalse(Order.objects.filter(payment_status="paid").exists())
+
+    def test_order_paid_meanwhile_is_not_paid_twice(self):
+        candidates = reconcile_candidates(timezone.now() - timedelta(hours=1))
+        states, errors, _ = fetch_culqi_states(candidates, self.culqi, workers=2)
+        # llega el webhook entre la consulta y el guardado
+        bulk_transition(Order.objects.filter(pk=self.orders["paid"].pk), "payment_status", "paid", source="webhook")
+
+        result = apply_culqi_states(candidates, states)
+
+        self.assertEqual((errors, result["paid"]), (0, 0))
+        self.assertFalse(OrderStatusHistory.objects.filter(source="reconcile").exists())
+
+
+class ReceiptUploadTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media()
+        self.order, _ = self.place({self.make_product().pk: 1})
+        session = self.client.session
+        session["order_access"] = [self.order.code]
+        session.save()
+
+    def upload(self):
+        return self.client.post(
+            reverse("upload_receipt", args=[self.order.code]),
+            {"receipt_image": SimpleUploadedFile("pago.png", self.png(), content_type="image/png")},
+        )
+
+    def history(self):
+        return list(self.order.status_history.values_list("from_state", "to_state", "source"))
+
+    def test_upload_moves_to_review_with_history(self):
+        self.upload()
+        self.order.refresh_from_db()
+
+        self.assertEqual(self.order.payment_status, "pending_review")
+        self.assertTrue(self.order.receipt_image)
+        self.assertEqual(self.history(), [("unpaid", "pending_review", "cliente")])
+
+        # otro comprobante mientras está en revisión: sin fila nueva
+        self.upload()
+        self.assertEqual(len(self.history()), 1)
+
+    def test_paid_order_does_not_go_back_to_review(self):
+        bulk_transition(Order.objects.filter(pk=self.order.pk), "payment_status", "paid")
+        before = self.history()
+
+        self.upload()
+        self.order.refresh_from_db()
+
+        self.assertEqual(self.order.payment_status, "paid")
+        self.assertFalse(self.order.receipt_image)
+        self.assertEqual(self.history(), before)
+
+
+class ExportTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        mug = self.make_product("=HYPERLINK(\"http://x\")", price="12.50", sku="-SKU")
+        self.order, _ = self.place({mug.pk: 2}, full_name="=1+1", address="@SUM(A1)", whatsapp="+51 944 739 301")
+
+    def csv_rows(self, kind):
+        response = csv_response(Order.objects.all(), kind)
+        body = b"".join(response.streaming_content).decode("utf-8-sig")
+        return list(csv.reader(io.StringIO(body)))
+
+    def test_csv_escapes_formulas_but_keeps_phone_numbers(self):
+        header, row = self.csv_rows("orders")
+        values = dict(zip(header, row))
+
+        self.assertEqual(values["Cliente"], "'=1+1")
+        self.assertEqual(values["Dirección"], "'@SUM(A1)")
+        self.assertEqual(values["WhatsApp"], "+51944739301")
+        self.assertEqual(values["Total (S/)"], "25.00")
+
+    def test_items_csv_has_one_row_per_product(self):
+        header, row = self.csv_rows("items")
+        values = dict(zip(header, row))
+        self.assertEqual((values["Producto"], values["SKU"]), ("'=HYPERLINK(\"http://x\")", "'-SKU"))
+        self.assertEqual((values["Cantidad"], values["Subtotal (S/)"]), ("2", "25.00"))
+
+    def test_xlsx_writes_text_cells_for_formula_like_values(self):
+        buf = io.BytesIO()
+        counts = write_xlsx(Order.objects.all(), buf)
+        self.assertEqual(counts, {"orders": 1, "items": 1})
+
+        buf.seek(0)
+        wb = load_workbook(buf)
+        cell = wb["Pedidos"]["C2"]
+        self.assertEqual((cell.value, cell.data_type), ("=1+1", "s"))
+        self.assertEqual(wb["Items"]["F2"].data_type, "s")
@@ -14,12 +14,20 @@ urlpatterns = [
     path("carrito/quitar/<int:pk>/", views.cart_remove, name="cart_remove"),
     path("carrito/vaciar/", views.cart_clear, name="cart_clear"),
 
+    # ✅ Carrito sin recargar la página (JSON; POST con CSRF)
+    path("api/carrito/agregar/<int:pk>/", views.cart_api_add, name="cart_api_add"),
+    path("api/carrito/bajar/<int:pk>/", views.cart_api_decrease, name="cart_api_decrease"),
+    path("api/carrito/quitar/<int:pk>/", views.cart_api_remove, name="cart_api_remove"),
+    path("api/carrito/cantidad/<int:pk>/", views.cart_api_set, name="cart_api_set"),
+    path("api/carrito/lote/", views.cart_api_batch, name="cart_api_batch"),
+
     path("checkout/", views.checkout, name="checkout"),
 
     # ✅ Seguimiento por código + comprobante
     path("mis-pedidos/", views.track_order, name="track_order"),
     path("pedido/<str:code>/", views.order_detail_code, name="order_detail_code"),
     path("pedido/<str:code>/comprobante/", views.upload_receipt, name="upload_receipt"),
+    path("pedido/<str:code>/eventos/", views.order_events, name="order_events"),
     path("panel/mis-pedidos/", views.my_orders, name="my_orders"),
 
     # extras
@@ -1,35 +1,76 @@
+from datetime import timedelta
 from decimal import Decimal
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
 
 from django.http import HttpRequest
-from django.db.models import Q
-from django.utils import timezone
+from django.utils import formats, timezone
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.conf import settings
-import time
+import os
 import json
+import uuid
 import base64
-import requests
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpResponse
-from .models import Product, Order, OrderItem, Address
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+import asyncio
+from .models import Product, Order, Address
 from .forms import CheckoutForm, ReceiptUploadForm, AddressForm
+from .search import search_products
+from .pagination import keyset_paginate
+from .fragments import featured_product_ids, render_product_cards
+from .receipts import process_receipt
+from .tasks import run_in_background
+from .orders import AlreadyPlaced, OutOfStock, find_placed_order, place_order
+from .inventory import extend_holds, hold_ttl, review_ttl, schedule_hold_sweep
+from .snapshots import get_snapshots
+from .phones import normalize_whatsapp
+from .culqi import CulqiError, CulqiUnavailable, get_client as get_culqi_client
+from .payments import CULQI_ORDER_EVENT, kick as kick_webhook_worker, record_culqi_event
+from .events import STATE_FIELDS, broker as order_events_broker, notify_order_changed, order_state
+from .transitions import allowed_sources, bulk_transition
 
 DANIELA_WSP = "51944739301"
 
+CATALOG_PAGE_SIZE = 24
+
+# ✅ Orden del catálogo: siempre termina en id para que el cursor sea único
+CATALOG_ORDERINGS = {
+    "new": ("-created_at", "-id"),
+    "price_asc": ("price", "id"),
+    "price_desc": ("-price", "-id"),
+    "relevance": ("-search_rank", "-created_at", "-id"),
+}
+
 
 # -------------------
 # Helpers carrito
 # -------------------
+def _encode_cart(cart) -> str:
+    # ✅ formato compacto en sesión: "12:3,45:1" (id:cantidad, ordenado por id)
+    return ",".join(f"{pid}:{int(qty)}" for pid, qty in sorted(cart.items(), key=lambda kv: int(kv[0])) if int(qty) > 0)
+
+def _decode_cart(raw) -> dict:
+    if isinstance(raw, dict):  # sesiones viejas: {"12": 3}
+        return {str(pid): int(qty) for pid, qty in raw.items()}
+    cart = {}
+    for part in (raw or "").split(","):
+        pid, _, qty = part.partition(":")
+        if pid.isdigit() and qty.isdigit() and int(qty) > 0:
+            cart[pid] = int(qty)
+    return cart
+
 def _get_cart(request):
-    return request.session.get("cart", {})
+    return _decode_cart(request.session.get("cart"))
 
 def _save_cart(request, cart):
-    request.session["cart"] = cart
-    request.session.modified = True
+    raw = _encode_cart(cart)
+    # solo marcar la sesión como modificada si el carrito cambió de verdad
+    if request.session.get("cart", "") != raw:
+        request.session["cart"] = raw
 
 def _cart_count(cart):
     return sum(int(q) for q in cart.values())
@@ -63,16 +104,17 @@ def _can_view_order(request, order: Order) -> bool:
 # -------------------
 # Catálogo
 # -------------------
-def product_list(request):
+def _catalog_queryset(q="", minp="", maxp="", order="new"):
+    """
+    Queryset filtrado del catálogo + el orden efectivo.
+    Lo usan product_list y el comando bench_catalog (mismas consultas).
+    """
     qs = Product.objects.filter(is_active=True)
 
-    q = request.GET.get("q", "").strip()
-    order = request.GET.get("order", "new")
-    minp = request.GET.get("min", "").strip()
-    maxp = request.GET.get("max", "").strip()
-
     if q:
-        qs = qs.filter(Q(name__icontains=q) | Q(description__icontains=q))
+        qs = search_products(qs, q)
+    elif order == "relevance":
+        order = "new"
 
     try:
         if minp:
@@ -86,16 +128,42 @@ def product_list(request):
     except Exception:
         pass
 
-    if order == "price_asc":
-        qs = qs.order_by("price")
-    elif order == "price_desc":
-        qs = qs.order_by("-price")
-    else:
-        qs = qs.order_by("-created_at")
+    if order not in CATALOG_ORDERINGS:
+        order = "new"
+
+    return qs, order
+
+
+def product_list(request):
+    q = request.GET.get("q", "").strip()
+    # ✅ con búsqueda, por defecto se ordena por relevancia
+    order = request.GET.get("order") or ("relevance" if q else "new")
+    minp = request.GET.get("min", "").strip()
+    maxp = request.GET.get("max", "").strip()
+
+    # ✅ las reservas vencidas vuelven al stock sin esperar a un cron
+    schedule_hold_sweep()
+
+    qs, order = _catalog_queryset(q, minp, maxp, order)
+    # ✅ solo columnas del cursor: el HTML de cada tarjeta sale del cache
+    page = keyset_paginate(
+        qs.only("id", "created_at", "price"),
+        CATALOG_ORDERINGS[order],
+        cursor=request.GET.get("cursor", ""),
+        per_page=CATALOG_PAGE_SIZE,
+        tag=order,
+    )
+
+    cards = render_product_cards(
+        [p.id for p in page.object_list],
+        "list",
+        new_count=0 if page.has_prev else 6,
+    )
 
     cart = _get_cart(request)
     return render(request, "shop/product_list.html", {
-        "products": qs,
+        "cards": cards,
+        "page": page,
         "cart_count": _cart_count(cart),
         "q": q,
         "order": order,
@@ -106,6 +174,7 @@ def product_list(request):
 
 
 def product_detail(request, pk):
+    schedule_hold_sweep()
     product = get_object_or_404(Product, pk=pk, is_active=True)
     cart = _get_cart(request)
     return render(request, "shop/product_detail.html", {
@@ -163,14 +232,206 @@ def cart_clear(request):
     return redirect("cart_detail")
 
 
+# -------------------
+# Carrito (API JSON)
+# -------------------
+def _wants_json(request) -> bool:
+    return "application/json" in request.headers.get("Accept", "")
+
+
+def _cart_payload(cart, pid=None, message="", ok=True, **extra):
+    """Línea de ``pid`` + total + cantidad del carrito (precios desde los snapshots)."""
+    prices = {p.id: p.price for p in _cart_products(cart).values()}
+    total = sum((prices[int(k)] * int(q) for k, q in cart.items() if int(k) in prices), Decimal("0.00"))
+
+    line = None
+    if pid is not None and pid in prices and str(pid) in cart:
+        qty = int(cart[str(pid)])
+        subtotal = prices[pid] * qty
+        line = {
+            "qty": qty,
+            "price": str(prices[pid]),
+            "subtotal": str(subtotal),
+            "subtotal_display": formats.localize(subtotal),
+        }
+
+    return {
+        "ok": ok,
+        "message": message,
+        "product_id": pid,
+        "line": line,
+        "total": str(total),
+        # ✅ mismo formato que los templates (es: "15,00")
+        "total_display": formats.localize(total),
+        "cart_count": _cart_count(cart),
+        **extra,
+    }
+
+
+def _cart_api_update(request, pk: int, new_qty):
+    """
+    Aplica ``new_qty(cantidad_actual)`` a la línea ``pk`` (limitado al stock) y
+    responde JSON; sin JS (form normal) vuelve a la página anterior.
+    """
+    cart = _get_cart(request)
+    pid = str(pk)
+    current = int(cart.get(pid, 0))
+    want = max(0, new_qty(current))
+    status, ok, message = 200, True, ""
+
+    if want > current:
+        # solo hace falta el producto (stock) cuando la cantidad sube
+        product = Product.objects.filter(pk=pk, is_active=True).only("id", "name", "stock").first()
+        if product is None:
+            want, status, ok, message = 0, 404, False, "Producto no disponible."
+        elif product.stock <= 0:
+            want, status, ok, message = 0, 409, False, "Producto sin stock."
+        elif want > product.stock:
+            want, message = product.stock, f"Solo quedan {product.stock} unidades de {product.name}."
+        else:
+            message = f"✅ Agregado: {product.name}"
+
+    if want > 0:
+        cart[pid] = want
+    else:
+        cart.pop(pid, None)
+    _save_cart(request, cart)
+
+    if not _wants_json(request):
+        if message:
+            (messages.success if ok else messages.warning)(request, message)
+        return redirect(request.META.get("HTTP_REFERER") or "cart_detail")
+    return JsonResponse(_cart_payload(cart, pk, message, ok), status=status)
+
+
+@require_POST
+def cart_api_add(request, pk):
+    return _cart_api_update(request, pk, lambda qty: qty + 1)
+
+
+@require_POST
+def cart_api_decrease(request, pk):
+    return _cart_api_update(request, pk, lambda qty: qty - 1)
+
+
+@require_POST
+def cart_api_remove(request, pk):
+    return _cart_api_update(request, pk, lambda qty: 0)
+
+
+@require_POST
+def cart_api_set(request, pk):
+    try:
+        qty = int(request.POST.get("qty", ""))
+    except ValueError:
+        return JsonResponse({"ok": False, "message": "Cantidad inválida."}, status=400)
+    return _cart_api_update(request, pk, lambda _: qty)
+
+
+CART_BATCH_MAX_LINES = 200
+
+
+def _parse_cart_batch(request):
+    """
+    (mode, {product_id: qty}) desde JSON ``{"mode": "add"|"set", "items": [{"product_id", "qty"}]}``
+    o desde un form con ``product_id``/``qty`` repetidos. Lanza ValueError si algo no cuadra.
+    """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+            mode = data.get("mode", "add")
+            pairs = [(it["product_id"], it["qty"]) for it in data.get("items") or []]
+        except (ValueError, TypeError, KeyError, AttributeError):
+            raise ValueError("JSON inválido.")
+    else:
+        mode = request.POST.get("mode", "add")
+        pids, qtys = request.POST.getlist("product_id"), request.POST.getlist("qty")
+        if len(pids) != len(qtys):
+            raise ValueError("Cada producto necesita su cantidad.")
+        pairs = list(zip(pids, qtys))
+
+    if mode not in ("add", "set"):
+        raise ValueError("mode debe ser 'add' o 'set'.")
+    if not pairs:
+        raise ValueError("No hay productos.")
+    if len(pairs) > CART_BATCH_MAX_LINES:
+        raise ValueError(f"Máximo {CART_BATCH_MAX_LINES} productos por envío.")
+
+    lines = {}
+    for pid, qty in pairs:
+        try:
+            pid, qty = int(pid), int(qty)
+        except (TypeError, ValueError):
+            raise ValueError("Producto o cantidad inválidos.")
+        if qty < 0:
+            raise ValueError("La cantidad no puede ser negativa.")
+        # repetidos: en "add" se suman, en "set" gana el último
+        lines[pid] = lines.get(pid, 0) + qty if mode == "add" else qty
+    return mode, lines
+
+
+@require_POST
+def cart_api_batch(request):
+    """
+    Varias líneas en un solo envío (mayoristas). Se validan todas contra el stock
+    con una consulta ``id__in`` y se aplican juntas: si una falla, el carrito no cambia.
+    """
+    try:
+        mode, lines = _parse_cart_batch(request)
+    except ValueError as e:
+        if not _wants_json(request):
+            messages.warning(request, str(e))
+            return redirect(request.META.get("HTTP_REFERER") or "cart_detail")
+        return JsonResponse({"ok": False, "message": str(e)}, status=400)
+
+    cart = _get_cart(request)
+    products = Product.objects.filter(id__in=list(lines), is_active=True).only("id", "name", "stock")
+    by_id = {p.id: p for p in products}
+
+    new_cart = dict(cart)
+    errors = []
+    for pid, qty in lines.items():
+        target = int(cart.get(str(pid), 0)) + qty if mode == "add" else qty
+        p = by_id.get(pid)
+        if target > 0 and p is None:
+            errors.append({"product_id": pid, "message": "Producto no disponible.", "available": 0})
+        elif target > 0 and target > p.stock:
+            errors.append({
+                "product_id": pid,
+                "message": f"Solo quedan {p.stock} unidades de {p.name}.",
+                "available": p.stock,
+            })
+        elif target > 0:
+            new_cart[str(pid)] = target
+        else:
+            new_cart.pop(str(pid), None)
+
+    if errors:
+        message = "No se agregó nada: " + " ".join(e["message"] for e in errors)
+        if not _wants_json(request):
+            messages.warning(request, message)
+            return redirect(request.META.get("HTTP_REFERER") or "cart_detail")
+        return JsonResponse(_cart_payload(cart, message=message, ok=False, errors=errors), status=409)
+
+    _save_cart(request, new_cart)
+    message = f"✅ Carrito actualizado ({len(lines)} productos)."
+    if not _wants_json(request):
+        messages.success(request, message)
+        return redirect(request.META.get("HTTP_REFERER") or "cart_detail")
+    return JsonResponse(_cart_payload(new_cart, message=message))
+
+
+def _cart_products(cart) -> dict:
+    """{id: ProductSnapshot} activos del carrito (desde memoria; ver shop/snapshots.py)."""
+    return {pid: p for pid, p in get_snapshots(cart.keys()).items() if p.is_active}
+
+
 def cart_detail(request):
     cart = _get_cart(request)
-    ids = [int(i) for i in cart.keys()] if cart else []
-    products = Product.objects.filter(id__in=ids, is_active=True)
+    by_id = _cart_products(cart)
 
     items = []
     total = Decimal("0.00")
-    by_id = {p.id: p for p in products}
 
     for pid_str, qty in cart.items():
         pid = int(pid_str)
@@ -193,15 +454,31 @@ def cart_detail(request):
 # -------------------
 # ✅ Checkout (crea pedido y lo vincula si hay login)
 # -------------------
+def _redirect_to_placed_order(request, order):
+    """Reintento de un checkout ya procesado: mostrar el pedido existente."""
+    if order.user_id and order.user_id != request.user.id:
+        messages.error(request, "Este pedido no te pertenece o no está autorizado.")
+        return redirect("track_order")
+    _grant_order_access(request, order.code)
+    messages.info(request, f"Tu pedido {order.code} ya fue registrado.")
+    return redirect("order_detail_code", code=order.code)
+
+
 def checkout(request):
     cart = _get_cart(request)
+
+    # ✅ doble clic / reintento: antes de mirar el carrito (el primer envío ya lo vació)
+    if request.method == "POST":
+        token = request.POST.get("checkout_token", "").strip()
+        placed = find_placed_order(token) if len(token) == 32 else None
+        if placed is not None:
+            return _redirect_to_placed_order(request, placed)
+
     if not cart:
         messages.info(request, "Tu carrito está vacío.")
         return redirect("product_list")
 
-    ids = [int(i) for i in cart.keys()]
-    products = Product.objects.filter(id__in=ids, is_active=True)
-    by_id = {p.id: p for p in products}
+    by_id = _cart_products(cart)
 
     items = []
     total = Decimal("0.00")
@@ -221,39 +498,30 @@ def checkout(request):
     if request.method == "POST":
         form = CheckoutForm(request.POST)
         if form.is_valid():
-            order = form.save(commit=False)
-
-            # ✅ si está logueado, el pedido queda “de su cuenta”
-            if request.user.is_authenticated:
-                order.user = request.user
-
-            order.total = total
-            order.status = "new"
-            order.payment_status = getattr(order, "payment_status", "unpaid")  # por si existe
-            order.save()
-
-            for it in items:
-                p = it["product"]
-                q = int(it["qty"])
-                OrderItem.objects.create(
-                    order=order,
-                    product=p,
-                    qty=q,
-                    unit_price=p.price,
-                    subtotal=p.price * q,
+            # ✅ todo en una transacción: bloquea stock, descuenta y crea los items
+            try:
+                order, adjusted = place_order(
+                    form, cart, request.user, idempotency_key=form.cleaned_data.get("checkout_token")
                 )
+            except AlreadyPlaced as exc:
+                return _redirect_to_placed_order(request, exc.order)
+            except OutOfStock:
+                messages.error(request, "Lo sentimos, ya no hay stock de los productos de tu carrito.")
+                return redirect("cart_detail")
 
             _save_cart(request, {})
 
             # ✅ si es invitado, darle acceso por sesión al detalle (sin pedir code)
             _grant_order_access(request, order.code)
 
+            if adjusted:
+                messages.warning(request, "Algunas cantidades se ajustaron al stock disponible.")
             messages.success(request, f"✅ Pedido {order.code} creado.")
             return redirect("order_detail_code", code=order.code)
 
         messages.error(request, "Revisa los datos del formulario.")
     else:
-        form = CheckoutForm()
+        form = CheckoutForm(initial={"checkout_token": uuid.uuid4().hex})
 
     return render(request, "shop/checkout.html", {
         "form": form,
@@ -295,6 +563,57 @@ def order_detail_code(request, code):
     return order_detail(request, code)
 
 
+# -------------------
+# ✅ Estado del pedido en vivo (SSE)
+# -------------------
+SSE_RETRY_MS = 15000        # WSGI: el navegador vuelve a preguntar cada 15 s
+SSE_HEARTBEAT_SECONDS = 20  # comentario vacío para que proxies no corten la conexión
+
+
+def _sse(state: dict) -> str:
+    return f"event: order\ndata: {json.dumps(state)}\n\n"
+
+
+async def _order_event_stream(code: str, state: dict):
+    queue = await order_events_broker.subscribe(code, state)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + getattr(settings, "SHOP_EVENTS_STREAM_SECONDS", 600)
+    try:
+        yield "retry: 3000\n" + _sse(state)
+        while loop.time() < deadline:
+            try:
+                state = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield _sse(state)
+    finally:
+        # cliente desconectado o tiempo cumplido: el navegador se reconecta solo
+        order_events_broker.unsubscribe(code, queue)
+
+
+async def order_events(request, code: str):
+    order = await Order.objects.filter(code=code.upper().strip()).only("user", *STATE_FIELDS).afirst()
+    if order is None:
+        return JsonResponse({"ok": False, "msg": "Pedido no encontrado"}, status=404)
+    if not await sync_to_async(_can_view_order)(request, order):
+        return JsonResponse({"ok": False, "msg": "No autorizado"}, status=403)
+
+    state = order_state(order)
+    if "wsgi.input" in request.META:
+        # bajo WSGI no se retiene un worker: un evento y el navegador reintenta
+        response = HttpResponse(f"retry: {SSE_RETRY_MS}\n" + _sse(state), content_type="text/event-stream")
+    else:
+        response = StreamingHttpResponse(_order_event_stream(order.code, state), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# desde dónde puede subir comprobante el cliente: lo que puede pasar a revisión, o ya en revisión
+RECEIPT_PAYMENT_STATES = {*allowed_sources("payment_status", "pending_review"), "pending_review"}
+
+
 def upload_receipt(request, code: str):
     order = get_object_or_404(Order, code=code.upper().strip())
 
@@ -305,12 +624,30 @@ def upload_receipt(request, code: str):
     if request.method != "POST":
         return redirect("order_detail_code", code=order.code)
 
+    # ✅ un pedido pagado no vuelve a "en revisión" (mismas reglas que el admin)
+    if order.payment_status not in RECEIPT_PAYMENT_STATES:
+        messages.info(request, "Este pedido ya está pagado; no hace falta otro comprobante.")
+        return redirect("order_detail_code", code=order.code)
+
     form = ReceiptUploadForm(request.POST, request.FILES, instance=order)
     if form.is_valid():
         form.save()
-        order.payment_status = "pending_review"
         order.receipt_uploaded_at = timezone.now()
-        order.save(update_fields=["payment_status", "receipt_uploaded_at"])
+        order.receipt_thumb = None
+        order.receipt_processed_at = None
+        order.save(update_fields=["receipt_uploaded_at", "receipt_thumb", "receipt_processed_at"])
+        # con historial; si ya estaba en revisión (otro comprobante) o se pagó recién, no cambia
+        bulk_transition(
+            Order.objects.filter(pk=order.pk), "payment_status", "pending_review", user=request.user, source="cliente"
+        )
+
+        # ✅ mientras Daniela revisa el comprobante, el stock sigue apartado
+        extend_holds(order, review_ttl())
+        notify_order_changed()
+
+        # ✅ reducir / limpiar la imagen fuera de la request
+        if order.receipt_image:
+            run_in_background(process_receipt, order.id)
         messages.success(request, "✅ Comprobante subido. Queda en revisión.")
     else:
         messages.error(request, "No se pudo subir el comprobante. Intenta con otra imagen.")
@@ -321,16 +658,28 @@ def upload_receipt(request, code: str):
 # -------------------
 # ✅ Mis pedidos (panel por login)
 # -------------------
+MY_ORDERS_PAGE_SIZE = 10
+MY_ORDERS_ORDERING = ("-created_at", "-id")
+
+
 @login_required
 def my_orders(request):
+    # ✅ una consulta acotada: solo columnas del resumen, sin leer items
     orders = (
         Order.objects
         .filter(user=request.user)
-        .order_by("-created_at")
-        .prefetch_related("items", "items__product")
+        .only("id", "code", "created_at", "status", "payment_status", "total", "item_count", "first_product_name")
+    )
+    page = keyset_paginate(
+        orders,
+        MY_ORDERS_ORDERING,
+        cursor=request.GET.get("cursor", ""),
+        per_page=MY_ORDERS_PAGE_SIZE,
+        tag="orders",
     )
     return render(request, "shop/my_orders.html", {
-        "orders": orders,
+        "orders": page.object_list,
+        "page": page,
         "cart_count": _cart_count(_get_cart(request)),
         "daniela_wsp": DANIELA_WSP,
     })
@@ -348,8 +697,9 @@ def track_order(request):
 
     if request.method == "POST":
         code = request.POST.get("code", "").strip().upper()
-        wsp = request.POST.get("whatsapp", "").strip()
-        order = Order.objects.filter(code=code, whatsapp=wsp).first()
+        # ✅ "944 739 301", "+51944739301" y "944739301" son el mismo número
+        wsp = normalize_whatsapp(request.POST.get("whatsapp", ""))
+        order = Order.objects.filter(code=code, whatsapp_e164=wsp).first() if code and wsp else None
 
         if order:
             _grant_order_access(request, order.code)
@@ -367,10 +717,11 @@ def track_order(request):
 # Extras
 # -------------------
 def home(request):
+    schedule_hold_sweep()
     cart = _get_cart(request)
-    featured = Product.objects.filter(is_active=True).order_by("-created_at")[:6]
+    cards = render_product_cards(featured_product_ids(), "home", new_count=6)
     return render(request, "shop/home.html", {
-        "featured": featured,
+        "cards": cards,
         "cart_count": _cart_count(cart),
         "daniela_wsp": DANIELA_WSP,
     })
@@ -383,66 +734,6 @@ def contact(request):
     cart = _get_cart(request)
     return render(request, "shop/contact.html", {"cart_count": _cart_count(cart), "daniela_wsp": DANIELA_WSP})
 
-@require_POST
-def culqi_create_order(request, code: str):
-    """
-    Crea una ORDEN en Culqi para pagar con QR (billeteras).
-    Devuelve order_id y amount (en céntimos).
-    """
-    order = get_object_or_404(Order, code=code.upper().strip())
-
-    # Seguridad: respeta tu regla de acceso
-    if not _can_view_order(request, order):
-        return JsonResponse({"ok": False, "msg": "No autorizado"}, status=403)
-
-    # Culqi usa amount en céntimos
-    amount = int(Decimal(order.total) * 100)
-
-    # Datos cliente
-    full_name = (getattr(order, "full_name", "") or "").strip() or "Cliente"
-    parts = full_name.split(" ", 1)
-    first_name = parts[0][:50]
-    last_name = (parts[1] if len(parts) > 1 else "")[:50]
-
-    phone = (getattr(order, "whatsapp", "") or "").strip()
-    # Culqi suele esperar +51XXXXXXXXX
-    if phone and not phone.startswith("+"):
-        if phone.startswith("51"):
-            phone = "+" + phone
-        else:
-            phone = "+51" + phone
-
-    payload = {
-        "amount": amount,
-        "currency_code": "PEN",
-        "description": f"Pedido {order.code}",
-        "order_number": order.code,
-        "client_details": {
-            "first_name": first_name or "Cliente",
-            "last_name": last_name,
-            "email": "cliente@correo.com",   # si tienes order.email, reemplázalo aquí
-            "phone_number": phone or "+51999999999",
-        },
-        # Expira en 1 hora
-        "expiration_date": int(time.time()) + 3600,
-    }
-
-    r = requests.post(
-        "https://api.culqi.com/v2/orders",
-        json=payload,
-        headers={
-            "Authorization": f"Bearer {settings.CULQI_SECRET_KEY}",
-            "Content-Type": "application/json",
-        },
-        timeout=20,
-    )
-
-    data = r.json() if r.content else {}
-    if r.status_code >= 400:
-        return JsonResponse({"ok": False, "culqi": data}, status=400)
-
-    return JsonResponse({"ok": True, "order_id": data.get("id"), "amount": amount})
-
 def _basic_auth_ok(request) -> bool:
     """
     Si defines CULQI_WEBHOOK_USER y CULQI_WEBHOOK_PASS en env,
@@ -466,10 +757,33 @@ def _basic_auth_ok(request) -> bool:
         return False
 
 
+CULQI_DEAD_STATES = {"expired", "deleted", "canceled"}
+
+
+def _culqi_reuse_margin():
+    # no reutilizar una orden que vence antes de que el cliente alcance a pagar
+    return timedelta(seconds=getattr(settings, "CULQI_ORDER_REUSE_MARGIN", 300))
+
+
+def _reusable_culqi_order(order: Order, amount: int) -> bool:
+    """¿La orden Culqi guardada sigue sirviendo para este monto?"""
+    return bool(
+        order.culqi_order_id
+        and order.culqi_amount == amount
+        and order.culqi_expires_at
+        and order.culqi_expires_at > timezone.now() + _culqi_reuse_margin()
+        and order.culqi_last_state not in CULQI_DEAD_STATES
+    )
+
+
 @require_POST
 def culqi_create_order(request, code: str):
     """
-    Crea una ORDEN en Culqi y guarda culqi_order_id en tu Order.
+    Devuelve la ORDEN Culqi del pedido (order_id + amount en céntimos).
+
+    ✅ Reabrir el modal de pago no crea otra orden: si la guardada sigue vigente
+    y el monto es el mismo, se responde sin llamar a Culqi. Solo se crea una
+    nueva si venció, la anularon o cambió el total.
     """
     order = get_object_or_404(Order, code=code.upper().strip())
 
@@ -478,18 +792,18 @@ def culqi_create_order(request, code: str):
         return JsonResponse({"ok": False, "msg": "No autorizado"}, status=403)
 
     amount = int(Decimal(order.total) * 100)  # céntimos
+    if _reusable_culqi_order(order, amount):
+        # las reservas de stock ya cubren hasta culqi_expires_at (se extendieron al crearla)
+        return JsonResponse({"ok": True, "order_id": order.culqi_order_id, "amount": amount, "reused": True})
+
+    expires_at = extend_holds(order, hold_ttl())
 
     full_name = (order.full_name or "Cliente").strip()
     parts = full_name.split(" ", 1)
     first_name = (parts[0] if parts else "Cliente")[:50]
     last_name = (parts[1] if len(parts) > 1 else "")[:50]
 
-    phone = (order.whatsapp or "").strip()
-    if phone and not phone.startswith("+"):
-        if phone.startswith("51"):
-            phone = "+" + phone
-        else:
-            phone = "+51" + phone
+    phone = order.whatsapp_e164 or normalize_whatsapp(order.whatsapp)
 
     payload = {
         "amount": amount,
@@ -502,37 +816,39 @@ def culqi_create_order(request, code: str):
             "email": "cliente@correo.com",  # si luego agregas email al Order, lo pones aquí
             "phone_number": phone or "+51999999999",
         },
-        "expiration_date": int(time.time()) + 3600,  # 1 hora
+        # ✅ la orden Culqi vence junto con la reserva de stock
+        "expiration_date": int(expires_at.timestamp()),
     }
 
-    r = requests.post(
-        "https://api.culqi.com/v2/orders",
-        json=payload,
-        headers={
-            "Authorization": f"Bearer {settings.CULQI_SECRET_KEY}",
-            "Content-Type": "application/json",
-        },
-        timeout=20,
-    )
-
-    data = r.json() if r.content else {}
-    if r.status_code >= 400:
-        return JsonResponse({"ok": False, "culqi": data}, status=400)
+    # ✅ cliente compartido (keep-alive, timeouts cortos, circuit breaker)
+    try:
+        data = get_culqi_client().create_order(payload)
+    except CulqiUnavailable:
+        return JsonResponse(
+            {"ok": False, "msg": "El pago con Culqi no está disponible ahora. Intenta en unos minutos."},
+            status=503,
+        )
+    except CulqiError as exc:
+        return JsonResponse({"ok": False, "culqi": exc.data}, status=400)
 
     culqi_order_id = data.get("id")
     if culqi_order_id:
-        # Guardar el id Culqi para luego matchear webhook
-        if order.culqi_order_id != culqi_order_id:
-            order.culqi_order_id = culqi_order_id
-            order.save(update_fields=["culqi_order_id"])
+        # Guardar el id Culqi (para matchear el webhook) y con qué monto/vencimiento se creó
+        order.culqi_order_id = culqi_order_id
+        order.culqi_amount = amount
+        order.culqi_expires_at = expires_at
+        order.culqi_last_state = (data.get("state") or "pending")[:30]
+        order.save(update_fields=["culqi_order_id", "culqi_amount", "culqi_expires_at", "culqi_last_state"])
 
-    return JsonResponse({"ok": True, "order_id": culqi_order_id, "amount": amount})
+    return JsonResponse({"ok": True, "order_id": culqi_order_id, "amount": amount, "reused": False})
 
 
 @csrf_exempt
 def culqi_webhook(request):
     """
     Webhook: evento order.status.changed para marcar Order como pagado. :contentReference[oaicite:3]{index=3}
+
+    Solo se guarda en la bandeja (WebhookEvent); lo aplica shop/payments.py.
     """
     if request.method != "POST":
         return HttpResponse(status=405)
@@ -548,60 +864,13 @@ def culqi_webhook(request):
         return HttpResponse("Bad JSON", status=400)
 
     # Estructura típica: object=event, type=order.status.changed, data=... :contentReference[oaicite:4]{index=4}
-    event_type = evt.get("type") or ""
-    if event_type != "order.status.changed":
+    if not isinstance(evt, dict) or evt.get("type") != CULQI_ORDER_EVENT:
         # responder 200 para que Culqi no reintente por eventos que no nos importan
         return HttpResponse("ignored", status=200)
 
-    data = evt.get("data")
-
-    # A veces 'data' viene como string JSON (muchos plugins lo tratan así),
-    # y a veces como dict. Soportamos ambos.
-    if isinstance(data, str):
-        try:
-            data = json.loads(data)
-        except Exception:
-            data = {}
-
-    if not isinstance(data, dict):
-        data = {}
-
-    # estado de la orden (paid / expired / canceled / etc)
-    state = (data.get("state") or "").strip().lower()
-
-    # Identificadores posibles
-    culqi_order_id = (data.get("id") or "").strip()  # id de la orden Culqi
-    order_number = (data.get("order_number") or data.get("orderNumber") or "").strip()  # tu code si Culqi lo envía
-
-    order = None
-
-    # 1) Primero: buscar por culqi_order_id (lo guardamos al crear orden)
-    if culqi_order_id:
-        order = Order.objects.filter(culqi_order_id=culqi_order_id).first()
-
-    # 2) Si no encontró: buscar por code = order_number (si viene)
-    if not order and order_number:
-        order = Order.objects.filter(code=order_number.upper()).first()
-
-    if not order:
-        # No rompemos (Culqi reintenta si no respondes 200)
-        return HttpResponse("order_not_found", status=200)
-
-    # Guardamos último estado recibido
-    order.culqi_last_state = state
-    order.culqi_last_event_at = timezone.now()
-
-    # ✅ Si Culqi confirma pagado, marcamos pagado local
-    if state == "paid":
-        if order.payment_status != "paid":
-            order.payment_status = "paid"
-            order.paid_at = timezone.now()
-            # opcional: si quieres que el status cambie también:
-            # order.status = "confirmed"
-            order.save(update_fields=["payment_status", "paid_at", "culqi_last_state", "culqi_last_event_at"])
-        else:
-            order.save(update_fields=["culqi_last_state", "culqi_last_event_at"])
-    else:
-        order.save(update_fields=["culqi_last_state", "culqi_last_event_at"])
+    # ✅ 1 INSERT a la bandeja (los reintentos de Culqi se descartan solos) y 200 al toque;
+    # el pedido se actualiza en segundo plano por lotes (shop/payments.py)
+    record_culqi_event(request.body, evt)
+    kick_webhook_worker()
 
     return HttpResponse("ok", status=200)
\ No newline at end of file